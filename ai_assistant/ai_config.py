@@ -0,0 +1,84 @@
+"""
+AI 全局配置读取
+system_ai_config 由前端保存：经过驼峰转换中间件后键为下划线形式，早期数据可能是驼峰形式，读取时两者兼容。
+
+配置与模型（连同提供商）在进程内缓存，对话请求无需查询数据库：
+本进程内保存配置、修改提供商 / 模型时立即失效，其他进程最多在 AI_CONFIG_CACHE_TTL 秒后过期。
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from system_settings.models import AIModel, SystemSetting
+
+AI_CONFIG_KEY = 'system_ai_config'
+
+# 配置项 -> 早期数据中的驼峰键名
+_CAMEL_KEYS = {
+    'default_chat_model_id': 'defaultChatModelId',
+    'default_embedding_model_id': 'defaultEmbeddingModelId',
+    'default_rerank_model_id': 'defaultRerankModelId',
+}
+
+# 缓存键 -> (过期时间, 值)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class AIConfigError(Exception):
+    """AI 配置缺失或无效，message 可直接返回给前端"""
+
+
+def _cached(key, loader):
+    """读取缓存，过期或不存在时调用 loader 加载（值为 None 也缓存）"""
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+    value = loader()
+    with _cache_lock:
+        _cache[key] = (now + settings.AI_CONFIG_CACHE_TTL, value)
+    return value
+
+
+def invalidate_ai_config_cache():
+    """保存 AI 配置、修改提供商 / 模型后调用，清空当前进程的缓存"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def get_ai_config():
+    """读取 AI 全局配置，未配置时返回空字典（多个请求共用，只读）"""
+    def load():
+        config_obj = SystemSetting.objects.filter(key=AI_CONFIG_KEY).first()
+        return config_obj.value if config_obj is not None else {}
+
+    return _cached(('config',), load)
+
+
+def get_config_value(config, key):
+    """按下划线键读取配置，取不到再尝试驼峰键"""
+    return config.get(key) or config.get(_CAMEL_KEYS.get(key, key))
+
+
+def get_model(model_id):
+    """按 ID 获取模型（连同提供商），不存在时返回 None；返回的实例为多个请求共用，只读"""
+    return _cached(('model', model_id), lambda: AIModel.objects.select_related('provider').filter(id=model_id).first())
+
+
+def get_default_model(key, label):
+    """
+    获取配置的默认模型（连同提供商）
+    :param key: 配置项，如 default_embedding_model_id
+    :param label: 模型用途，用于错误提示，如“向量化”
+    :raises AIConfigError: 未配置或模型不存在
+    """
+    model_id = get_config_value(get_ai_config(), key)
+    if not model_id:
+        raise AIConfigError(f'系统未配置默认{label}模型')
+    ai_model = get_model(model_id)
+    if ai_model is None:
+        raise AIConfigError(f'配置的{label}模型不存在 (ID: {model_id})')
+    return ai_model
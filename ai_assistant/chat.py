@@ -0,0 +1,194 @@
+"""
+AI 对话
+准备请求（读取默认对话模型、按需检索知识库、拼接消息）与转发上游流式输出，供同步与异步两个对话视图共用。
+提交会话ID（或不提交 history 开始新会话）时历史由服务端保存，见 conversation.py。
+"""
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from utils.id_generator import generate_conversation_id
+from .ai_config import AIConfigError, get_default_model
+from .conversation import estimate_tokens, finish_turn, get_conversation, load_context, trim_history
+from .embeddings import EmbeddingError
+from .knowledge_base import KnowledgeBaseError, build_knowledge_prompt, retrieve_passages
+from .metrics import CANCELLED, CallTimer
+from .provider_client import (
+    aiter_sse_data, get_async_provider_client, get_provider_client, iter_sse_data, parse_chat_delta
+)
+
+SYSTEM_PROMPT = "你是“小橘文档”知识库助手。"
+
+# 对话接口路径，默认兼容 OpenAI 格式（Ollama 等特殊接口可能需要特殊处理）
+CHAT_COMPLETIONS_PATH = '/chat/completions'
+
+# 服务端分配的会话ID格式（见 generate_conversation_id）
+CONVERSATION_ID_RE = re.compile(r'^conv_[0-9A-Za-z]{10}$')
+
+
+class ChatRequestError(Exception):
+    """对话请求无法处理（如未配置默认对话模型），message 直接返回给前端"""
+
+
+def prepare_chat(data):
+    """
+    准备上游对话请求
+    :param data: 请求参数（已转为下划线形式）：message、conversation_id、history、use_knowledge_base
+        - 提交 conversation_id：历史（摘要 + 最近消息）从服务端会话读取；
+          会话尚未保存（此前各轮均失败）时按新会话处理
+        - 未提交 conversation_id 与 history：分配新会话ID，本轮成功后才创建会话（见 finish_turn）
+        - 只提交 history（旧版客户端）：不保存历史，按 token 预算截取最近的消息
+    :return: (ai_model, payload, conversation_id)，conversation_id 为 None 表示不保存历史
+    :raises ChatRequestError: 未配置默认对话模型、模型不存在或会话ID无效
+    """
+    message = data.get('message', '')
+    conversation_id = data.get('conversation_id')
+    use_kb = data.get('use_knowledge_base', False)
+
+    # 1. 获取系统默认对话模型（连同提供商，进程内缓存，不查询数据库）
+    try:
+        ai_model = get_default_model('default_chat_model_id', '对话')
+    except AIConfigError as e:
+        raise ChatRequestError(str(e))
+
+    # 2. 读取历史
+    budget = settings.AI_CHAT_HISTORY_TOKEN_BUDGET
+    summary = ''
+    history = []
+    if conversation_id:
+        conversation = get_conversation(conversation_id)
+        if conversation is not None:
+            summary = conversation.summary
+            history = load_context(conversation, budget)
+        elif not CONVERSATION_ID_RE.match(str(conversation_id)):
+            raise ChatRequestError('会话ID无效')
+    elif 'history' in data:
+        history = trim_history(data.get('history'), budget)
+    else:
+        conversation_id = generate_conversation_id()
+
+    # 3. 构建请求
+    system_prompt = SYSTEM_PROMPT
+    if summary:
+        system_prompt += f"\n\n以下是本次对话较早内容的摘要：\n{summary}"
+    if use_kb:
+        # 检索知识库，相关段落连同来源文章拼入系统提示词；检索不可用时降级为普通对话
+        try:
+            system_prompt += build_knowledge_prompt(retrieve_passages(message))
+        except (AIConfigError, EmbeddingError, KnowledgeBaseError) as e:
+            print(f"知识库检索失败: {str(e)}")
+            system_prompt += f" (已开启知识库模式，但检索暂不可用：{str(e)})"
+
+    # 构建 OpenAI 格式的消息列表
+    messages = [{'role': 'system', 'content': system_prompt}] + history + [{'role': 'user', 'content': message}]
+    payload = {
+        "model": ai_model.name,
+        "messages": messages,
+        "stream": True,
+        # 可以根据需要添加 temperature 等参数
+        # "temperature": 0.7
+    }
+    return ai_model, payload, conversation_id
+
+
+def _parse_content(data):
+    try:
+        # 兼容不同厂商的返回结构，大部分是 choices[0].delta.content
+        return parse_chat_delta(data)
+    except Exception as e:
+        print(f"Parse error: {e}, Line: {data}")
+        return ''
+
+
+def _user_message(payload):
+    """本轮提问（消息列表的最后一条）"""
+    return payload['messages'][-1]['content']
+
+
+def _finish_turn_in_thread(conversation_id, message, reply):
+    """在线程池中保存本轮对话，用完即关闭线程中的数据库连接"""
+    try:
+        finish_turn(conversation_id, message, reply)
+    finally:
+        connection.close()
+
+
+def stream_chat(ai_model, payload, conversation_id=None):
+    """
+    同步转发上游流式输出：复用连接池中的连接，连接失败 / 限流时自动重试，提供商故障时熔断
+    上游正常结束时把本轮提问与完整回复保存到会话（conversation_id 不为空时），出错或中断时不保存；每次调用记录耗时指标（见 metrics.py）
+    """
+    reply = []
+    timer = CallTimer(ai_model, 'chat')
+    error = CANCELLED
+    try:
+        response = get_provider_client(ai_model.provider).post(
+            CHAT_COMPLETIONS_PATH,
+            payload,
+            read_timeout=settings.AI_CHAT_READ_TIMEOUT,
+            stream=True
+        )
+        timer.connected(response.status_code)
+        if response.status_code != 200:
+            body = response.text
+            response.close()
+            error = None
+            yield f"Error: Upstream API {response.status_code} - {body}"
+            return
+
+        for data in iter_sse_data(response):
+            content = _parse_content(data)
+            if content:
+                timer.first_token()
+                reply.append(content)
+                yield content
+        reply = ''.join(reply)
+        timer.finish(output_tokens=estimate_tokens(reply))
+        if conversation_id:
+            finish_turn(conversation_id, _user_message(payload), reply)
+    except Exception as e:
+        error = type(e).__name__
+        yield f"Error: {str(e)}"
+    finally:
+        timer.finish(error)
+
+
+async def astream_chat(ai_model, payload, conversation_id=None):
+    """异步转发上游流式输出（ASGI 模式），等待上游数据时不占用线程"""
+    reply = []
+    timer = CallTimer(ai_model, 'chat')
+    error = CANCELLED
+    try:
+        response = await get_async_provider_client(ai_model.provider).post(
+            CHAT_COMPLETIONS_PATH,
+            payload,
+            read_timeout=settings.AI_CHAT_READ_TIMEOUT,
+            stream=True
+        )
+        timer.connected(response.status_code)
+        if response.status_code != 200:
+            body = (await response.aread()).decode('utf-8', errors='replace')
+            await response.aclose()
+            error = None
+            yield f"Error: Upstream API {response.status_code} - {body}"
+            return
+
+        async for data in aiter_sse_data(response):
+            content = _parse_content(data)
+            if content:
+                timer.first_token()
+                reply.append(content)
+                yield content
+        reply = ''.join(reply)
+        timer.finish(output_tokens=estimate_tokens(reply))
+        if conversation_id:
+            await sync_to_async(_finish_turn_in_thread, thread_sensitive=False)(
+                conversation_id, _user_message(payload), reply
+            )
+    except Exception as e:
+        error = type(e).__name__
+        yield f"Error: {str(e)}"
+    finally:
+        timer.finish(error)
@@ -0,0 +1,227 @@
+"""
+AI 对话会话
+服务端保存对话历史，客户端只需提交会话ID与新消息：
+- 发送给模型的历史按 token 预算（AI_CHAT_HISTORY_TOKEN_BUDGET）从最近的消息往前截取
+- 未压缩的历史超出预算后，由后台线程调用默认对话模型把较早的消息合并进滚动摘要，
+  只保留最近 AI_CHAT_RECENT_TOKENS 的原文；摘要随系统提示词发送
+token 数按字符估算，不依赖具体模型的分词器。
+"""
+import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .ai_config import AIConfigError, get_default_model
+from .lexical import CJK_CHARS
+from .metrics import CallTimer
+from .models import Conversation, ConversationMessage
+from .provider_client import get_provider_client
+
+# 每条消息的格式开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK_PATTERN = re.compile(f'[{CJK_CHARS}]')
+
+SUMMARY_PROMPT = (
+    "你负责压缩对话历史。请把“已有摘要”与“新增对话”合并为一份新的摘要，"
+    "保留用户的目标、偏好、已确认的事实与结论、尚未解决的问题，省略寒暄与重复内容，"
+    "使用简洁的中文条目，只输出摘要本身。"
+)
+
+_compact_executor = None
+_compact_pending = set()
+_compact_lock = threading.Lock()
+
+
+class ConversationError(Exception):
+    """会话摘要生成失败"""
+
+
+def estimate_tokens(text):
+    """估算 token 数：中日韩文字约每字 1 个，其余约每 4 个字符 1 个"""
+    text = text or ''
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def trim_history(history, budget):
+    """
+    按 token 预算保留最近的消息（客户端自行提交 history 时使用）
+    :param history: OpenAI 格式的消息列表
+    """
+    kept = []
+    used = 0
+    for message in reversed(history or []):
+        if not isinstance(message, dict):
+            continue
+        tokens = estimate_tokens(str(message.get('content') or '')) + MESSAGE_OVERHEAD_TOKENS
+        if used + tokens > budget:
+            break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+    return kept
+
+
+def get_conversation(conversation_id):
+    return Conversation.objects.filter(id=conversation_id).first()
+
+
+def load_context(conversation, budget):
+    """
+    会话上下文：摘要之后的消息中，在预算内的最近若干条
+    :return: [{'role': ..., 'content': ...}, ...]，按时间顺序
+    """
+    messages = ConversationMessage.objects.filter(
+        conversation=conversation, id__gt=conversation.summarized_until
+    ).order_by('-id').values('role', 'content', 'token_count')
+
+    kept = []
+    used = 0
+    for message in messages.iterator():
+        tokens = message['token_count'] + MESSAGE_OVERHEAD_TOKENS
+        if used + tokens > budget:
+            break
+        kept.append({'role': message['role'], 'content': message['content']})
+        used += tokens
+    kept.reverse()
+    return kept
+
+
+def append_message(conversation_id, role, content):
+    """追加一条消息"""
+    message = ConversationMessage.objects.create(
+        conversation_id=conversation_id,
+        role=role,
+        content=content,
+        token_count=estimate_tokens(content)
+    )
+    Conversation.objects.filter(id=conversation_id).update(updated_at=timezone.now())
+    return message
+
+
+def finish_turn(conversation_id, message, reply):
+    """
+    上游正常结束后一并保存本轮提问与助手回复（上游出错时整轮不保存，历史中不会留下没有回复的提问）；
+    新会话在首轮成功时才创建，失败的请求不会留下空会话；未压缩的历史超出预算时安排后台压缩
+    """
+    with transaction.atomic():
+        Conversation.objects.get_or_create(id=conversation_id)
+        append_message(conversation_id, 'user', message)
+        append_message(conversation_id, 'assistant', reply)
+    conversation = Conversation.objects.filter(id=conversation_id).only('summarized_until').first()
+    if conversation is None:
+        return
+    pending_tokens = ConversationMessage.objects.filter(
+        conversation_id=conversation_id, id__gt=conversation.summarized_until
+    ).aggregate(total=Sum('token_count'))['total'] or 0
+    if pending_tokens > settings.AI_CHAT_HISTORY_TOKEN_BUDGET:
+        schedule_compaction(conversation_id)
+
+
+def compact_conversation(conversation_id):
+    """
+    把较早的消息合并进滚动摘要，保留最近 AI_CHAT_RECENT_TOKENS 的原文
+    较早的消息过多时按 AI_CHAT_SUMMARY_INPUT_TOKENS 分段逐次合并
+    :return: 是否更新了摘要
+    :raises AIConfigError / ConversationError: 未配置对话模型或模型调用失败
+    """
+    conversation = get_conversation(conversation_id)
+    if conversation is None:
+        return False
+    messages = list(ConversationMessage.objects.filter(
+        conversation=conversation, id__gt=conversation.summarized_until
+    ).order_by('id').values('id', 'role', 'content', 'token_count'))
+
+    split = len(messages)
+    recent_tokens = 0
+    while split > 0 and recent_tokens + messages[split - 1]['token_count'] <= settings.AI_CHAT_RECENT_TOKENS:
+        split -= 1
+        recent_tokens += messages[split]['token_count']
+    older = messages[:split]
+    if not older:
+        return False
+
+    ai_model = get_default_model('default_chat_model_id', '对话')
+    summary = conversation.summary
+    segment = []
+    segment_tokens = 0
+    for message in older:
+        if segment and segment_tokens + message['token_count'] > settings.AI_CHAT_SUMMARY_INPUT_TOKENS:
+            summary = _summarize(ai_model, summary, segment)
+            segment, segment_tokens = [], 0
+        segment.append(message)
+        segment_tokens += message['token_count']
+    summary = _summarize(ai_model, summary, segment)
+
+    # 压缩期间其他进程已更新摘要时放弃本次结果
+    return Conversation.objects.filter(
+        id=conversation.id, summarized_until=conversation.summarized_until
+    ).update(summary=summary, summarized_until=older[-1]['id']) > 0
+
+
+def _summarize(ai_model, summary, messages):
+    """调用对话模型（非流式）合并摘要"""
+    dialogue = '\n'.join(
+        f"{'用户' if message['role'] == 'user' else '助手'}：{message['content']}" for message in messages
+    )
+    payload = {
+        "model": ai_model.name,
+        "messages": [
+            {'role': 'system', 'content': SUMMARY_PROMPT},
+            {'role': 'user', 'content': f"已有摘要：\n{summary or '（无）'}\n\n新增对话：\n{dialogue}"},
+        ],
+        "stream": False,
+        "max_tokens": settings.AI_CHAT_SUMMARY_MAX_TOKENS,
+    }
+    timer = CallTimer(ai_model, 'summary')
+    try:
+        response = get_provider_client(ai_model.provider).post(
+            '/chat/completions', payload, read_timeout=settings.AI_CHAT_READ_TIMEOUT
+        )
+    except requests.RequestException as e:
+        timer.finish(type(e).__name__)
+        raise ConversationError(f"摘要请求失败: {str(e)}")
+    timer.connected(response.status_code)
+    timer.finish()
+    if response.status_code != 200:
+        raise ConversationError(f"摘要接口返回 {response.status_code}: {response.text[:200]}")
+    try:
+        content = response.json()['choices'][0]['message']['content']
+    except (ValueError, KeyError, IndexError, TypeError):
+        raise ConversationError("摘要接口返回格式无法识别")
+    if not content or not content.strip():
+        raise ConversationError("摘要接口返回内容为空")
+    return content.strip()
+
+
+def _compact_in_worker(conversation_id):
+    """后台线程任务：线程中的数据库连接不会被请求结束信号关闭，用完即关"""
+    try:
+        compact_conversation(conversation_id)
+    except (AIConfigError, ConversationError) as e:
+        print(f"压缩对话历史失败: {conversation_id}: {str(e)}")
+    except Exception as e:
+        print(f"压缩对话历史异常: {conversation_id}: {str(e)}")
+    finally:
+        with _compact_lock:
+            _compact_pending.discard(conversation_id)
+        connection.close()
+
+
+def schedule_compaction(conversation_id):
+    """在后台压缩会话历史，同一会话已在排队时不重复提交"""
+    global _compact_executor
+    with _compact_lock:
+        if conversation_id in _compact_pending:
+            return
+        _compact_pending.add(conversation_id)
+        if _compact_executor is None:
+            _compact_executor = ThreadPoolExecutor(max_workers=settings.AI_CHAT_COMPACT_WORKERS)
+        _compact_executor.submit(_compact_in_worker, conversation_id)
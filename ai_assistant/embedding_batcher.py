@@ -0,0 +1,109 @@
+"""
+向量化请求合批
+索引任务、知识库检索、对话检索的向量化请求先进入按模型划分的队列，由调度线程在短窗口内
+（AI_EMBEDDING_BATCH_WINDOW_MS）收集，凑满 AI_EMBEDDING_BATCH_SIZE 条或窗口结束即合并为一次上游请求，
+结果按条分发回各调用方：
+- 同一批内相同的文本只提交一次（多个用户同时检索同一问题时共用结果）
+- 检索等交互请求优先于索引任务的批量请求组批，不会排在大量索引文本之后
+- 每个提供商同时进行的请求数不超过 AI_EMBEDDING_MAX_CONCURRENCY，超出时请求留在队列中继续合批
+调度线程与发送线程均在首次使用时创建（每个 worker 进程各自持有）。
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class ProviderSlots:
+    """单个提供商的并发上限：发送线程池与并发信号量"""
+
+    def __init__(self, max_concurrency):
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+
+class EmbeddingBatcher:
+    """
+    单个向量化模型的合批队列
+    :param send: 发送函数 send(texts) -> 与 texts 一一对应的向量列表，失败时抛出异常
+    :param slots: 所属提供商的 ProviderSlots（同一提供商的各模型共用）
+    :param batch_size: 每次上游请求的最多文本数
+    :param window: 收集窗口（秒）
+    """
+
+    def __init__(self, send, slots, batch_size, window):
+        self.send = send
+        self.slots = slots
+        self.batch_size = batch_size
+        self.window = window
+        self._urgent = deque()
+        self._bulk = deque()
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, name='embedding-batcher', daemon=True).start()
+
+    def submit(self, texts, bulk=False):
+        """
+        提交文本，立即返回
+        :param bulk: 是否为批量请求（索引任务），交互请求优先组批
+        :return: 与 texts 一一对应的 Future，结果为向量（list）
+        """
+        futures = [Future() for _ in texts]
+        with self._cond:
+            (self._bulk if bulk else self._urgent).extend(zip(texts, futures))
+            self._cond.notify()
+        return futures
+
+    def _pending(self):
+        return len(self._urgent) + len(self._bulk)
+
+    def _take_batch(self):
+        """取出一批：交互请求在前，相同文本不计入批大小"""
+        batch = {}
+        for queue in (self._urgent, self._bulk):
+            while queue and (len(batch) < self.batch_size or queue[0][0] in batch):
+                text, future = queue.popleft()
+                batch.setdefault(text, []).append(future)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending():
+                    self._cond.wait()
+            # 先占用并发名额再收集：提供商繁忙时请求继续在队列中合批
+            self.slots.semaphore.acquire()
+            with self._cond:
+                deadline = time.monotonic() + self.window
+                while self._pending() < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+            try:
+                self.slots.executor.submit(self._send_batch, batch)
+            except Exception:
+                self.slots.semaphore.release()
+                raise
+
+    def _send_batch(self, batch):
+        try:
+            texts = list(batch)
+            try:
+                vectors = self.send(texts)
+            except Exception as e:
+                for futures in batch.values():
+                    for future in futures:
+                        future.set_exception(e)
+                return
+            if len(vectors) != len(texts):
+                error = ValueError(f"向量数量不符: {len(vectors)} / {len(texts)}")
+                for futures in batch.values():
+                    for future in futures:
+                        future.set_exception(error)
+                return
+            for text, vector in zip(texts, vectors):
+                for future in batch[text]:
+                    future.set_result(vector)
+        finally:
+            self.slots.semaphore.release()
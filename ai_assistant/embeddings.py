@@ -0,0 +1,116 @@
+"""
+文本向量化
+调用提供商的 OpenAI 兼容接口 POST {base_url}/embeddings（经由提供商客户端复用连接），返回 float32 矩阵。
+各调用方的请求经 embedding_batcher 合批后发送，每个提供商的并发请求数受限。
+"""
+import threading
+
+import numpy as np
+import requests
+from django.conf import settings
+
+from .embedding_batcher import EmbeddingBatcher, ProviderSlots
+from .metrics import CallTimer
+from .provider_client import get_provider_client
+
+_batchers = {}
+_provider_slots = {}
+_batchers_lock = threading.Lock()
+
+
+class EmbeddingError(Exception):
+    """向量化接口调用失败"""
+
+
+def _request_embeddings(ai_model, texts):
+    """一次上游请求，返回与 texts 一一对应的向量"""
+    timer = CallTimer(ai_model, 'embedding')
+    try:
+        response = get_provider_client(ai_model.provider).post(
+            '/embeddings',
+            {"model": ai_model.name, "input": texts},
+            read_timeout=settings.AI_EMBEDDING_TIMEOUT
+        )
+    except requests.RequestException as e:
+        timer.finish(type(e).__name__)
+        raise EmbeddingError(f"向量化接口请求失败: {str(e)}")
+    timer.connected(response.status_code)
+    timer.finish()
+    if response.status_code != 200:
+        raise EmbeddingError(f"向量化接口返回 {response.status_code}: {response.text[:200]}")
+
+    try:
+        items = response.json().get('data') or []
+    except ValueError:
+        raise EmbeddingError("向量化接口返回格式无法识别")
+    if len(items) != len(texts):
+        raise EmbeddingError(f"向量化接口返回数量不符: {len(items)} / {len(texts)}")
+    # 按 index 排序，兼容不保证顺序的实现
+    items = sorted(items, key=lambda item: item.get('index', 0))
+    return [item['embedding'] for item in items]
+
+
+def _get_batcher(ai_model):
+    """按模型获取合批队列（同一提供商的各模型共用并发上限），提供商配置以最近一次提交的为准"""
+    key = (ai_model.provider_id, ai_model.name)
+    with _batchers_lock:
+        batcher = _batchers.get(key)
+        if batcher is None:
+            slots = _provider_slots.get(ai_model.provider_id)
+            if slots is None:
+                slots = _provider_slots[ai_model.provider_id] = ProviderSlots(settings.AI_EMBEDDING_MAX_CONCURRENCY)
+            batcher = _batchers[key] = EmbeddingBatcher(
+                lambda texts: _request_embeddings(batcher.ai_model, texts),
+                slots,
+                settings.AI_EMBEDDING_BATCH_SIZE,
+                settings.AI_EMBEDDING_BATCH_WINDOW_MS / 1000
+            )
+        batcher.ai_model = ai_model
+    return batcher
+
+
+def submit_texts(ai_model, texts, bulk=False):
+    """
+    提交向量化请求（与其他调用方合批），立即返回
+    :param ai_model: 向量化模型（AIModel，已关联 provider）
+    :param bulk: 是否为批量请求（索引任务），检索等交互请求优先发送
+    :return: 与 texts 一一对应的 Future，交给 collect_vectors 取结果
+    """
+    return _get_batcher(ai_model).submit(texts, bulk)
+
+
+def collect_vectors(futures):
+    """
+    等待 submit_texts 的结果
+    :return: float32 矩阵，形状为 (len(futures), 维度)
+    :raises EmbeddingError: 向量化接口调用失败
+    """
+    vectors = []
+    for future in futures:
+        try:
+            vectors.append(future.result())
+        except EmbeddingError:
+            raise
+        except Exception as e:
+            raise EmbeddingError(f"向量化接口返回格式无法识别: {str(e)}")
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def embed_texts(ai_model, texts, bulk=False):
+    """
+    批量向量化文本
+    :param ai_model: 向量化模型（AIModel，已关联 provider）
+    :param texts: 文本列表
+    :param bulk: 是否为批量请求（索引任务）
+    :return: float32 矩阵，形状为 (len(texts), 维度)
+    """
+    return collect_vectors(submit_texts(ai_model, texts, bulk))
+
+
+def normalize_rows(matrix):
+    """按行归一化为单位向量，余弦相似度即为点积（零向量保持为零）"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(np.float32, copy=False)
@@ -0,0 +1,93 @@
+"""
+IVF（倒排文件）近似最近邻索引
+用球面 k-means 将向量划分为 nlist 个簇，检索时只计算与查询最接近的 nprobe 个簇中的向量：
+- nlist 越大每个簇越小，检索越快，但相同 nprobe 下召回率越低
+- nprobe 越大召回率越高、越接近精确检索，检索耗时随之线性增加
+训练与分配均按块处理，数据文件以内存映射方式读取，内存占用与索引大小无关。
+"""
+import math
+
+import numpy as np
+
+# 分配簇时每次计算的行数
+ASSIGN_BLOCK_ROWS = 16384
+
+
+def default_nlist(count):
+    """簇数量默认取 4 * sqrt(N)（常用经验值）"""
+    return max(1, int(4 * math.sqrt(count)))
+
+
+def train_centroids(vectors, nlist, sample_size, iterations, seed=0):
+    """
+    在采样的向量上训练簇中心（向量已归一化，按点积分配，中心取均值后归一化）
+    :param vectors: (N, dim) 向量矩阵，可以是内存映射
+    :return: (nlist, dim) float32 簇中心
+    """
+    rng = np.random.default_rng(seed)
+    count = len(vectors)
+    nlist = min(nlist, count)
+    sample_size = min(count, max(sample_size, nlist))
+    if sample_size < count:
+        sample = np.asarray(vectors[np.sort(rng.choice(count, size=sample_size, replace=False))], dtype=np.float32)
+    else:
+        # 样本即全部向量：直接按块读取，不复制
+        sample = vectors
+
+    centroids = np.asarray(sample[rng.choice(len(sample), size=nlist, replace=False)], dtype=np.float32)
+    for _ in range(iterations):
+        sums, counts = _sum_clusters(sample, centroids)
+        # 空簇重新取一个随机样本作为中心
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+def _sum_clusters(vectors, centroids):
+    """
+    按块分配向量并累加各簇的向量和，额外内存只有一个块（不按簇重排整个样本）
+    :return: (sums, counts) 各簇的向量和 (nlist, dim) 与向量数 (nlist,)
+    """
+    nlist = len(centroids)
+    sums = np.zeros_like(centroids)
+    counts = np.zeros(nlist, dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        block_assign = np.argmax(block @ centroids.T, axis=1)
+        block_counts = np.bincount(block_assign, minlength=nlist)
+        non_empty = np.flatnonzero(block_counts)
+        starts = (np.cumsum(block_counts) - block_counts)[non_empty]
+        sums[non_empty] += np.add.reduceat(block[np.argsort(block_assign, kind='stable')], starts, axis=0)
+        counts += block_counts
+    return sums, counts
+
+
+def assign_clusters(vectors, centroids):
+    """每个向量所属的簇（与簇中心点积最大）"""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def build_inverted_lists(assign, nlist):
+    """
+    按簇排列的行号及各簇的起止位置
+    :return: (lists, offsets)，第 c 个簇的行号为 lists[offsets[c]:offsets[c + 1]]
+    """
+    lists = np.argsort(assign, kind='stable').astype(np.int64)
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+    return lists, offsets
+
+
+def probe_clusters(centroids, query_vector, nprobe):
+    """与查询最接近的 nprobe 个簇"""
+    nprobe = min(nprobe, len(centroids))
+    scores = centroids @ query_vector
+    return np.argpartition(-scores, nprobe - 1)[:nprobe]
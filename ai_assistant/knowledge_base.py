@@ -0,0 +1,481 @@
+"""
+知识库检索（RAG）
+- 建立索引：有效文章的正文按段落切块，调用默认向量化模型（defaultEmbeddingModelId）向量化后写入向量索引
+- 增量更新：文章新建 / 修改 / 删除后在后台同步，只有内容变化的文本块才重新向量化，
+  进度记录在 ArticleIndexState 中，进程重启后由 update_knowledge_index 命令或下一次文章变更继续
+- 检索：向量检索与 BM25 关键词检索（见 lexical.py）融合，可选交给重排模型一次性重排，
+  结果拼入系统提示词，要求回答时按编号引用来源文章
+"""
+import hashlib
+import re
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from article.models import Article
+from .ai_config import AIConfigError, get_ai_config, get_config_value, get_default_model
+from .embeddings import EmbeddingError, collect_vectors, embed_texts, normalize_rows, submit_texts
+from .lexical import bm25_search, create_chunk_terms, term_counts
+from .models import ArticleChunk, ArticleIndexState
+from .rerank import RerankError, rerank_documents
+from .vector_index import (
+    VectorIndexWriter, append_rows, delete_rows, get_vector_index, index_lock, needs_rewrite, read_meta
+)
+
+# 检索到的文本块
+Passage = namedtuple('Passage', ['article_id', 'title', 'content', 'score'])
+
+# 空行分隔段落
+_PARAGRAPH_SPLIT = re.compile(r'\n\s*\n')
+
+# 向量化时每批提交的文本块数量（按批写入索引文件）
+INDEX_BUILD_BATCH_SIZE = 256
+
+# 倒数排名融合的平滑常数（常用取值）
+RRF_K = 60
+
+
+class KnowledgeBaseError(Exception):
+    """知识库索引不可用"""
+
+
+def split_text(text, chunk_chars, overlap_chars):
+    """
+    按段落切分文本：相邻段落合并到不超过 chunk_chars，超长段落按长度切分，
+    相邻块之间保留 overlap_chars 的重叠，避免答案恰好被切断
+    """
+    chunks = []
+    current = ''
+    for paragraph in _PARAGRAPH_SPLIT.split(text or ''):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > chunk_chars:
+            chunks.append(current)
+            current = current[-overlap_chars:] if overlap_chars else ''
+        current = f'{current}\n\n{paragraph}' if current else paragraph
+        while len(current) > chunk_chars:
+            chunks.append(current[:chunk_chars])
+            current = current[chunk_chars - overlap_chars:]
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def embedding_input(title, content):
+    """文本块向量化时带上文章标题，补充段落缺失的上下文"""
+    return f'{title}\n{content}'
+
+
+def article_source_hash(article):
+    """文章当前内容（标题 + 正文）的哈希，文章无效时为空字符串"""
+    if not article.is_valid:
+        return ''
+    return hashlib.sha256(f'{article.title}\n{article.content}'.encode('utf-8')).hexdigest()
+
+
+def chunk_content_hash(title, content):
+    """文本块向量化输入的哈希，相同输入复用同一向量"""
+    return hashlib.sha256(embedding_input(title, content).encode('utf-8')).hexdigest()
+
+
+def split_article(article):
+    """
+    切分文章
+    :return: [(块序号, 文本, 内容哈希), ...]，文章无效时为空
+    """
+    if not article.is_valid:
+        return []
+    return [
+        (seq, content, chunk_content_hash(article.title, content))
+        for seq, content in enumerate(split_text(article.content, settings.AI_KB_CHUNK_CHARS,
+                                                 settings.AI_KB_CHUNK_OVERLAP))
+    ]
+
+
+def _vector_of(chunk):
+    return np.frombuffer(bytes(chunk.embedding), dtype=np.float32)
+
+
+def _embed_chunks(ai_model, chunks, titles):
+    """
+    为新文本块填充向量：内容哈希相同的已有文本块直接复用，其余批量调用向量化接口
+    :param chunks: 未保存的 ArticleChunk
+    :param titles: 与 chunks 一一对应的文章标题
+    """
+    hashes = {chunk.content_hash for chunk in chunks}
+    known = dict(
+        ArticleChunk.objects.filter(content_hash__in=hashes, model_id=ai_model.id)
+        .values_list('content_hash', 'embedding')
+    )
+    missing = [(chunk, title) for chunk, title in zip(chunks, titles) if chunk.content_hash not in known]
+    if missing:
+        vectors = normalize_rows(embed_texts(
+            ai_model, [embedding_input(title, chunk.content) for chunk, title in missing], bulk=True
+        ))
+        for (chunk, _), vector in zip(missing, vectors):
+            known[chunk.content_hash] = vector.tobytes()
+    for chunk in chunks:
+        chunk.embedding = bytes(known[chunk.content_hash])
+        chunk.model_id = ai_model.id
+    return len(missing)
+
+
+def _count_terms(chunks, titles):
+    """统计新文本块的词频（与向量化输入一致，含标题），填充 token_count"""
+    counts = [term_counts(embedding_input(title, chunk.content)) for chunk, title in zip(chunks, titles)]
+    for chunk, chunk_counts in zip(chunks, counts):
+        chunk.token_count = sum(chunk_counts.values())
+    return counts
+
+
+def rebuild_knowledge_index():
+    """
+    全量重建知识库索引：重新切分所有有效文章，内容未变的文本块复用已保存的向量，其余重新向量化，
+    发布新版本索引后删除旧文本块，并将所有文章标记为已索引
+    :return: 索引中的文本块数量
+    :raises AIConfigError / EmbeddingError: 未配置向量化模型或接口调用失败
+    """
+    ai_model = get_default_model('default_embedding_model_id', '向量化')
+    directory = settings.AI_KNOWLEDGE_INDEX_DIR
+
+    with index_lock(directory):
+        old_max_id = ArticleChunk.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        indexed_hashes = {}
+
+        writer = VectorIndexWriter(directory, ai_model.id)
+        try:
+            batch = []
+            articles = Article.objects.only('article_id', 'title', 'content', 'is_valid').order_by('article_id')
+            for article in articles.iterator():
+                indexed_hashes[article.article_id] = article_source_hash(article)
+                for seq, content, content_hash in split_article(article):
+                    chunk = ArticleChunk(article_id=article.article_id, seq=seq, content=content,
+                                         content_hash=content_hash)
+                    batch.append((chunk, article.title))
+                if len(batch) >= INDEX_BUILD_BATCH_SIZE:
+                    _index_batch(ai_model, writer, batch)
+                    batch = []
+            if batch:
+                _index_batch(ai_model, writer, batch)
+        except Exception:
+            writer.discard()
+            raise
+
+        # 新版本索引只引用新写入的文本块，发布后再删除旧块；重建期间旧索引仍可正常检索
+        count = writer.publish()['count']
+        ArticleChunk.objects.filter(id__lte=old_max_id).delete()
+        _mark_indexed(indexed_hashes)
+    return count
+
+
+def _index_batch(ai_model, writer, batch):
+    """向量化一批文本块，写入数据库（含关键词倒排表）与索引文件"""
+    chunks = [chunk for chunk, _ in batch]
+    titles = [title for _, title in batch]
+    _embed_chunks(ai_model, chunks, titles)
+    counts = _count_terms(chunks, titles)
+    first_row = writer.count
+    for row, chunk in enumerate(chunks, start=first_row):
+        chunk.index_row = row
+    chunks = ArticleChunk.objects.bulk_create(chunks)
+    create_chunk_terms(chunks, counts)
+    writer.append(np.stack([_vector_of(chunk) for chunk in chunks]), [chunk.id for chunk in chunks])
+
+
+def _mark_indexed(indexed_hashes):
+    """
+    重建完成后记录各文章已索引的内容哈希
+    重建期间被修改的文章 source_hash 已更新，与 indexed_hash 不同，仍会由增量同步处理
+    """
+    ArticleIndexState.objects.bulk_create(
+        [ArticleIndexState(article_id=article_id, source_hash=source_hash) for article_id, source_hash in
+         indexed_hashes.items()],
+        ignore_conflicts=True
+    )
+    ArticleIndexState.objects.bulk_update(
+        [ArticleIndexState(article_id=article_id, indexed_hash=source_hash) for article_id, source_hash in
+         indexed_hashes.items()],
+        ['indexed_hash'],
+        batch_size=INDEX_BUILD_BATCH_SIZE
+    )
+
+
+def mark_article_changed(article):
+    """记录文章的当前内容哈希，与已索引的内容不同时等待同步"""
+    ArticleIndexState.objects.update_or_create(
+        article_id=article.article_id,
+        defaults={'source_hash': article_source_hash(article)}
+    )
+
+
+def get_pending_states():
+    """内容与已索引内容不一致（含从未索引）的文章"""
+    return ArticleIndexState.objects.exclude(indexed_hash=F('source_hash'))
+
+
+def sync_knowledge_index():
+    """
+    增量同步待索引的文章，同步期间其他进程的同步请求直接返回，由持有锁的进程在结束后补做
+    :return: 重新向量化的文本块数量，索引正由其他进程更新时返回 None
+    :raises KnowledgeBaseError: 索引未建立或与当前向量化模型不一致（需执行 build_knowledge_index 重建）
+    :raises AIConfigError / EmbeddingError: 未配置向量化模型或接口调用失败
+    """
+    directory = settings.AI_KNOWLEDGE_INDEX_DIR
+    embedded = 0
+    while True:
+        with index_lock(directory, blocking=False) as acquired:
+            if not acquired:
+                return embedded or None
+            meta = read_meta(directory)
+            if meta is None:
+                raise KnowledgeBaseError('知识库索引尚未建立')
+            ai_model = get_default_model('default_embedding_model_id', '向量化')
+            if meta['model_id'] != ai_model.id:
+                raise KnowledgeBaseError('默认向量化模型已变更，知识库索引需要重建')
+
+            while True:
+                states = list(get_pending_states().select_related('article').order_by('updated_at')[
+                              :settings.AI_KB_INDEX_BATCH_ARTICLES])
+                if not states:
+                    break
+                embedded += _sync_batch(ai_model, directory, states)
+
+            _compact_if_needed(directory, ai_model)
+
+        # 持锁期间其他进程标记的文章可能因拿不到锁而未处理，释放锁后再确认一次
+        if not get_pending_states().exists():
+            return embedded
+
+
+def _sync_batch(ai_model, directory, states):
+    """
+    同步一批文章：哈希未变的文本块保留（只更新序号），其余新建或删除
+    新文本块的向量追加到索引末尾，删除的文本块在事务提交后标记为墓碑
+    :return: 调用向量化接口的文本块数量
+    """
+    existing = {}
+    for chunk in ArticleChunk.objects.filter(article_id__in=[state.article_id for state in states]).defer('content'):
+        existing.setdefault(chunk.article_id, []).append(chunk)
+
+    new_chunks, new_titles, moved_chunks, removed_chunks = [], [], [], []
+    for state in states:
+        article = state.article
+        reusable = {}
+        for chunk in existing.get(article.article_id, []):
+            if chunk.model_id == ai_model.id and chunk.index_row is not None:
+                reusable.setdefault(chunk.content_hash, []).append(chunk)
+            else:
+                removed_chunks.append(chunk)
+        for seq, content, content_hash in split_article(article):
+            if reusable.get(content_hash):
+                chunk = reusable[content_hash].pop()
+                if chunk.seq != seq:
+                    chunk.seq = seq
+                    moved_chunks.append(chunk)
+                continue
+            new_chunks.append(ArticleChunk(article_id=article.article_id, seq=seq, content=content,
+                                           content_hash=content_hash))
+            new_titles.append(article.title)
+        removed_chunks.extend(chunk for chunks in reusable.values() for chunk in chunks)
+
+    embedded = _embed_chunks(ai_model, new_chunks, new_titles) if new_chunks else 0
+    counts = _count_terms(new_chunks, new_titles)
+
+    appended = {}
+    try:
+        with transaction.atomic():
+            if new_chunks:
+                new_chunks = ArticleChunk.objects.bulk_create(new_chunks)
+                create_chunk_terms(new_chunks, counts)
+                first_row = append_rows(directory, np.stack([_vector_of(chunk) for chunk in new_chunks]),
+                                        [chunk.id for chunk in new_chunks])
+                for row, chunk in enumerate(new_chunks, start=first_row):
+                    chunk.index_row = row
+                    appended[row] = chunk.id
+                ArticleChunk.objects.bulk_update(new_chunks, ['index_row'])
+            if moved_chunks:
+                ArticleChunk.objects.bulk_update(moved_chunks, ['seq'])
+            if removed_chunks:
+                ArticleChunk.objects.filter(id__in=[chunk.id for chunk in removed_chunks]).delete()
+            for state in states:
+                # 同步期间文章再次被修改时 source_hash 已变化，保持待索引状态
+                ArticleIndexState.objects.filter(
+                    article_id=state.article_id, source_hash=state.source_hash
+                ).update(indexed_hash=state.source_hash)
+    except Exception:
+        # 事务回滚后已追加的行不再对应任何文本块
+        delete_rows(directory, appended)
+        raise
+
+    delete_rows(directory, {chunk.index_row: chunk.id for chunk in removed_chunks})
+    return embedded
+
+
+def _compact_if_needed(directory, ai_model):
+    """墓碑过多或近似索引需要重新训练时，按数据库中保存的向量重写索引（不调用向量化接口）"""
+    if not needs_rewrite(read_meta(directory)):
+        return
+
+    writer = VectorIndexWriter(directory, ai_model.id)
+    try:
+        chunks = ArticleChunk.objects.filter(model_id=ai_model.id, index_row__isnull=False).only(
+            'id', 'embedding', 'index_row').order_by('id')
+        batch = []
+        for chunk in chunks.iterator():
+            batch.append(chunk)
+            if len(batch) >= INDEX_BUILD_BATCH_SIZE:
+                _rewrite_batch(writer, batch)
+                batch = []
+        if batch:
+            _rewrite_batch(writer, batch)
+    except Exception:
+        writer.discard()
+        raise
+    writer.publish()
+
+
+def _rewrite_batch(writer, chunks):
+    first_row = writer.append(np.stack([_vector_of(chunk) for chunk in chunks]), [chunk.id for chunk in chunks])
+    for row, chunk in enumerate(chunks, start=first_row):
+        chunk.index_row = row
+    ArticleChunk.objects.bulk_update(chunks, ['index_row'])
+
+
+_sync_executor = None
+_sync_future = None
+_sync_lock = threading.Lock()
+
+
+def _sync_in_worker():
+    """后台线程任务：线程中的数据库连接不会被请求结束信号关闭，用完即关"""
+    try:
+        if read_meta(settings.AI_KNOWLEDGE_INDEX_DIR) is not None:
+            sync_knowledge_index()
+    except (AIConfigError, EmbeddingError, KnowledgeBaseError) as e:
+        print(f"同步知识库索引失败: {str(e)}")
+    except Exception as e:
+        print(f"同步知识库索引异常: {str(e)}")
+    finally:
+        connection.close()
+
+
+def schedule_article_index(article):
+    """
+    文章保存后调用：记录内容哈希，并在事务提交后由后台线程增量同步索引
+    内容未变（如只更新阅读次数、排序）时不触发同步；未完成的同步可由 update_knowledge_index 命令补齐
+    """
+    state = ArticleIndexState.objects.filter(article_id=article.article_id).only('source_hash').first()
+    if state is not None and state.source_hash == article_source_hash(article):
+        return
+    mark_article_changed(article)
+
+    def submit():
+        global _sync_executor, _sync_future
+        with _sync_lock:
+            if _sync_executor is None:
+                _sync_executor = ThreadPoolExecutor(max_workers=1)
+            # 已排队但尚未开始的同步会处理本次变更，无需重复提交
+            if _sync_future is not None and not _sync_future.running() and not _sync_future.done():
+                return
+            _sync_future = _sync_executor.submit(_sync_in_worker)
+
+    transaction.on_commit(submit)
+
+
+def fuse_rankings(*rankings):
+    """
+    倒数排名融合（RRF）：各路结果按名次计分 1 / (RRF_K + 名次) 后相加，不依赖各路得分的量纲
+    :param rankings: 每路为 [(文本块ID, 得分), ...]，按得分从高到低
+    :return: [(文本块ID, 融合得分), ...]，按融合得分从高到低
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (chunk_id, _) in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0) + 1 / (RRF_K + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def retrieve_passages(query, top_k=None):
+    """
+    混合检索与问题最相关的文本块：
+    1. 问题向量化（后台线程）的同时在当前线程做 BM25 关键词检索，两者并行
+    2. 向量检索与关键词检索各取 AI_KB_HYBRID_CANDIDATES 个候选，按倒数排名融合
+    3. 配置了默认重排模型（defaultRerankModelId）时，全部候选一次提交重排，取相关度最高的 top_k 个；
+       未配置或重排失败时按融合名次截取
+    :return: [Passage, ...]，按相关度从高到低，已过滤失效文章与向量相似度低于 AI_KB_MIN_SCORE 的结果
+    :raises KnowledgeBaseError: 索引未建立或与当前向量化模型不一致
+    :raises AIConfigError / EmbeddingError: 未配置向量化模型或接口调用失败
+    """
+    top_k = top_k or settings.AI_KB_TOP_K
+    candidate_count = max(settings.AI_KB_HYBRID_CANDIDATES, top_k)
+    ai_model = get_default_model('default_embedding_model_id', '向量化')
+    index = get_vector_index()
+    if index is None:
+        raise KnowledgeBaseError('知识库索引尚未建立')
+    if index.model_id != ai_model.id:
+        raise KnowledgeBaseError('默认向量化模型已变更，知识库索引需要重建')
+
+    # 问题向量化（合批发送）与关键词检索并行
+    query_futures = submit_texts(ai_model, [query])
+    lexical_hits = bm25_search(query, candidate_count)
+    query_vector = normalize_rows(collect_vectors(query_futures))[0]
+    vector_hits = [(chunk_id, score) for chunk_id, score in index.search(query_vector, candidate_count)
+                   if score >= settings.AI_KB_MIN_SCORE]
+
+    # 多取一些结果：索引中可能有已删除 / 失效文章的文本块，过滤后再截取
+    fused = fuse_rankings(vector_hits, lexical_hits)
+    chunks = ArticleChunk.objects.select_related('article').defer('embedding').filter(
+        id__in=[chunk_id for chunk_id, _ in fused],
+        article__is_valid=True
+    ).in_bulk()
+    candidates = [(chunks[chunk_id], score) for chunk_id, score in fused if chunk_id in chunks][:candidate_count]
+
+    reranked = _rerank_candidates(query, candidates, top_k)
+    if reranked is not None:
+        candidates = reranked
+    return [
+        Passage(chunk.article_id, chunk.article.title, chunk.content, score)
+        for chunk, score in candidates[:top_k]
+    ]
+
+
+def _rerank_candidates(query, candidates, top_k):
+    """
+    一次请求重排全部候选
+    :return: [(文本块, 相关度), ...]，未配置重排模型或重排失败时返回 None
+    """
+    if len(candidates) <= 1 or not get_config_value(get_ai_config(), 'default_rerank_model_id'):
+        return None
+    try:
+        rerank_model = get_default_model('default_rerank_model_id', '重排')
+        results = rerank_documents(
+            rerank_model, query,
+            [embedding_input(chunk.article.title, chunk.content) for chunk, _ in candidates],
+            top_k
+        )
+    except (AIConfigError, RerankError) as e:
+        print(f"知识库重排失败，使用融合排序: {str(e)}")
+        return None
+    return [(candidates[index][0], score) for index, score in results]
+
+
+def build_knowledge_prompt(passages):
+    """将检索结果拼入系统提示词，要求按编号引用来源"""
+    if not passages:
+        return "\n\n知识库中没有找到与问题相关的内容，请如实告知用户，不要编造知识库内容。"
+
+    references = '\n\n'.join(
+        f"[{number}] 《{passage.title}》(article_id: {passage.article_id})\n{passage.content}"
+        for number, passage in enumerate(passages, start=1)
+    )
+    return (
+        "\n\n请优先根据以下知识库资料回答问题。引用资料时在句末标注编号，如 [1]，"
+        "并在回答末尾列出引用文章的标题与 article_id；资料不足以回答时请说明。\n\n"
+        f"{references}"
+    )
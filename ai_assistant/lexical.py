@@ -0,0 +1,127 @@
+"""
+知识库关键词检索（BM25）
+- 分词：中日韩文字按相邻两字切分（二元分词，不依赖词典），其余文字按连续的字母数字切分并转为小写
+- 倒排表：文本块写入时同步写入 ArticleChunkTerm，随文本块一起增删
+- 检索：按文档频率从低到高取查询词的倒排记录（总量不超过 AI_KB_BM25_MAX_POSTINGS），以 BM25 计分
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Avg, Count
+
+from .models import ArticleChunk, ArticleChunkTerm
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 词的最大长度（与 ArticleChunkTerm.term 一致），超长的词截断
+MAX_TERM_LENGTH = 32
+
+# 倒排表分批写入数据库的数量
+TERM_INSERT_BATCH_SIZE = 1000
+
+# 语料统计（文本块数、平均词数）的缓存时间（秒）
+CORPUS_STATS_TTL = 60
+
+# 假名、CJK 统一表意文字（含扩展 A、兼容表意文字）、韩文音节
+CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+_TOKEN_PATTERN = re.compile(f'([{CJK_CHARS}]+)|([^\\W_{CJK_CHARS}]+)')
+
+
+def tokenize(text):
+    """切分为词列表"""
+    tokens = []
+    for cjk, word in _TOKEN_PATTERN.findall((text or '').lower()):
+        if word:
+            tokens.append(word[:MAX_TERM_LENGTH])
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def term_counts(text):
+    """词频统计"""
+    return Counter(tokenize(text))
+
+
+def create_chunk_terms(chunks, counts):
+    """
+    写入已保存文本块的倒排记录
+    :param counts: 与 chunks 一一对应的词频（term_counts 的结果）
+    """
+    ArticleChunkTerm.objects.bulk_create(
+        [ArticleChunkTerm(chunk_id=chunk.id, term=term, tf=tf)
+         for chunk, chunk_counts in zip(chunks, counts) for term, tf in chunk_counts.items()],
+        batch_size=TERM_INSERT_BATCH_SIZE
+    )
+
+
+_corpus_stats = None
+_corpus_stats_lock = threading.Lock()
+
+
+def _get_corpus_stats():
+    """文本块总数与平均词数（短时间缓存，避免每次检索扫描全表）"""
+    global _corpus_stats
+    with _corpus_stats_lock:
+        if _corpus_stats is None or _corpus_stats[0] <= time.monotonic():
+            stats = ArticleChunk.objects.filter(token_count__gt=0).aggregate(count=Count('id'), avg=Avg('token_count'))
+            _corpus_stats = (time.monotonic() + CORPUS_STATS_TTL, stats['count'], stats['avg'] or 1)
+        return _corpus_stats[1], _corpus_stats[2]
+
+
+def bm25_search(query, limit):
+    """
+    BM25 关键词检索
+    :return: [(文本块ID, 得分), ...]，按得分从高到低
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+    chunk_count, avg_length = _get_corpus_stats()
+    if not chunk_count:
+        return []
+
+    # 文档频率低的词区分度高，优先取；高频词的倒排记录多、得分贡献小，超出预算后舍弃
+    doc_freqs = dict(
+        ArticleChunkTerm.objects.filter(term__in=terms).values('term').annotate(df=Count('id')).values_list('term', 'df')
+    )
+    selected, postings_budget = [], settings.AI_KB_BM25_MAX_POSTINGS
+    for term in sorted(doc_freqs, key=doc_freqs.get):
+        if selected and doc_freqs[term] > postings_budget:
+            break
+        selected.append(term)
+        postings_budget -= doc_freqs[term]
+    if not selected:
+        return []
+
+    postings = list(
+        ArticleChunkTerm.objects.filter(term__in=selected).values_list('term', 'chunk_id', 'tf', 'chunk__token_count')
+    )
+    term_index = {term: i for i, term in enumerate(selected)}
+    idf = np.array([
+        math.log((chunk_count - doc_freqs[term] + 0.5) / (doc_freqs[term] + 0.5) + 1) for term in selected
+    ])
+    term_ids = np.array([term_index[term] for term, _, _, _ in postings])
+    chunk_ids = np.array([chunk_id for _, chunk_id, _, _ in postings])
+    tf = np.array([tf for _, _, tf, _ in postings], dtype=np.float64)
+    lengths = np.array([length for _, _, _, length in postings], dtype=np.float64)
+
+    term_scores = idf[term_ids] * tf * (BM25_K1 + 1) / (
+        tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length)
+    )
+    unique_ids, inverse = np.unique(chunk_ids, return_inverse=True)
+    scores = np.bincount(inverse, weights=term_scores)
+
+    limit = min(limit, len(scores))
+    top = np.argpartition(-scores, limit - 1)[:limit]
+    top = top[np.argsort(-scores[top])]
+    return [(int(unique_ids[i]), float(scores[i])) for i in top]
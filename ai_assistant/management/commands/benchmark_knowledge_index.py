@@ -0,0 +1,107 @@
+import math
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_assistant.vector_index import VectorIndex, VectorIndexWriter, get_vector_index
+
+# 拷贝 / 生成向量时每批写入的行数
+BENCHMARK_BATCH_ROWS = 16384
+
+
+class Command(BaseCommand):
+    """
+    知识库近似检索评估：对比 IVF 近似检索与精确检索的召回率与单次检索耗时
+    默认使用当前知识库索引中的向量（在临时目录建立近似索引，不影响线上索引），
+    查询取随机文本块的向量加少量噪声；也可用 --synthetic 生成聚簇分布的随机向量评估大规模场景。
+    """
+    help = '评估 IVF 近似检索在不同 nprobe 下的召回率与检索耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, default=0, help='生成指定数量的随机向量代替当前索引')
+        parser.add_argument('--dim', type=int, default=768, help='随机向量维度（配合 --synthetic）')
+        parser.add_argument('--queries', type=int, default=200, help='查询次数')
+        parser.add_argument('--top-k', type=int, default=10, help='计算召回率的结果数量')
+        parser.add_argument('--nlist', type=int, default=settings.AI_KB_IVF_NLIST,
+                            help='簇数量，0 表示按行数自动计算')
+        parser.add_argument('--nprobe', default='1,4,8,16,32,64,128', help='逗号分隔的 nprobe 取值')
+        parser.add_argument('--seed', type=int, default=0, help='随机种子')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        nprobes = sorted({int(value) for value in options['nprobe'].split(',') if value.strip()})
+
+        with tempfile.TemporaryDirectory(prefix='kb-bench-') as directory:
+            started_at = time.perf_counter()
+            writer = VectorIndexWriter(directory, 'benchmark', ann=True, nlist=options['nlist'] or None)
+            if options['synthetic']:
+                queries = self._write_synthetic(writer, options['synthetic'], options['dim'], options['queries'], rng)
+            else:
+                queries = self._copy_current(writer, options['queries'], rng)
+            meta = writer.publish()
+            index = VectorIndex.load(directory)
+            self.stdout.write(
+                f"{meta['count']} 个向量，维度 {meta['dim']}，{meta['ivf']['nlist']} 个簇，"
+                f"建立耗时 {time.perf_counter() - started_at:.1f}s"
+            )
+
+            exact_results, exact_latency = self._run(index, queries, options['top_k'], exact=True)
+            self.stdout.write(f"{'模式':<14}{'recall@' + str(options['top_k']):>12}{'p50(ms)':>10}{'p95(ms)':>10}")
+            self._report('exact', 1.0, exact_latency)
+            for nprobe in nprobes:
+                results, latency = self._run(index, queries, options['top_k'], nprobe=nprobe)
+                recall = np.mean([
+                    len(set(result) & set(expected)) / max(len(expected), 1)
+                    for result, expected in zip(results, exact_results)
+                ])
+                self._report(f'nprobe={nprobe}', recall, latency)
+            del index
+
+    def _copy_current(self, writer, query_count, rng):
+        """拷贝当前索引中的有效向量，查询取随机行加噪声"""
+        index = get_vector_index()
+        if index is None or len(index) == 0:
+            raise CommandError('知识库索引尚未建立，可使用 --synthetic 生成随机向量评估')
+        for start in range(0, len(index), BENCHMARK_BATCH_ROWS):
+            ids = np.asarray(index.ids[start:start + BENCHMARK_BATCH_ROWS])
+            live = ids >= 0
+            writer.append(np.asarray(index.vectors[start:start + BENCHMARK_BATCH_ROWS])[live], ids[live])
+        rows = rng.choice(len(index), size=query_count)
+        return _add_noise(np.asarray(index.vectors[np.sort(rows)]), rng)
+
+    def _write_synthetic(self, writer, count, dim, query_count, rng):
+        """生成聚簇分布的随机向量（接近真实文本向量的分布），查询取同分布的新向量"""
+        centers = _normalize(rng.standard_normal((max(1, int(math.sqrt(count))), dim)).astype(np.float32))
+        for start in range(0, count, BENCHMARK_BATCH_ROWS):
+            size = min(BENCHMARK_BATCH_ROWS, count - start)
+            vectors = _add_noise(centers[rng.integers(len(centers), size=size)], rng)
+            writer.append(vectors, np.arange(start, start + size))
+        return _add_noise(centers[rng.integers(len(centers), size=query_count)], rng)
+
+    @staticmethod
+    def _run(index, queries, top_k, **search_options):
+        results, latency = [], []
+        for query in queries:
+            started_at = time.perf_counter()
+            hits = index.search(query, top_k, **search_options)
+            latency.append((time.perf_counter() - started_at) * 1000)
+            results.append([chunk_id for chunk_id, _ in hits])
+        return results, np.array(latency)
+
+    def _report(self, label, recall, latency):
+        self.stdout.write(
+            f"{label:<14}{recall:>12.3f}{np.percentile(latency, 50):>10.2f}{np.percentile(latency, 95):>10.2f}"
+        )
+
+
+def _normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _add_noise(vectors, rng, scale=1.0):
+    """在单位向量上叠加各维独立的噪声后重新归一化"""
+    noise = rng.standard_normal(vectors.shape).astype(np.float32) * (scale / math.sqrt(vectors.shape[1]))
+    return _normalize(vectors + noise).astype(np.float32)
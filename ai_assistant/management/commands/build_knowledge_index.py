@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_assistant.ai_config import AIConfigError
+from ai_assistant.embeddings import EmbeddingError
+from ai_assistant.knowledge_base import KnowledgeBaseError, rebuild_knowledge_index, sync_knowledge_index
+
+
+class Command(BaseCommand):
+    """
+    重建 AI 知识库向量索引
+    首次启用知识库、更换默认向量化模型后需要执行；重建期间旧索引仍可正常检索，内容未变的文本块复用已保存的向量。
+    """
+    help = '切分所有有效文章并向量化，重建知识库检索索引'
+
+    def handle(self, *args, **options):
+        try:
+            count = rebuild_knowledge_index()
+            # 重建期间被修改的文章
+            sync_knowledge_index()
+        except (AIConfigError, EmbeddingError, KnowledgeBaseError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"知识库索引已重建，共 {count} 个文本块"))
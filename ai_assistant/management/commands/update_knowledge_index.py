@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_assistant.ai_config import AIConfigError
+from ai_assistant.embeddings import EmbeddingError
+from ai_assistant.knowledge_base import KnowledgeBaseError, get_pending_states, sync_knowledge_index
+
+
+class Command(BaseCommand):
+    """
+    增量同步 AI 知识库索引
+    文章变更后通常由后台线程自动同步；进程重启、向量化接口失败等原因遗留的待索引文章可由本命令补齐，可定时执行。
+    """
+    help = '只对内容有变化的文章重新切块并向量化，同步知识库检索索引'
+
+    def handle(self, *args, **options):
+        pending = get_pending_states().count()
+        try:
+            embedded = sync_knowledge_index()
+        except (AIConfigError, EmbeddingError, KnowledgeBaseError) as e:
+            raise CommandError(str(e))
+        if embedded is None:
+            self.stdout.write(self.style.WARNING("知识库索引正在由其他进程更新，稍后再试"))
+            return
+        self.stdout.write(self.style.SUCCESS(f"知识库索引已同步，处理 {pending} 篇文章，重新向量化 {embedded} 个文本块"))
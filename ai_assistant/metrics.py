@@ -0,0 +1,279 @@
+"""
+AI 调用指标
+记录每次调用上游模型（对话、向量化、重排、摘要）的耗时与结果，按提供商 / 模型 / 调用类型统计：
+- 连接耗时：发出请求到收到响应头（含重试；非流式调用此时已生成完毕）
+- 首字耗时（仅流式对话）、输出速度（token/秒，按首字之后的生成时间计算）、总耗时
+- 结果：HTTP 状态码或异常类名（如 ConnectTimeout、ProviderUnavailableError），客户端中途断开记为 Cancelled
+各进程在内存中按分钟汇总，耗时另记直方图以便合并多个进程的数据后估算分位数；
+已结束的分钟由后台线程每 AI_METRICS_FLUSH_INTERVAL 秒写入数据库（AICallStat），进程退出时写入全部汇总，
+写入失败时放回内存下次重试；数据库中保留 AI_METRICS_RETENTION_HOURS 小时。
+"""
+import atexit
+import bisect
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import AICallStat
+
+# 耗时直方图的分桶上界（毫秒），最后一个桶为超出上界的调用
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 15000, 30000, 60000)
+
+# 客户端中途断开（流式对话未读完）
+CANCELLED = 'Cancelled'
+
+_SUM_FIELDS = ('calls', 'errors', 'connect_count', 'connect_ms_total', 'ttft_count', 'ttft_ms_total',
+               'duration_ms_total', 'output_tokens', 'generation_ms_total')
+
+
+def _empty_stats():
+    stats = dict.fromkeys(_SUM_FIELDS, 0)
+    stats['outcomes'] = {}
+    stats['ttft_histogram'] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    stats['duration_histogram'] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    return stats
+
+
+def merge_stats(target, stats):
+    """把一份统计（内存中的分钟汇总或数据库行）累加到 target"""
+    for field in _SUM_FIELDS:
+        target[field] += stats[field]
+    for outcome, count in stats['outcomes'].items():
+        target['outcomes'][outcome] = target['outcomes'].get(outcome, 0) + count
+    for name in ('ttft_histogram', 'duration_histogram'):
+        target[name] = [a + b for a, b in zip(target[name], stats[name])]
+    return target
+
+
+def histogram_percentile(histogram, percentile):
+    """按直方图估算分位数（返回所在分桶的上界，毫秒），超出最大分桶时返回最大上界"""
+    total = sum(histogram)
+    if not total:
+        return None
+    threshold = total * percentile / 100
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= threshold:
+            return LATENCY_BUCKETS_MS[min(index, len(LATENCY_BUCKETS_MS) - 1)]
+    return LATENCY_BUCKETS_MS[-1]
+
+
+class CallMetrics:
+    """进程内的调用指标，按 (分钟, 提供商ID, 提供商名称, 模型, 调用类型) 汇总"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, status=None, error=None, connect_ms=None, ttft_ms=None, duration_ms=0,
+               output_tokens=0):
+        """
+        记录一次调用
+        :param key: (提供商ID, 提供商名称, 模型, 调用类型)
+        :param status: 上游 HTTP 状态码，未收到响应时为 None
+        :param error: 异常类名，成功时为 None；客户端中途断开（CANCELLED）不计为失败
+        """
+        outcome = error or str(status)
+        failed = error != CANCELLED and (error is not None or status is None or status >= 400)
+        bucket_start = timezone.now().replace(second=0, microsecond=0)
+        with self._lock:
+            stats = self._buckets.get((bucket_start,) + key)
+            if stats is None:
+                stats = self._buckets[(bucket_start,) + key] = _empty_stats()
+            stats['calls'] += 1
+            stats['errors'] += int(failed)
+            stats['outcomes'][outcome] = stats['outcomes'].get(outcome, 0) + 1
+            stats['duration_ms_total'] += duration_ms
+            stats['duration_histogram'][bisect.bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+            if connect_ms is not None:
+                stats['connect_count'] += 1
+                stats['connect_ms_total'] += connect_ms
+            if ttft_ms is not None:
+                stats['ttft_count'] += 1
+                stats['ttft_ms_total'] += ttft_ms
+                stats['ttft_histogram'][bisect.bisect_left(LATENCY_BUCKETS_MS, ttft_ms)] += 1
+                if output_tokens:
+                    stats['output_tokens'] += output_tokens
+                    stats['generation_ms_total'] += max(duration_ms - ttft_ms, 0)
+
+    def snapshot(self, since=None):
+        """当前进程中尚未写入数据库的汇总：[(分钟, 提供商ID, 提供商名称, 模型, 调用类型, 统计), ...]"""
+        with self._lock:
+            return [key + (merge_stats(_empty_stats(), stats),) for key, stats in self._buckets.items()
+                    if since is None or key[0] >= since]
+
+    def drain(self, before=None):
+        """取出 before 之前（已结束）的分钟汇总，before 为 None 时取出全部"""
+        with self._lock:
+            keys = [key for key in self._buckets if before is None or key[0] < before]
+            return [key + (self._buckets.pop(key),) for key in keys]
+
+    def restore(self, drained):
+        """写入数据库失败时放回取出的汇总（与此后新记录的同一分钟合并）"""
+        with self._lock:
+            for *key, stats in drained:
+                key = tuple(key)
+                if key in self._buckets:
+                    merge_stats(self._buckets[key], stats)
+                else:
+                    self._buckets[key] = stats
+
+
+_metrics = CallMetrics()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+class CallTimer:
+    """
+    单次上游调用计时，依次调用 connected()（收到响应头）、first_token()（流式首字）、finish()
+    :param ai_model: 调用的模型（AIModel，已关联 provider）
+    :param kind: 调用类型：chat / embedding / rerank / summary
+    """
+
+    def __init__(self, ai_model, kind):
+        self.key = (ai_model.provider_id, ai_model.provider.name, ai_model.name, kind)
+        self.started = time.monotonic()
+        self.status = None
+        self.connect_ms = None
+        self.ttft_ms = None
+        self.finished = False
+
+    def _elapsed_ms(self):
+        return (time.monotonic() - self.started) * 1000
+
+    def connected(self, status):
+        self.status = status
+        self.connect_ms = self._elapsed_ms()
+
+    def first_token(self):
+        if self.ttft_ms is None:
+            self.ttft_ms = self._elapsed_ms()
+
+    def finish(self, error=None, output_tokens=0):
+        """结束计时并记录（重复调用时忽略）"""
+        if self.finished:
+            return
+        self.finished = True
+        _metrics.record(
+            self.key,
+            status=self.status,
+            error=error,
+            connect_ms=self.connect_ms,
+            ttft_ms=self.ttft_ms,
+            duration_ms=self._elapsed_ms(),
+            output_tokens=output_tokens
+        )
+        _start_flusher()
+
+
+def flush_call_metrics(include_current=False):
+    """
+    把已结束的分钟汇总写入数据库，并清理保留期之前的记录；写入失败时汇总放回内存
+    :param include_current: 是否连同当前分钟一起写入（进程退出时）
+    """
+    now = timezone.now()
+    drained = _metrics.drain(None if include_current else now.replace(second=0, microsecond=0))
+    if drained:
+        try:
+            AICallStat.objects.bulk_create([
+                AICallStat(
+                    bucket_start=bucket_start,
+                    provider_id=provider_id,
+                    provider_name=provider_name,
+                    model_name=model_name,
+                    kind=kind,
+                    **stats
+                )
+                for bucket_start, provider_id, provider_name, model_name, kind, stats in drained
+            ])
+        except BaseException:
+            _metrics.restore(drained)
+            raise
+    AICallStat.objects.filter(bucket_start__lt=now - timedelta(hours=settings.AI_METRICS_RETENTION_HOURS)).delete()
+    return len(drained)
+
+
+def _run_flusher():
+    """后台线程：每 AI_METRICS_FLUSH_INTERVAL 秒写入一次，线程中的数据库连接不会被请求结束信号关闭，用完即关"""
+    while True:
+        time.sleep(settings.AI_METRICS_FLUSH_INTERVAL)
+        try:
+            flush_call_metrics()
+        except Exception as e:
+            print(f"写入 AI 调用指标失败: {str(e)}")
+        finally:
+            connection.close()
+
+
+def _flush_at_exit():
+    """进程退出时写入内存中的全部汇总"""
+    try:
+        flush_call_metrics(include_current=True)
+    except Exception as e:
+        print(f"写入 AI 调用指标失败: {str(e)}")
+
+
+def _start_flusher():
+    """首次记录时启动定时写入线程并注册退出时写入（每个 worker 进程各自持有）"""
+    global _flusher
+    with _flusher_lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_run_flusher, name='ai-metrics-flusher', daemon=True)
+        _flusher.start()
+        atexit.register(_flush_at_exit)
+
+
+def summarize_call_metrics(minutes):
+    """
+    最近 minutes 分钟的调用指标：数据库中各进程已写入的记录加上当前进程尚未写入的部分
+    （其他进程最近约 AI_METRICS_FLUSH_INTERVAL 秒的数据可能尚未写入）
+    :return: 按提供商 / 模型 / 调用类型汇总的列表，调用次数多的在前
+    """
+    since = timezone.now().replace(second=0, microsecond=0) - timedelta(minutes=minutes - 1)
+    rows = AICallStat.objects.filter(bucket_start__gte=since).values(
+        'provider_id', 'provider_name', 'model_name', 'kind', 'outcomes', 'ttft_histogram', 'duration_histogram',
+        *_SUM_FIELDS
+    )
+    totals = {}
+    for row in rows.iterator():
+        key = (row['provider_id'], row['model_name'], row['kind'])
+        entry = totals.setdefault(key, {'provider_name': row['provider_name'], 'stats': _empty_stats()})
+        merge_stats(entry['stats'], row)
+    for _, provider_id, provider_name, model_name, kind, stats in _metrics.snapshot(since):
+        entry = totals.setdefault((provider_id, model_name, kind), {'provider_name': provider_name,
+                                                                    'stats': _empty_stats()})
+        entry['provider_name'] = provider_name
+        merge_stats(entry['stats'], stats)
+
+    result = []
+    for (provider_id, model_name, kind), entry in totals.items():
+        stats = entry['stats']
+        calls = stats['calls']
+        result.append({
+            'provider_id': provider_id,
+            'provider_name': entry['provider_name'],
+            'model_name': model_name,
+            'kind': kind,
+            'calls': calls,
+            'errors': stats['errors'],
+            'error_rate': round(stats['errors'] / calls, 4) if calls else 0,
+            'outcomes': stats['outcomes'],
+            'avg_connect_ms': round(stats['connect_ms_total'] / stats['connect_count'], 1)
+            if stats['connect_count'] else None,
+            'avg_ttft_ms': round(stats['ttft_ms_total'] / stats['ttft_count'], 1) if stats['ttft_count'] else None,
+            'p50_ttft_ms': histogram_percentile(stats['ttft_histogram'], 50),
+            'p95_ttft_ms': histogram_percentile(stats['ttft_histogram'], 95),
+            'avg_duration_ms': round(stats['duration_ms_total'] / calls, 1) if calls else None,
+            'p50_duration_ms': histogram_percentile(stats['duration_histogram'], 50),
+            'p95_duration_ms': histogram_percentile(stats['duration_histogram'], 95),
+            'tokens_per_second': round(stats['output_tokens'] * 1000 / stats['generation_ms_total'], 1)
+            if stats['generation_ms_total'] else None,
+        })
+    return sorted(result, key=lambda item: item['calls'], reverse=True)
@@ -1,3 +1,157 @@
 from django.db import models
 
-# Create your models here.
+from article.models import Article
+from utils.id_generator import generate_conversation_id
+
+
+class ArticleChunk(models.Model):
+    """知识库文本块 - 文章正文按段落切分后的片段，连同其向量保存，向量索引中的每一行对应一个文本块"""
+
+    article = models.ForeignKey(Article, related_name='knowledge_chunks', on_delete=models.CASCADE,
+                                db_column='article_id', verbose_name='所属文章')
+    seq = models.IntegerField(verbose_name='块序号')
+    content = models.TextField(verbose_name='文本内容')
+
+    # 向量化输入（标题 + 正文）的哈希：内容未变的文本块直接复用已保存的向量，不再调用向量化接口
+    content_hash = models.CharField(max_length=64, db_index=True, verbose_name='内容哈希')
+    embedding = models.BinaryField(verbose_name='向量(float32，已归一化)')
+    model_id = models.CharField(max_length=40, verbose_name='向量化模型ID')
+    # 在向量索引中的行号，尚未写入索引时为空
+    index_row = models.IntegerField(null=True, blank=True, verbose_name='索引行号')
+    # 分词后的词数（BM25 长度归一化）
+    token_count = models.IntegerField(default=0, verbose_name='词数')
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        db_table = 'ai_article_chunk'
+        verbose_name = '知识库文本块'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['article', 'seq']),
+        ]
+
+    def __str__(self):
+        return f"{self.article_id}#{self.seq}"
+
+
+class ArticleChunkTerm(models.Model):
+    """知识库关键词倒排表 - 每个文本块中出现的词及词频，用于 BM25 关键词检索"""
+
+    chunk = models.ForeignKey(ArticleChunk, related_name='terms', on_delete=models.CASCADE, verbose_name='文本块')
+    term = models.CharField(max_length=32, db_index=True, verbose_name='词')
+    tf = models.IntegerField(verbose_name='词频')
+
+    class Meta:
+        db_table = 'ai_article_chunk_term'
+        verbose_name = '知识库关键词'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.term}@{self.chunk_id}"
+
+
+class ArticleIndexState(models.Model):
+    """
+    文章索引进度 - 记录文章当前内容与已写入知识库索引的内容是否一致
+    文章保存 / 删除时更新 source_hash，索引完成后 indexed_hash 与之相同；两者不同即待索引，进程重启后从这里继续
+    """
+
+    article = models.OneToOneField(Article, primary_key=True, related_name='index_state', on_delete=models.CASCADE,
+                                   db_column='article_id', verbose_name='文章')
+    # 标题 + 正文的哈希，文章已删除（无效）时为空字符串
+    source_hash = models.CharField(max_length=64, blank=True, default='', verbose_name='当前内容哈希')
+    indexed_hash = models.CharField(max_length=64, null=True, blank=True, verbose_name='已索引内容哈希')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'ai_article_index_state'
+        verbose_name = '文章索引进度'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.article_id} ({'已索引' if self.source_hash == self.indexed_hash else '待索引'})"
+
+
+class Conversation(models.Model):
+    """
+    AI 对话会话 - 服务端保存对话历史，客户端只需提交会话ID与新消息
+    较早的消息压缩为滚动摘要（summary），summarized_until 之后的消息保留原文
+    """
+
+    id = models.CharField(max_length=40, primary_key=True, default=generate_conversation_id, verbose_name='会话ID')
+    summary = models.TextField(blank=True, default='', verbose_name='历史摘要')
+    # 已压缩进摘要的最后一条消息ID，之后的消息保留原文
+    summarized_until = models.BigIntegerField(default=0, verbose_name='已摘要消息ID')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'ai_conversation'
+        verbose_name = 'AI对话会话'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return self.id
+
+
+class ConversationMessage(models.Model):
+    """AI 对话消息"""
+    ROLE_CHOICES = [
+        ('user', '用户'),
+        ('assistant', '助手'),
+    ]
+
+    conversation = models.ForeignKey(Conversation, related_name='messages', on_delete=models.CASCADE,
+                                     verbose_name='所属会话')
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES, verbose_name='角色')
+    content = models.TextField(verbose_name='消息内容')
+    # 估算的 token 数，按预算截取历史时使用
+    token_count = models.IntegerField(default=0, verbose_name='token数')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        db_table = 'ai_conversation_message'
+        verbose_name = 'AI对话消息'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['conversation', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.conversation_id}#{self.id} {self.role}"
+
+
+class AICallStat(models.Model):
+    """
+    AI 调用指标 - 每个进程每分钟按提供商 / 模型 / 调用类型汇总一行（见 metrics.py），超过保留期后删除
+    提供商以ID与名称记录，提供商删除后历史数据仍可查看
+    """
+
+    bucket_start = models.DateTimeField(db_index=True, verbose_name='统计分钟')
+    provider_id = models.CharField(max_length=40, verbose_name='提供商ID')
+    provider_name = models.CharField(max_length=50, verbose_name='提供商名称')
+    model_name = models.CharField(max_length=100, verbose_name='模型名称')
+    kind = models.CharField(max_length=20, verbose_name='调用类型')
+    calls = models.IntegerField(default=0, verbose_name='调用次数')
+    errors = models.IntegerField(default=0, verbose_name='失败次数')
+    # 结果分布：{HTTP 状态码或异常类名: 次数}
+    outcomes = models.JSONField(default=dict, verbose_name='结果分布')
+    connect_count = models.IntegerField(default=0, verbose_name='收到响应次数')
+    connect_ms_total = models.FloatField(default=0, verbose_name='连接耗时合计(毫秒)')
+    ttft_count = models.IntegerField(default=0, verbose_name='首字次数')
+    ttft_ms_total = models.FloatField(default=0, verbose_name='首字耗时合计(毫秒)')
+    duration_ms_total = models.FloatField(default=0, verbose_name='总耗时合计(毫秒)')
+    output_tokens = models.IntegerField(default=0, verbose_name='输出token数')
+    generation_ms_total = models.FloatField(default=0, verbose_name='生成耗时合计(毫秒)')
+    # 按 metrics.LATENCY_BUCKETS_MS 分桶的次数，合并后估算分位数
+    ttft_histogram = models.JSONField(default=list, verbose_name='首字耗时分布')
+    duration_histogram = models.JSONField(default=list, verbose_name='总耗时分布')
+
+    class Meta:
+        db_table = 'ai_call_stat'
+        verbose_name = 'AI调用指标'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.bucket_start} {self.provider_name}/{self.model_name} {self.kind}"
@@ -0,0 +1,349 @@
+"""
+AI 提供商 HTTP 客户端
+每个 worker 进程按 AIProvider.id 各持有一个客户端：
+- 持久会话与连接池，请求间复用 TCP / TLS 连接，省去每次对话的 DNS 解析与握手
+- 连接超时与读取超时分开设置，提供商无响应时不会长时间占用 worker
+- 连接失败、超时及 429 / 5xx 响应按指数退避（随机抖动）有限次重试；流式响应只在收到数据前重试
+- 熔断：连续失败达到 AI_PROVIDER_BREAKER_FAILURES 次后，AI_PROVIDER_BREAKER_RESET 秒内直接失败，
+  之后放行一次试探请求，成功则恢复
+提供商的地址 / 密钥修改后自动重建客户端。ASGI 模式下使用基于 httpx 的异步客户端，策略相同。
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# 可重试的响应状态码
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# 流式响应读取块大小
+STREAM_CHUNK_SIZE = 1024
+
+
+class ProviderUnavailableError(requests.RequestException):
+    """提供商已熔断或重试后仍不可用"""
+
+
+class CircuitBreaker:
+    """
+    熔断器（线程安全）
+    :param failure_threshold: 连续失败多少次后熔断
+    :param reset_timeout: 熔断持续时间（秒），之后放行一次试探请求
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """是否放行请求：未熔断时放行；熔断超时后只放行一个试探请求"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """请求被取消（未得到结果）：不计成功或失败，试探请求的名额交给下一个请求"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, response=None, error=None):
+        """
+        按请求结果记录：429 / 5xx 响应与异常计为失败，取消（非 Exception 的 BaseException）只释放试探名额
+        每个经 allow() 放行的请求都须调用一次，否则试探请求失败后熔断器会一直拒绝请求
+        """
+        if error is not None and not isinstance(error, Exception):
+            self.release()
+        elif error is not None or response.status_code in RETRY_STATUS_CODES:
+            self.record_failure()
+        else:
+            self.record_success()
+
+
+class ProviderClient:
+    """单个提供商的客户端"""
+
+    def __init__(self, provider):
+        self.provider_id = provider.id
+        self.name = provider.name
+        self.base_url = provider.base_url.rstrip('/')
+        self.fingerprint = provider_fingerprint(provider)
+        self.breaker = get_circuit_breaker(provider)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.AI_PROVIDER_POOL_SIZE, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {provider.api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def post(self, path, payload, read_timeout, stream=False):
+        """
+        发送请求，失败时按退避策略重试
+        :param path: 接口路径，如 /embeddings
+        :param read_timeout: 读取超时（秒），流式响应为两次数据之间的最长等待
+        :return: requests.Response（重试后仍为 429 / 5xx 时返回最后一次响应，由调用方处理）
+        :raises ProviderUnavailableError: 已熔断
+        :raises requests.RequestException: 重试后仍连接失败或超时
+        """
+        if not self.breaker.allow():
+            raise ProviderUnavailableError(f"AI 提供商 {self.name} 暂时不可用（已熔断），请稍后再试")
+        try:
+            response = self._post_with_retries(path, payload, read_timeout, stream)
+        except BaseException as e:
+            self.breaker.record(error=e)
+            raise
+        self.breaker.record(response)
+        return response
+
+    def _post_with_retries(self, path, payload, read_timeout, stream):
+        url = f"{self.base_url}{path}"
+        max_retries = settings.AI_PROVIDER_MAX_RETRIES
+        for attempt in range(max_retries + 1):
+            retry_after = None
+            try:
+                response = self.session.post(
+                    url,
+                    json=payload,
+                    stream=stream,
+                    timeout=(settings.AI_PROVIDER_CONNECT_TIMEOUT, read_timeout)
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                    return response
+                retry_after = _retry_after_seconds(response)
+                response.close()
+            time.sleep(retry_after if retry_after is not None else _backoff_seconds(attempt))
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncProviderClient:
+    """
+    单个提供商的异步客户端（ASGI 模式下使用，需安装 httpx）
+    连接池、超时、重试与熔断策略与 ProviderClient 一致，熔断状态两者共用；
+    httpx 客户端绑定创建它的事件循环，每个事件循环各持有一个
+    """
+
+    def __init__(self, provider):
+        import httpx
+
+        self.provider_id = provider.id
+        self.name = provider.name
+        self.base_url = provider.base_url.rstrip('/')
+        self.fingerprint = provider_fingerprint(provider)
+        self.breaker = get_circuit_breaker(provider)
+        self.client = httpx.AsyncClient(
+            headers={
+                "Authorization": f"Bearer {provider.api_key}",
+                "Content-Type": "application/json"
+            },
+            limits=httpx.Limits(
+                max_connections=settings.AI_PROVIDER_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.AI_PROVIDER_POOL_SIZE
+            )
+        )
+
+    async def post(self, path, payload, read_timeout, stream=False):
+        """
+        发送请求，失败时按退避策略重试；stream=True 时调用方读取完毕后需 await response.aclose()
+        :return: httpx.Response（重试后仍为 429 / 5xx 时返回最后一次响应，由调用方处理）
+        :raises ProviderUnavailableError: 已熔断
+        :raises httpx.HTTPError: 重试后仍连接失败或超时
+        """
+        if not self.breaker.allow():
+            raise ProviderUnavailableError(f"AI 提供商 {self.name} 暂时不可用（已熔断），请稍后再试")
+        try:
+            response = await self._post_with_retries(path, payload, read_timeout, stream)
+        except BaseException as e:
+            self.breaker.record(error=e)
+            raise
+        self.breaker.record(response)
+        return response
+
+    async def _post_with_retries(self, path, payload, read_timeout, stream):
+        import httpx
+
+        connect_timeout = settings.AI_PROVIDER_CONNECT_TIMEOUT
+        timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=read_timeout, pool=connect_timeout)
+        max_retries = settings.AI_PROVIDER_MAX_RETRIES
+        for attempt in range(max_retries + 1):
+            retry_after = None
+            try:
+                request = self.client.build_request('POST', f"{self.base_url}{path}", json=payload, timeout=timeout)
+                response = await self.client.send(request, stream=stream)
+            except (httpx.TransportError, httpx.TimeoutException):
+                if attempt >= max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                    return response
+                retry_after = _retry_after_seconds(response)
+                await response.aclose()
+            await asyncio.sleep(retry_after if retry_after is not None else _backoff_seconds(attempt))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def _backoff_seconds(attempt):
+    """指数退避 + 完全随机抖动，避免多个 worker 同时重试"""
+    return random.uniform(0, min(settings.AI_PROVIDER_RETRY_MAX_BACKOFF,
+                                 settings.AI_PROVIDER_RETRY_BACKOFF * (2 ** attempt)))
+
+
+def _retry_after_seconds(response):
+    """429 / 503 响应的 Retry-After（秒），不超过最长退避时间"""
+    try:
+        return min(float(response.headers['Retry-After']), settings.AI_PROVIDER_RETRY_MAX_BACKOFF)
+    except (KeyError, ValueError):
+        return None
+
+
+def provider_fingerprint(provider):
+    """提供商的连接配置，变化时重建客户端"""
+    return provider.base_url, provider.api_key, provider.updated_at
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# 事件循环 -> {提供商ID: 异步客户端}，事件循环结束后自动释放
+_async_clients = weakref.WeakKeyDictionary()
+
+# 提供商ID -> (连接配置, 熔断器)，同步与异步客户端共用
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider):
+    """获取提供商的熔断器，连接配置变化后重新计数"""
+    with _breakers_lock:
+        fingerprint, breaker = _breakers.get(provider.id, (None, None))
+        if breaker is None or fingerprint != provider_fingerprint(provider):
+            breaker = CircuitBreaker(settings.AI_PROVIDER_BREAKER_FAILURES, settings.AI_PROVIDER_BREAKER_RESET)
+            _breakers[provider.id] = (provider_fingerprint(provider), breaker)
+        return breaker
+
+
+def get_provider_client(provider):
+    """获取提供商的客户端（当前进程内复用），配置已修改时重建"""
+    with _clients_lock:
+        client = _clients.get(provider.id)
+        if client is not None and client.fingerprint == provider_fingerprint(provider):
+            return client
+        if client is not None:
+            client.close()
+        client = ProviderClient(provider)
+        _clients[provider.id] = client
+        return client
+
+
+def get_async_provider_client(provider):
+    """获取提供商在当前事件循环中的异步客户端，配置已修改时重建（须在事件循环中调用）"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(provider.id)
+        if client is not None and client.fingerprint == provider_fingerprint(provider):
+            return client
+        if client is not None:
+            loop.create_task(client.aclose())
+        client = AsyncProviderClient(provider)
+        clients[provider.id] = client
+        return client
+
+
+def invalidate_provider_client(provider_id):
+    """
+    提供商修改 / 删除后关闭当前进程中的客户端，下次使用时按新配置重建
+    异步客户端无法在其他线程中关闭，只从注册表移除，由垃圾回收释放连接
+    """
+    with _clients_lock:
+        client = _clients.pop(provider_id, None)
+        for clients in list(_async_clients.values()):
+            clients.pop(provider_id, None)
+    with _breakers_lock:
+        _breakers.pop(provider_id, None)
+    if client is not None:
+        client.close()
+
+
+def iter_sse_data(response):
+    """
+    逐条读取流式响应（Server-Sent Events）的 data 内容，到 [DONE] 为止
+    结束后读完剩余内容再关闭，连接可回到连接池复用
+    """
+    try:
+        for line in response.iter_lines(chunk_size=STREAM_CHUNK_SIZE):
+            if not line:
+                continue
+            line = line.decode('utf-8')
+            if not line.startswith('data: '):
+                continue
+            data = line[6:]
+            if data.strip() == '[DONE]':
+                for _ in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    pass
+                break
+            yield data
+    finally:
+        response.close()
+
+
+async def aiter_sse_data(response):
+    """iter_sse_data 的异步版本（httpx 流式响应），结束后关闭响应"""
+    done = False
+    try:
+        async for line in response.aiter_lines():
+            # [DONE] 之后继续读到响应结束，连接才能回到连接池
+            if done or not line.startswith('data: '):
+                continue
+            data = line[6:]
+            if data.strip() == '[DONE]':
+                done = True
+                continue
+            yield data
+    finally:
+        await response.aclose()
+
+
+def parse_chat_delta(data):
+    """从流式对话响应的一条 data 中取出增量文本，兼容不同厂商的返回结构"""
+    return json.loads(data)['choices'][0].get('delta', {}).get('content', '')
@@ -0,0 +1,48 @@
+"""
+检索结果重排
+调用提供商的重排接口 POST {base_url}/rerank（Jina / Cohere / 硅基流动等通用格式），
+一次请求提交全部候选文本，返回按相关度排序的结果。
+"""
+import requests
+from django.conf import settings
+
+from .metrics import CallTimer
+from .provider_client import get_provider_client
+
+
+class RerankError(Exception):
+    """重排接口调用失败"""
+
+
+def rerank_documents(ai_model, query, documents, top_n):
+    """
+    批量重排
+    :param ai_model: 重排模型（AIModel，已关联 provider）
+    :param documents: 候选文本列表
+    :return: [(候选下标, 相关度), ...]，按相关度从高到低，最多 top_n 个
+    """
+    timer = CallTimer(ai_model, 'rerank')
+    try:
+        response = get_provider_client(ai_model.provider).post(
+            '/rerank',
+            {"model": ai_model.name, "query": query, "documents": documents, "top_n": top_n,
+             "return_documents": False},
+            read_timeout=settings.AI_RERANK_TIMEOUT
+        )
+    except requests.RequestException as e:
+        timer.finish(type(e).__name__)
+        raise RerankError(f"重排接口请求失败: {str(e)}")
+    timer.connected(response.status_code)
+    timer.finish()
+    if response.status_code != 200:
+        raise RerankError(f"重排接口返回 {response.status_code}: {response.text[:200]}")
+
+    # 响应体不是 JSON 对象（如网关返回的 HTML 错误页）时同样视为格式错误
+    try:
+        body = response.json()
+        items = body.get('results') or body.get('data') or []
+        results = [(int(item['index']), float(item['relevance_score'])) for item in items]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise RerankError("重排接口返回格式无法识别")
+    results = [(index, score) for index, score in results if 0 <= index < len(documents)]
+    return sorted(results, key=lambda result: result[1], reverse=True)[:top_n]
@@ -1,3 +1,559 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import threading
+from functools import partial
+from types import SimpleNamespace
+from unittest import mock, skipIf
 
-# Create your tests here.
+import numpy as np
+import requests
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from asgiref.sync import sync_to_async
+from django.urls import path
+from django.utils import timezone
+
+from article.models import Article
+from system_settings.models import AIModel, AIProvider, SystemSetting
+from .ai_config import AI_CONFIG_KEY, get_default_model, invalidate_ai_config_cache
+from .chat import prepare_chat
+from .embedding_batcher import EmbeddingBatcher, ProviderSlots
+from .embeddings import EmbeddingError, collect_vectors
+from .ivf import train_centroids
+from .knowledge_base import get_pending_states, rebuild_knowledge_index, schedule_article_index, sync_knowledge_index
+from .lexical import bm25_search, create_chunk_terms, term_counts, tokenize
+from .metrics import CallMetrics, flush_call_metrics
+from .models import AICallStat, ArticleChunk, Conversation, ConversationMessage
+from .provider_client import CircuitBreaker, ProviderClient, invalidate_provider_client
+from .rerank import RerankError, rerank_documents
+from .vector_index import DELETED_ID, VectorIndex, VectorIndexWriter, append_rows, delete_rows, needs_rewrite
+from .views import CONVERSATION_ID_HEADER, AsyncChatView
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# 测试 ASGI 模式的对话视图（AI_CHAT_ASYNC 在启动时决定路由，测试中单独挂载）
+urlpatterns = [
+    path('api/ai/chat/', AsyncChatView.as_view()),
+]
+
+
+def make_response(status_code, content):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.raw = io.BytesIO(content)
+    return response
+
+
+@mock.patch('ai_assistant.rerank.CallTimer', mock.MagicMock())
+class RerankTests(SimpleTestCase):
+    """检索结果重排"""
+
+    ai_model = SimpleNamespace(name='rerank-model', provider=None)
+
+    def rerank(self, response):
+        with mock.patch('ai_assistant.rerank.get_provider_client') as get_client:
+            get_client.return_value.post.return_value = response
+            return rerank_documents(self.ai_model, 'query', ['a', 'b', 'c'], top_n=2)
+
+    def test_sorted_by_score(self):
+        response = make_response(200, b'{"results": [{"index": 0, "relevance_score": 0.1}, '
+                                      b'{"index": 2, "relevance_score": 0.9}, {"index": 7, "relevance_score": 1}]}')
+        self.assertEqual(self.rerank(response), [(2, 0.9), (0, 0.1)])
+
+    def test_malformed_body(self):
+        for content in (b'<html>Bad Gateway</html>', b'[1, 2]', b'{"results": [{"index": 0}]}'):
+            with self.subTest(content=content), self.assertRaises(RerankError):
+                self.rerank(make_response(200, content))
+
+
+def sse_body(*contents):
+    """上游流式对话响应体"""
+    events = [f"data: {json.dumps({'choices': [{'delta': {'content': content}}]})}\n\n" for content in contents]
+    return ''.join(events + ['data: [DONE]\n\n']).encode()
+
+
+@skipIf(httpx is None, '未安装 httpx')
+@override_settings(ROOT_URLCONF='ai_assistant.tests')
+@mock.patch('ai_assistant.chat.CallTimer', mock.MagicMock())
+class AsyncChatViewTests(TransactionTestCase):
+    """异步对话视图：上游由 httpx MockTransport 模拟"""
+
+    def setUp(self):
+        provider = AIProvider.objects.create(name='mock', type='OpenAi', base_url='http://upstream.test/v1',
+                                             api_key='key')
+        chat_model = AIModel.objects.create(provider=provider, name='chat-model', type='chat')
+        SystemSetting.objects.create(key=AI_CONFIG_KEY, value={'default_chat_model_id': chat_model.id})
+        invalidate_ai_config_cache()
+        self.addCleanup(invalidate_ai_config_cache)
+        self.upstream_requests = []
+        self.upstream_responses = []
+
+        # 异步客户端按事件循环复用，上游按顺序返回 upstream_responses 中的响应
+        def handle(request):
+            self.upstream_requests.append(json.loads(request.content))
+            return self.upstream_responses.pop(0)
+
+        client_patch = mock.patch('httpx.AsyncClient',
+                                  partial(httpx.AsyncClient, transport=httpx.MockTransport(handle)))
+        client_patch.start()
+        self.addCleanup(client_patch.stop)
+
+    async def chat(self, **data):
+        response = await self.async_client.post('/api/ai/chat/', data, content_type='application/json')
+        chunks = [chunk.decode() async for chunk in response.streaming_content]
+        return response, chunks
+
+    async def test_streams_chunks_in_order(self):
+        self.upstream_responses.append(httpx.Response(200, content=sse_body('你', '好', '！')))
+        response, chunks = await self.chat(message='hi')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(chunks, ['你', '好', '！'])
+        self.assertTrue(response[CONVERSATION_ID_HEADER])
+        self.assertEqual(self.upstream_requests[0]['messages'][-1], {'role': 'user', 'content': 'hi'})
+
+        # 提问与回复一并保存，后续消息只提交会话ID，历史由服务端读取
+        conversation_id = response[CONVERSATION_ID_HEADER]
+        self.upstream_responses.append(httpx.Response(200, content=sse_body('再见')))
+        response, chunks = await self.chat(message='bye', conversationId=conversation_id)
+        self.assertEqual(chunks, ['再见'])
+        self.assertEqual(self.upstream_requests[1]['messages'][1:], [
+            {'role': 'user', 'content': 'hi'},
+            {'role': 'assistant', 'content': '你好！'},
+            {'role': 'user', 'content': 'bye'},
+        ])
+
+    async def test_concurrent_chats_overlap(self):
+        """同时进行的对话在线程池中并行准备请求，不会被同步中间件串行（串行时屏障等待超时）"""
+        concurrency = 4
+        barrier = threading.Barrier(concurrency)
+
+        def prepare(data):
+            barrier.wait(timeout=5)
+            return prepare_chat(data)
+
+        # 预先加载默认模型缓存，避免各线程同时查询配置
+        await sync_to_async(get_default_model)('default_chat_model_id', '对话')
+        self.upstream_responses.extend(httpx.Response(200, content=sse_body('ok')) for _ in range(concurrency))
+        with mock.patch('ai_assistant.views.prepare_chat', side_effect=prepare):
+            results = await asyncio.gather(*[self.chat(message=f'q{i}', history=[]) for i in range(concurrency)])
+
+        self.assertEqual([chunks for _, chunks in results], [['ok']] * concurrency)
+
+    async def test_upstream_error(self):
+        self.upstream_responses.append(httpx.Response(401, content=b'invalid api key'))
+        response, chunks = await self.chat(message='hi')
+
+        self.assertEqual(chunks, ['Error: Upstream API 401 - invalid api key'])
+        # 上游出错时本轮不保存，也不会留下空会话
+        conversation_id = response[CONVERSATION_ID_HEADER]
+        self.assertFalse(await Conversation.objects.aexists())
+        self.assertFalse(await ConversationMessage.objects.aexists())
+
+        # 客户端继续使用分配的会话ID：按新会话处理，成功后创建
+        self.upstream_responses.append(httpx.Response(200, content=sse_body('好的')))
+        response, chunks = await self.chat(message='retry', conversationId=conversation_id)
+        self.assertEqual(chunks, ['好的'])
+        self.assertEqual(self.upstream_requests[-1]['messages'][1:], [{'role': 'user', 'content': 'retry'}])
+        self.assertEqual(await ConversationMessage.objects.filter(conversation_id=conversation_id).acount(), 2)
+
+    async def test_invalid_conversation_id(self):
+        response = await self.async_client.post('/api/ai/chat/', {'message': 'hi', 'conversationId': 'x' * 100},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CallMetricsFlushTests(TestCase):
+    """调用指标写入数据库"""
+
+    key = ('provider', 'mock', 'chat-model', 'chat')
+
+    def setUp(self):
+        self.metrics = CallMetrics()
+        metrics_patch = mock.patch('ai_assistant.metrics._metrics', self.metrics)
+        metrics_patch.start()
+        self.addCleanup(metrics_patch.stop)
+
+    def test_failed_write_keeps_buckets(self):
+        self.metrics.record(self.key, status=200, duration_ms=300)
+        with mock.patch.object(AICallStat.objects, 'bulk_create', side_effect=RuntimeError('database is locked')), \
+                self.assertRaises(RuntimeError):
+            flush_call_metrics(include_current=True)
+
+        # 失败期间的新记录与放回的汇总合并，下次一起写入
+        self.metrics.record(self.key, status=500, duration_ms=100)
+        self.assertEqual(flush_call_metrics(include_current=True), 1)
+        stat = AICallStat.objects.get()
+        self.assertEqual((stat.calls, stat.errors, stat.outcomes), (2, 1, {'200': 1, '500': 1}))
+        self.assertEqual(self.metrics.snapshot(), [])
+
+    def test_current_minute_waits_for_next_flush(self):
+        now = timezone.now().replace(second=30)
+        with mock.patch('ai_assistant.metrics.timezone.now', return_value=now):
+            self.metrics.record(self.key, status=200, duration_ms=300)
+            self.assertEqual(flush_call_metrics(), 0)
+        self.assertEqual(len(self.metrics.snapshot()), 1)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """熔断器状态：关闭 → 熔断 → 试探 → 关闭"""
+
+    def setUp(self):
+        self.now = 1000.0
+        clock_patch = mock.patch('ai_assistant.provider_client.time.monotonic', side_effect=lambda: self.now)
+        clock_patch.start()
+        self.addCleanup(clock_patch.stop)
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    def test_open_half_open_close(self):
+        for _ in range(2):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open)
+
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+
+        # 熔断超时后只放行一个试探请求
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+
+    def test_cancelled_probe_releases_slot(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(error=KeyboardInterrupt())
+        self.assertTrue(self.breaker.allow())
+
+
+@override_settings(AI_PROVIDER_MAX_RETRIES=2, AI_PROVIDER_RETRY_BACKOFF=0.5, AI_PROVIDER_RETRY_MAX_BACKOFF=4,
+                   AI_PROVIDER_BREAKER_FAILURES=2, AI_PROVIDER_BREAKER_RESET=30)
+class ProviderClientTests(SimpleTestCase):
+    """提供商客户端的重试、退避与熔断"""
+
+    provider = SimpleNamespace(id='provider', name='mock', base_url='http://upstream.test/v1', api_key='key',
+                               updated_at=None)
+
+    def setUp(self):
+        invalidate_provider_client(self.provider.id)
+        self.addCleanup(invalidate_provider_client, self.provider.id)
+        self.client = ProviderClient(self.provider)
+        sleep_patch = mock.patch('ai_assistant.provider_client.time.sleep')
+        self.sleep = sleep_patch.start()
+        self.addCleanup(sleep_patch.stop)
+
+    def post(self, *results):
+        with mock.patch.object(self.client.session, 'post', side_effect=results) as session_post:
+            try:
+                return self.client.post('/embeddings', {}, read_timeout=10)
+            finally:
+                self.calls = session_post.call_count
+
+    def test_retries_with_jittered_backoff(self):
+        response = self.post(make_response(503, b''), make_response(502, b''), make_response(200, b'{}'))
+        self.assertEqual((response.status_code, self.calls), (200, 3))
+        delays = [call.args[0] for call in self.sleep.call_args_list]
+        self.assertTrue(0 <= delays[0] <= 0.5 and 0 <= delays[1] <= 1.0)
+
+    def test_retry_after_header(self):
+        throttled = make_response(429, b'')
+        throttled.headers['Retry-After'] = '2'
+        self.post(throttled, make_response(200, b'{}'))
+        self.sleep.assert_called_once_with(2.0)
+
+    def test_gives_up_after_max_retries(self):
+        with self.assertRaises(requests.ConnectionError):
+            self.post(*[requests.ConnectionError('refused')] * 3)
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.client.breaker.failures, 1)
+
+    def test_probe_exception_does_not_stick_breaker(self):
+        """试探请求抛出非网络异常（如构建请求失败）时记为失败，熔断超时后可再次试探"""
+        now = [1000.0]
+        with mock.patch('ai_assistant.provider_client.time.monotonic', side_effect=lambda: now[0]):
+            for _ in range(2):
+                self.post(*[make_response(500, b'')] * 3)
+            self.assertTrue(self.client.breaker.is_open)
+
+            now[0] += 30
+            with self.assertRaises(ValueError):
+                self.post(ValueError('bad payload'))
+            self.assertTrue(self.client.breaker.is_open)
+
+            now[0] += 30
+            self.assertEqual(self.post(make_response(200, b'{}')).status_code, 200)
+            self.assertFalse(self.client.breaker.is_open)
+
+
+def unit_vectors(rows):
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+class IndexDirMixin:
+    """每个测试使用独立的知识库索引目录"""
+
+    def setUp(self):
+        super().setUp()
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir, ignore_errors=True)
+
+
+class VectorIndexTests(IndexDirMixin, SimpleTestCase):
+    """内存映射向量索引"""
+
+    def test_tombstones(self):
+        """删除的行标记为墓碑后检索跳过；行号已对应其他文本块时不会误删"""
+        vectors = unit_vectors(np.random.default_rng(0).normal(size=(10, 8)))
+        writer = VectorIndexWriter(self.index_dir, 'embedding-model', ann=False)
+        writer.append(vectors[:8], range(1, 9))
+        writer.publish()
+        self.assertEqual(append_rows(self.index_dir, vectors[8:], [9, 10]), 8)
+
+        delete_rows(self.index_dir, {0: 1, 1: 999, 9: 10})
+        index = VectorIndex.load(self.index_dir)
+        self.assertEqual((len(index), index.meta['deleted']), (10, 2))
+        self.assertEqual(list(index.ids[:2]), [DELETED_ID, 2])
+        hits = dict(index.search(vectors[0], 10))
+        self.assertNotIn(1, hits)
+        self.assertNotIn(10, hits)
+        self.assertEqual(index.search(vectors[1], 1)[0][0], 2)
+
+        with override_settings(AI_KB_COMPACT_RATIO=0.2):
+            self.assertTrue(needs_rewrite(index.meta))
+        with override_settings(AI_KB_COMPACT_RATIO=0.5):
+            self.assertFalse(needs_rewrite(index.meta))
+
+    @override_settings(AI_KB_IVF_TRAIN_SAMPLE=100000, AI_KB_IVF_TRAIN_ITERATIONS=10)
+    def test_ivf_recall(self):
+        """IVF 近似检索的召回率与精确检索相比不低于 0.9，建立倒排列表后追加的行同样可以检索到"""
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(40, 32))
+        vectors = unit_vectors(centers[rng.integers(0, 40, size=4000)] + rng.normal(scale=0.3, size=(4000, 32)))
+        writer = VectorIndexWriter(self.index_dir, 'embedding-model', ann=True, nlist=64)
+        writer.append(vectors, range(4000))
+        self.assertEqual(writer.publish()['ivf']['nlist'], 64)
+
+        index = VectorIndex.load(self.index_dir)
+        queries = unit_vectors(centers[rng.integers(0, 40, size=50)] + rng.normal(scale=0.3, size=(50, 32)))
+        found = 0
+        for query in queries:
+            exact = {chunk_id for chunk_id, _ in index.search(query, 10, exact=True)}
+            found += len(exact & {chunk_id for chunk_id, _ in index.search(query, 10, nprobe=8)})
+        self.assertGreaterEqual(found / (10 * len(queries)), 0.9)
+
+        append_rows(self.index_dir, queries[:1], [5000])
+        index = VectorIndex.load(self.index_dir)
+        self.assertEqual(index.search(queries[0], 1, nprobe=1)[0][0], 5000)
+
+    def test_train_centroids_independent_of_block_size(self):
+        """按块累加簇的向量和，结果与块大小无关"""
+        vectors = unit_vectors(np.random.default_rng(1).normal(size=(3000, 16)))
+        centroids = train_centroids(vectors, 30, 100000, 5)
+        with mock.patch('ai_assistant.ivf.ASSIGN_BLOCK_ROWS', 37):
+            np.testing.assert_allclose(train_centroids(vectors, 30, 100000, 5), centroids, atol=1e-5)
+        np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1, atol=1e-5)
+
+
+class LexicalSearchTests(TestCase):
+    """BM25 关键词检索"""
+
+    def setUp(self):
+        corpus_patch = mock.patch('ai_assistant.lexical._corpus_stats', None)
+        corpus_patch.start()
+        self.addCleanup(corpus_patch.stop)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('知识库检索 BM25_Search'), ['知识', '识库', '库检', '检索', 'bm25', 'search'])
+        self.assertEqual(tokenize('我 是'), ['我', '是'])
+
+    def test_cjk_bigram_scoring(self):
+        """按二元分词匹配中文，命中词区分度高、出现次数多的文本块得分高"""
+        article = Article.objects.create(title='检索', content='', coll_id='c1')
+        contents = ['向量检索的原理', '倒排索引与关键词检索，倒排索引按词组织', '今天天气很好', '倒排索引']
+        chunks = [
+            ArticleChunk(article=article, seq=seq, content=content, content_hash=str(seq), embedding=b'',
+                         model_id='m', token_count=len(tokenize(content)))
+            for seq, content in enumerate(contents)
+        ]
+        chunks = ArticleChunk.objects.bulk_create(chunks)
+        create_chunk_terms(chunks, [term_counts(content) for content in contents])
+
+        hits = bm25_search('倒排索引', 10)
+        self.assertEqual({chunk_id for chunk_id, _ in hits}, {chunks[1].id, chunks[3].id})
+        # 较短的文本块长度归一化后得分更高
+        self.assertEqual(hits[0][0], chunks[3].id)
+
+        hits = dict(bm25_search('检索原理', 10))
+        self.assertEqual(max(hits, key=hits.get), chunks[0].id)
+        self.assertNotIn(chunks[2].id, hits)
+        self.assertEqual(bm25_search('无关内容', 10), [])
+
+
+def fake_embeddings(ai_model, texts, bulk=False):
+    """按文本哈希生成固定的向量"""
+    return np.stack([
+        np.random.default_rng(int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)).normal(size=8)
+        for text in texts
+    ]).astype(np.float32)
+
+
+@override_settings(AI_KB_CHUNK_CHARS=8, AI_KB_CHUNK_OVERLAP=0, AI_KB_COMPACT_RATIO=0.5)
+class KnowledgeIndexSyncTests(IndexDirMixin, TestCase):
+    """知识库增量同步"""
+
+    def setUp(self):
+        super().setUp()
+        override = override_settings(AI_KNOWLEDGE_INDEX_DIR=self.index_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        for target, kwargs in (
+                ('ai_assistant.knowledge_base.get_default_model', {'return_value': SimpleNamespace(id='emb')}),
+                ('ai_assistant.knowledge_base.embed_texts', {'side_effect': fake_embeddings})):
+            patcher = mock.patch(target, **kwargs)
+            self.embed_texts = patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.articles = [
+            Article.objects.create(title=f'文章{number}', coll_id='c1',
+                                   content='\n\n'.join(f'第{number}篇第{seq}段' for seq in range(4)))
+            for number in range(3)
+        ]
+        self.assertEqual(rebuild_knowledge_index(), 12)
+        self.embed_texts.reset_mock()
+
+    def assert_index_matches_chunks(self):
+        """索引中每个有效行都对应一个文本块，且向量与数据库中保存的一致"""
+        index = VectorIndex.load(self.index_dir)
+        chunks = list(ArticleChunk.objects.all())
+        self.assertEqual(len(index) - index.meta['deleted'], len(chunks))
+        for chunk in chunks:
+            self.assertEqual(index.ids[chunk.index_row], chunk.id)
+            np.testing.assert_array_equal(index.vectors[chunk.index_row], np.frombuffer(chunk.embedding, np.float32))
+        return index
+
+    def test_sync_skips_unchanged_articles(self):
+        """只有内容变化的文本块重新向量化，未变化的文章不会被标记待同步"""
+        article = self.articles[0]
+        article.content = article.content.replace('第0篇第2段', '第0篇改写的段落')
+        article.save()
+        schedule_article_index(article)
+        schedule_article_index(self.articles[1])
+        self.assertEqual(list(get_pending_states().values_list('article_id', flat=True)), [article.article_id])
+
+        self.assertEqual(sync_knowledge_index(), 1)
+        self.embed_texts.assert_called_once()
+        self.assertEqual(self.embed_texts.call_args[0][1], ['文章0\n第0篇改写的段落'])
+        self.assertFalse(get_pending_states().exists())
+
+        index = self.assert_index_matches_chunks()
+        self.assertEqual((len(index), index.meta['deleted']), (13, 1))
+        self.assertEqual(sync_knowledge_index(), 0)
+
+    def test_compaction(self):
+        """删除的文章较多、墓碑占比超过阈值时按保存的向量重写索引，不调用向量化接口"""
+        for article in self.articles[:2]:
+            article.is_valid = False
+            article.save()
+            schedule_article_index(article)
+
+        self.assertEqual(sync_knowledge_index(), 0)
+        self.embed_texts.assert_not_called()
+        index = self.assert_index_matches_chunks()
+        self.assertEqual((len(index), index.meta['deleted']), (4, 0))
+        self.assertEqual(sorted(ArticleChunk.objects.values_list('index_row', flat=True)), [0, 1, 2, 3])
+
+
+class EmbeddingBatcherTests(SimpleTestCase):
+    """向量化请求合批"""
+
+    def setUp(self):
+        self.sent = []
+        self.response = None
+
+    def send(self, texts):
+        self.sent.append(list(texts))
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response(texts) if self.response else [[float(len(text))] for text in texts]
+
+    def batcher(self, batch_size=32, window=0.2, slots=None):
+        return EmbeddingBatcher(self.send, slots or ProviderSlots(2), batch_size, window)
+
+    def test_concurrent_callers_share_one_request(self):
+        """窗口内各调用方的请求合并为一次上游请求，相同文本只发送一次，各自按顺序取回结果"""
+        batcher = self.batcher()
+        callers = [['a', 'bb'], ['ccc'], ['bb', 'dddd', 'a'], ['eeeee']]
+        barrier = threading.Barrier(len(callers))
+        results = [None] * len(callers)
+
+        def call(index):
+            barrier.wait()
+            results[index] = [future.result(5) for future in batcher.submit(callers[index])]
+
+        threads = [threading.Thread(target=call, args=(index,)) for index in range(len(callers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(sorted(self.sent[0]), ['a', 'bb', 'ccc', 'dddd', 'eeeee'])
+        self.assertEqual(results, [[[float(len(text))] for text in texts] for texts in callers])
+
+    def test_batch_size_and_priority(self):
+        """超过批大小时拆分为多次请求，交互请求排在索引任务之前"""
+        slots = ProviderSlots(1)
+        batcher = self.batcher(batch_size=3, window=0.05, slots=slots)
+        # 占用唯一的并发名额，使请求先在队列中积累
+        slots.semaphore.acquire()
+        bulk = batcher.submit(['b1', 'b2', 'b3', 'b4'], bulk=True)
+        urgent = batcher.submit(['u1', 'u2'])
+        slots.semaphore.release()
+
+        for future in bulk + urgent:
+            future.result(5)
+        self.assertEqual(self.sent, [['u1', 'u2', 'b1'], ['b2', 'b3', 'b4']])
+
+    def test_failure_reaches_every_waiter(self):
+        """上游请求失败时同一批的所有调用方都收到异常，不会一直等待"""
+        self.response = EmbeddingError('向量化接口返回 500')
+        batcher = self.batcher(window=0.05)
+        futures = batcher.submit(['a', 'b']) + batcher.submit(['a', 'c'], bulk=True)
+        for future in futures:
+            with self.assertRaises(EmbeddingError):
+                future.result(5)
+        with self.assertRaises(EmbeddingError):
+            collect_vectors(batcher.submit(['d']))
+
+    def test_short_response_fails_batch(self):
+        """返回的向量数量不足时整批失败，而不是让未分到结果的调用方一直等待"""
+        self.response = lambda texts: [[1.0]] * (len(texts) - 1)
+        futures = self.batcher(window=0.05).submit(['a', 'b', 'c'])
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(5)
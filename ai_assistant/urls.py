@@ -1,7 +1,11 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import ChatView
+from .views import AsyncChatView, ChatView, ConversationDetailView
 
 urlpatterns = [
-    path('chat/', ChatView.as_view(), name='ai-chat'),
+    # ASGI 模式下由异步视图处理对话流，WSGI 模式下使用同步视图
+    path('chat/', (AsyncChatView if settings.AI_CHAT_ASYNC else ChatView).as_view(), name='ai-chat'),
+    # 会话详情与删除
+    path('conversations/<str:conversation_id>/', ConversationDetailView.as_view(), name='ai-conversation-detail'),
 ]
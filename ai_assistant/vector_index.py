@@ -0,0 +1,361 @@
+"""
+知识库向量索引
+所有文本块的向量按行存放在一个连续的 float32 矩阵文件中（已归一化，余弦相似度即点积），
+另有等长的 int64 文件记录每一行对应的 ArticleChunk ID。查询时以内存映射方式打开，
+由操作系统按需分页加载，多个 worker 进程共享同一份页缓存；Top-K 检索为一次矩阵乘法。
+
+增量更新：新文本块的向量追加到文件末尾；删除的文本块将对应行的 ID 置为 -1（墓碑），检索时跳过；
+墓碑过多时由上层按数据库中保存的向量重写一个新版本（压缩）。所有写操作需持有目录锁。
+
+近似检索：文本块数达到 AI_KB_IVF_MIN_ROWS 时，发布版本时额外建立 IVF 倒排索引（见 ivf.py），
+检索只计算最接近的若干个簇；之后追加的行记录所属簇，检索时一并过滤，追加过多时随压缩重新训练。
+
+目录结构（settings.AI_KNOWLEDGE_INDEX_DIR）：
+- meta.json：当前版本、向量化模型ID、向量维度、行数、墓碑数、数据文件名及 IVF 参数
+- vectors-<版本>.f32 / ids-<版本>.i64：数据文件，重建时写入新版本，写完后替换 meta.json 发布
+- centroids-<版本>.f32 / lists-<版本>.i64 / offsets-<版本>.i64 / assign-<版本>.i32：IVF 簇中心、
+  按簇排列的行号、各簇起止位置、每行所属的簇（仅建立近似索引时存在）
+- .lock：写锁
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+from .ivf import assign_clusters, build_inverted_lists, default_nlist, probe_clusters, train_centroids
+
+META_FILE = 'meta.json'
+LOCK_FILE = '.lock'
+
+# 墓碑行的 ID
+DELETED_ID = -1
+
+# IVF 近似索引的数据文件
+IVF_FILES = ('centroids', 'lists', 'offsets', 'assign')
+INDEX_FILE_SUFFIXES = ('.f32', '.i64', '.i32')
+
+
+IVFData = namedtuple('IVFData', ['centroids', 'lists', 'offsets', 'assign', 'rows'])
+
+
+class VectorIndex:
+    """只读的向量索引（内存映射）"""
+
+    def __init__(self, meta, vectors, ids, ivf=None):
+        self.meta = meta
+        self.vectors = vectors
+        self.ids = ids
+        self.ivf = ivf
+
+    @property
+    def model_id(self):
+        """建立索引时使用的向量化模型ID，与当前配置不一致时索引不可用"""
+        return self.meta.get('model_id')
+
+    @property
+    def dim(self):
+        return self.meta['dim']
+
+    def __len__(self):
+        return self.meta['count']
+
+    @classmethod
+    def load(cls, directory):
+        """打开目录中的当前版本，未建立索引时返回 None"""
+        meta = read_meta(directory)
+        if meta is None:
+            return None
+
+        count, dim = meta['count'], meta['dim']
+        if count == 0:
+            return cls(meta, np.zeros((0, dim), dtype=np.float32), np.zeros(0, dtype=np.int64))
+        vectors = np.memmap(os.path.join(directory, meta['vectors']), dtype=np.float32, mode='r', shape=(count, dim))
+        # 共享映射：其他进程写入的墓碑立即可见
+        ids = np.memmap(os.path.join(directory, meta['ids']), dtype=np.int64, mode='r', shape=(count,))
+
+        ivf = None
+        if meta.get('ivf'):
+            ivf_meta = meta['ivf']
+            ivf = IVFData(
+                centroids=np.fromfile(os.path.join(directory, ivf_meta['centroids']), dtype=np.float32).reshape(-1, dim),
+                lists=np.memmap(os.path.join(directory, ivf_meta['lists']), dtype=np.int64, mode='r',
+                                shape=(ivf_meta['rows'],)),
+                offsets=np.fromfile(os.path.join(directory, ivf_meta['offsets']), dtype=np.int64),
+                assign=np.memmap(os.path.join(directory, ivf_meta['assign']), dtype=np.int32, mode='r',
+                                 shape=(count,)),
+                rows=ivf_meta['rows']
+            )
+        return cls(meta, vectors, ids, ivf)
+
+    def search(self, query_vector, top_k, nprobe=None, exact=False):
+        """
+        余弦相似度 Top-K
+        建立了 IVF 近似索引时只计算 nprobe 个最接近的簇（默认 AI_KB_IVF_NPROBE），exact=True 时计算全部向量
+        :param query_vector: 已归一化的查询向量
+        :return: [(文本块ID, 相似度), ...]，按相似度从高到低
+        """
+        if len(self) == 0:
+            return []
+        if self.ivf is None or exact:
+            rows = None
+            scores = self.vectors @ query_vector
+            deleted = self.ids == DELETED_ID
+        else:
+            rows = self._candidate_rows(query_vector, nprobe or settings.AI_KB_IVF_NPROBE)
+            scores = self.vectors[rows] @ query_vector
+            deleted = self.ids[rows] == DELETED_ID
+        scores[deleted] = -np.inf
+        if len(scores) == 0:
+            return []
+
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        hits = top if rows is None else rows[top]
+        return [(int(self.ids[row]), float(score)) for row, score in zip(hits, scores[top]) if np.isfinite(score)]
+
+    def _candidate_rows(self, query_vector, nprobe):
+        """IVF 候选行：所选簇的倒排列表，加上建立倒排列表后追加、尚未重排的行"""
+        ivf = self.ivf
+        clusters = probe_clusters(ivf.centroids, query_vector, nprobe)
+        parts = [ivf.lists[ivf.offsets[cluster]:ivf.offsets[cluster + 1]] for cluster in clusters]
+        if len(self) > ivf.rows:
+            tail = np.flatnonzero(np.isin(ivf.assign[ivf.rows:], clusters)) + ivf.rows
+            parts.append(tail)
+        # 按行号排序，读取内存映射时尽量顺序访问
+        return np.sort(np.concatenate(parts))
+
+
+def read_meta(directory):
+    """读取当前版本信息，未建立索引时返回 None"""
+    meta_path = os.path.join(directory, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_meta(directory, meta):
+    """原子替换 meta.json"""
+    temp_meta_path = os.path.join(directory, f'{META_FILE}.{uuid.uuid4().hex[:8]}.tmp')
+    with open(temp_meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(temp_meta_path, os.path.join(directory, META_FILE))
+
+
+@contextmanager
+def index_lock(directory, blocking=True):
+    """
+    索引写锁（跨进程），非阻塞模式下锁被占用时返回 False
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class VectorIndexWriter:
+    """
+    逐批追加向量，写完后发布为新版本
+    数据直接追加写入文件，内存占用与索引大小无关
+    """
+
+    def __init__(self, directory, model_id, ann=None, nlist=None):
+        """
+        :param ann: 是否建立 IVF 近似索引，为 None 时按 wants_ann 的规则决定
+        :param nlist: 簇数量，为 None 时取 AI_KB_IVF_NLIST（0 表示按行数自动计算）
+        """
+        self.directory = directory
+        self.model_id = model_id
+        self.ann = ann
+        self.nlist = nlist
+        self.version = time.strftime('%Y%m%d%H%M%S') + '-' + uuid.uuid4().hex[:8]
+        self.count = 0
+        self.dim = None
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_file = open(self._path('vectors'), 'wb')
+        self._ids_file = open(self._path('ids'), 'wb')
+
+    def append(self, vectors, ids):
+        """
+        追加一批已归一化的向量及对应的文本块ID
+        :return: 第一行的行号
+        """
+        first_row = self.count
+        if len(vectors) == 0:
+            return first_row
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"向量维度不一致: {vectors.shape[1]} / {self.dim}")
+        self._vectors_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self._ids_file.write(np.asarray(ids, dtype=np.int64).tobytes())
+        self.count += len(vectors)
+        return first_row
+
+    def _path(self, kind):
+        suffix = {'vectors': 'f32', 'centroids': 'f32', 'assign': 'i32'}.get(kind, 'i64')
+        return os.path.join(self.directory, f'{kind}-{self.version}.{suffix}')
+
+    def publish(self):
+        """写入 meta.json 发布新版本，并删除旧版本的数据文件（已打开的内存映射不受影响）"""
+        self._vectors_file.close()
+        self._ids_file.close()
+        meta = {
+            'version': self.version,
+            'model_id': self.model_id,
+            'dim': self.dim or 0,
+            'count': self.count,
+            'deleted': 0,
+            'vectors': os.path.basename(self._path('vectors')),
+            'ids': os.path.basename(self._path('ids')),
+        }
+        ann = wants_ann(self.count) if self.ann is None else self.ann
+        if ann and self.count:
+            meta['ivf'] = self._build_ivf()
+        _write_meta(self.directory, meta)
+
+        current = {meta['vectors'], meta['ids'], *(meta['ivf'][kind] for kind in IVF_FILES if meta.get('ivf'))}
+        for file_name in os.listdir(self.directory):
+            if file_name not in current and file_name.endswith(INDEX_FILE_SUFFIXES):
+                os.remove(os.path.join(self.directory, file_name))
+        return meta
+
+    def _build_ivf(self):
+        """训练簇中心并为全部行建立倒排列表"""
+        vectors = np.memmap(self._path('vectors'), dtype=np.float32, mode='r', shape=(self.count, self.dim))
+        nlist = self.nlist or settings.AI_KB_IVF_NLIST or default_nlist(self.count)
+        centroids = train_centroids(vectors, nlist, settings.AI_KB_IVF_TRAIN_SAMPLE,
+                                    settings.AI_KB_IVF_TRAIN_ITERATIONS)
+        assign = assign_clusters(vectors, centroids)
+        del vectors
+        lists, offsets = build_inverted_lists(assign, len(centroids))
+        for kind, data in (('centroids', centroids), ('lists', lists), ('offsets', offsets), ('assign', assign)):
+            data.tofile(self._path(kind))
+        return {
+            'nlist': len(centroids),
+            'rows': self.count,
+            **{kind: os.path.basename(self._path(kind)) for kind in IVF_FILES},
+        }
+
+    def discard(self):
+        """放弃本次写入"""
+        self._vectors_file.close()
+        self._ids_file.close()
+        for kind in ('vectors', 'ids', *IVF_FILES):
+            if os.path.exists(self._path(kind)):
+                os.remove(self._path(kind))
+
+
+def append_rows(directory, vectors, ids):
+    """
+    向当前版本末尾追加向量（需持有写锁），建立了 IVF 近似索引时同时记录新行所属的簇
+    先写数据再更新 meta.json 中的行数，中途失败时多写的数据不会被读取
+    :return: 第一行的行号
+    """
+    meta = read_meta(directory)
+    first_row = meta['count']
+    if len(vectors) == 0:
+        return first_row
+    if meta['count'] and vectors.shape[1] != meta['dim']:
+        raise ValueError(f"向量维度不一致: {vectors.shape[1]} / {meta['dim']}")
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    files = [(meta['vectors'], vectors), (meta['ids'], np.asarray(ids, dtype=np.int64))]
+    if meta.get('ivf'):
+        centroids = np.fromfile(os.path.join(directory, meta['ivf']['centroids']), dtype=np.float32)
+        files.append((meta['ivf']['assign'], assign_clusters(vectors, centroids.reshape(-1, vectors.shape[1]))))
+    for file_name, data in files:
+        item_size = data.itemsize * (data.shape[1] if data.ndim > 1 else 1)
+        with open(os.path.join(directory, file_name), 'r+b' if first_row else 'wb') as f:
+            # 截断上次失败时残留在末尾、未计入行数的数据
+            f.truncate(first_row * item_size)
+            f.seek(first_row * item_size)
+            f.write(data.tobytes())
+
+    meta['dim'] = vectors.shape[1]
+    meta['count'] = first_row + len(vectors)
+    _write_meta(directory, meta)
+    return first_row
+
+
+def delete_rows(directory, rows):
+    """
+    将指定行标记为墓碑（需持有写锁）
+    :param rows: {行号: 文本块ID}，只有该行仍对应该文本块时才标记，行号过期（索引已重写）时不会误删其他行
+    """
+    meta = read_meta(directory)
+    if meta is None or meta['count'] == 0:
+        return
+    ids = np.memmap(os.path.join(directory, meta['ids']), dtype=np.int64, mode='r+', shape=(meta['count'],))
+    rows = [row for row, chunk_id in rows.items()
+            if row is not None and 0 <= row < meta['count'] and ids[row] == chunk_id]
+    if not rows:
+        del ids
+        return
+    newly_deleted = len(rows)
+    ids[rows] = DELETED_ID
+    ids.flush()
+    del ids
+    meta['deleted'] = meta.get('deleted', 0) + newly_deleted
+    _write_meta(directory, meta)
+
+
+def wants_ann(count):
+    """行数达到 AI_KB_IVF_MIN_ROWS 时建立 IVF 近似索引"""
+    return settings.AI_KB_ANN_ENABLED and count >= settings.AI_KB_IVF_MIN_ROWS
+
+
+def needs_rewrite(meta):
+    """
+    是否需要重写索引：墓碑行占比超过 AI_KB_COMPACT_RATIO；建立倒排列表后追加的行占比超过该值（簇中心需重新训练）；
+    行数增长到需要近似索引，或已关闭近似索引
+    """
+    ratio = settings.AI_KB_COMPACT_RATIO
+    if meta['deleted'] and meta['deleted'] >= meta['count'] * ratio:
+        return True
+    ivf = meta.get('ivf')
+    if ivf:
+        return not settings.AI_KB_ANN_ENABLED or meta['count'] - ivf['rows'] > ivf['rows'] * ratio
+    return wants_ann(meta['count'])
+
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def get_vector_index():
+    """获取当前进程打开的索引，meta.json 变化（重建发布 / 追加）后自动重新打开"""
+    global _index, _index_mtime
+    meta_path = os.path.join(settings.AI_KNOWLEDGE_INDEX_DIR, META_FILE)
+    try:
+        meta_stat = os.stat(meta_path)
+    except FileNotFoundError:
+        return None
+    # meta.json 每次均为原子替换，以 inode + 修改时间识别新版本
+    mtime = (meta_stat.st_ino, meta_stat.st_mtime_ns)
+
+    with _index_lock:
+        if _index is None or _index_mtime != mtime:
+            try:
+                _index = VectorIndex.load(settings.AI_KNOWLEDGE_INDEX_DIR)
+            except FileNotFoundError:
+                # 读取 meta.json 后恰好又发布了新版本，旧数据文件已删除，重新读取一次
+                _index = VectorIndex.load(settings.AI_KNOWLEDGE_INDEX_DIR)
+            _index_mtime = mtime
+        return _index
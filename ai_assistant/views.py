@@ -1,12 +1,30 @@
 import json
 
-import requests
-from django.http import StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from djangorestframework_camel_case.util import underscoreize
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from system_settings.models import SystemSetting, AIModel  # 确保导入正确
+from utils.error_codes import ErrorCode
+from utils.response_utils import error_result, success_result
+from .chat import ChatRequestError, astream_chat, prepare_chat, stream_chat
+from .models import Conversation
+
+# 响应头：本次对话所属会话ID，客户端后续消息只需提交该ID与新消息
+CONVERSATION_ID_HEADER = 'X-Conversation-Id'
+
+
+def _chat_response(stream, conversation_id):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    if conversation_id:
+        response[CONVERSATION_ID_HEADER] = conversation_id
+    return response
 
 
 class ChatView(APIView):
@@ -15,101 +33,61 @@ class ChatView(APIView):
     def post(self, request):
         # DRF 的 CamelCaseJSONParser 会自动将前端的驼峰参数转为下划线
         # 例如: useKnowledgeBase -> use_knowledge_base
-        data = request.data
+        try:
+            ai_model, payload, conversation_id = prepare_chat(request.data)
+        except ChatRequestError as e:
+            return Response({'error': str(e)}, status=400)
 
-        message = data.get('message', '')
-        history = data.get('history', [])
-        # 修改点 1: 获取参数改为下划线
-        use_kb = data.get('use_knowledge_base', False)
+        return _chat_response(stream_chat(ai_model, payload, conversation_id), conversation_id)
 
-        # 1. 获取系统默认模型配置
-        try:
-            config_obj = SystemSetting.objects.get(key='system_ai_config')
-            config = config_obj.value
 
-            # 修改点 2: 从配置中获取 ID 改为下划线 (因为数据库存的是下划线)
-            # 为了兼容性，我们可以优先取下划线，取不到再试驼峰
-            model_id = config.get('default_chat_model_id') or config.get('defaultChatModelId')
+def _prepare_chat_in_thread(data):
+    """在线程池中准备请求（数据库查询、知识库检索均为同步调用），用完即关闭线程中的数据库连接"""
+    try:
+        return prepare_chat(data)
+    finally:
+        connection.close()
+
 
-        except SystemSetting.DoesNotExist:
-            return Response({'error': '系统未配置默认对话模型'}, status=400)
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChatView(View):
+    """
+    异步对话视图（ASGI 模式，见 o_doc/asgi.py）
+    请求准备在线程池中完成，之后转发上游流式输出全程运行在事件循环上，
+    一个 worker 进程即可同时维持大量对话流，不会因长时间对话占满 worker。
+    """
 
-        if not model_id:
-            return Response({'error': '未选择默认对话模型(model_id为空)'}, status=400)
+    async def post(self, request):
+        try:
+            data = underscoreize(json.loads(request.body or b'{}'))
+        except ValueError:
+            return JsonResponse({'error': '请求参数格式错误'}, status=400)
 
-        # 2. 查找模型对应的 Provider 信息
         try:
-            ai_model = AIModel.objects.get(id=model_id)
-            provider = ai_model.provider
-        except AIModel.DoesNotExist:
-            return Response({'error': f'配置的模型不存在 (ID: {model_id})'}, status=400)
-
-        # 3. 构建请求
-        system_prompt = "你是“小橘文档”知识库助手。"
-        if use_kb:
-            # TODO: 这里后续接入 RAG 检索逻辑
-            system_prompt += " (已开启知识库模式，但检索功能暂未连接)"
-
-        # 构建 OpenAI 格式的消息列表
-        messages = [{'role': 'system', 'content': system_prompt}] + history + [{'role': 'user', 'content': message}]
-
-        headers = {
-            "Authorization": f"Bearer {provider.api_key}",
-            "Content-Type": "application/json"
-        }
-
-        # 处理不同厂商的 Base URL 结尾斜杠问题
-        base_url = provider.base_url.rstrip('/')
-        if not base_url.endswith('/v1'):
-            # 有些厂商(如DeepSeek/OpenAI)如果不带v1可能会有问题，视具体配置而定
-            # 这里保持原样，假设用户配置的 URL 是完整的或标准的
-            pass
-
-        payload = {
-            "model": ai_model.name,
-            "messages": messages,
-            "stream": True,
-            # 可以根据需要添加 temperature 等参数
-            # "temperature": 0.7
-        }
-
-        # 4. 定义流式生成器
-        def event_stream():
-            try:
-                # 拼接聊天接口路径，通常是 /chat/completions
-                # 如果是 Ollama 等特殊接口，可能需要特殊处理，这里默认兼容 OpenAI 格式
-                api_url = f"{base_url}/chat/completions"
-
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=payload,
-                    stream=True,
-                    timeout=60
-                )
-
-                if response.status_code != 200:
-                    yield f"Error: Upstream API {response.status_code} - {response.text}"
-                    return
-
-                for line in response.iter_lines():
-                    if line:
-                        line = line.decode('utf-8')
-                        if line.startswith('data: '):
-                            json_str = line[6:]
-                            if json_str.strip() == '[DONE]':
-                                break
-                            try:
-                                data = json.loads(json_str)
-                                # 兼容不同厂商的返回结构，大部分是 choices[0].delta.content
-                                delta = data['choices'][0].get('delta', {})
-                                content = delta.get('content', '')
-                                if content:
-                                    yield content
-                            except Exception as e:
-                                print(f"Parse error: {e}, Line: {line}")
-                                pass
-            except Exception as e:
-                yield f"Error: {str(e)}"
-
-        return StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+            ai_model, payload, conversation_id = await sync_to_async(
+                _prepare_chat_in_thread, thread_sensitive=False
+            )(data)
+        except ChatRequestError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        return _chat_response(astream_chat(ai_model, payload, conversation_id), conversation_id)
+
+
+class ConversationDetailView(APIView):
+    """会话详情（页面刷新后恢复对话内容）与删除"""
+    permission_classes = [AllowAny]
+
+    def get(self, request, conversation_id):
+        conversation = Conversation.objects.filter(id=conversation_id).first()
+        if conversation is None:
+            return error_result(error=ErrorCode.RESOURCE_NOT_FOUND)
+        messages = conversation.messages.order_by('id').values('role', 'content', 'created_at')
+        return success_result(data={
+            'id': conversation.id,
+            'summary': conversation.summary,
+            'messages': list(messages),
+        })
+
+    def delete(self, request, conversation_id):
+        Conversation.objects.filter(id=conversation_id).delete()
+        return success_result()
@@ -4,6 +4,7 @@ from rest_framework.views import APIView
 
 from article.models import Article
 from article.serializers import ArticleSerializer, ArticleTreeSerializer
+from ai_assistant.knowledge_base import schedule_article_index
 from utils.error_codes import ErrorCode
 # 导入封装工具
 from utils.response_utils import success_result, error_result, valid_result
@@ -26,6 +27,9 @@ class ArticleCreateView(APIView):
             from anthology.models import Anthology
             Anthology.objects.filter(coll_id=article.coll_id).update(count=models.F('count') + 1)
 
+            # 事务提交后增量更新知识库索引
+            schedule_article_index(article)
+
             return success_result(data=ArticleSerializer(article).data)
 
 
@@ -68,6 +72,7 @@ class ArticleUpdateView(APIView):
 
         # 保存更新
         article = serializer.save()
+        schedule_article_index(article)
         
         # 如果文集ID发生变化，更新两个文集的文章数量
         from anthology.models import Anthology
@@ -101,6 +106,7 @@ class ArticleDeleteView(APIView):
             # 软删除：更新is_valid为False
             article.is_valid = False
             article.save()
+            schedule_article_index(article)
             
             # 更新文集文章数量
             from anthology.models import Anthology
@@ -0,0 +1,153 @@
+"""
+批量上传
+一个 multipart 请求携带多个文件，文件在接收时已写入暂存文件并算好哈希（HashingUploadHandler），这里负责入库：
+- 新内容通过有界线程池并发写入存储后端（对象存储时为并发上传）
+- 存储块引用计数、资源记录按批处理，数据库往返次数与文件数无关
+- 与单文件上传相同，存储块的引用与记录在创建资源记录的事务之前提交，资源记录创建失败时释放引用
+"""
+import mimetypes
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+from .blob_store import abandon_blob_files, blob_rel_path
+from .metadata import schedule_metadata_extraction
+from .models import Asset, AssetBlob, AssetUsage, ContentBusyError
+from .storage import get_asset_storage
+from .text_index import schedule_text_extraction
+from .upload_utils import detect_file_type, generate_asset_id, normalize_source_type
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """懒加载写入线程池（每个 worker 进程各自持有），限制同时写入存储后端的文件数"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.ASSET_BATCH_UPLOAD_WORKERS)
+        return _executor
+
+
+def store_batch(uploaded_files, source_type='other', linked_article_id=None):
+    """
+    批量存入内容寻址存储并创建资源记录
+    :param uploaded_files: HashedUploadedFile 列表（已关闭，暂存文件由调用方清理）
+    :param source_type: 资源来源类型
+    :param linked_article_id: 关联文章ID（调用方已校验存在）
+    :return: 与 uploaded_files 顺序一致的 (Asset 对象, 内容是否已存在) 列表
+    """
+    ref_counts = Counter(uploaded_file.file_hash for uploaded_file in uploaded_files)
+
+    # 先为已有内容加引用：加上后存储块不会再被回收；相同内容正在回收时等待其删除完成
+    existing = AssetBlob.reserve(ref_counts)
+    taken_refs = {file_hash: ref_counts[file_hash] for file_hash in existing}
+    # 已写入存储但尚未创建记录的新内容 {哈希: 大小}
+    written_sizes = {}
+    try:
+        blob_paths = dict(AssetBlob.objects.filter(file_hash__in=existing).values_list('file_hash', 'file_path'))
+
+        # 新内容：同一批内重复的文件只写一次，不同文件并发写入存储后端
+        new_files = {}
+        for uploaded_file in uploaded_files:
+            if uploaded_file.file_hash not in blob_paths:
+                new_files.setdefault(uploaded_file.file_hash, uploaded_file)
+
+        storage = get_asset_storage()
+        futures = {}
+        chunked_files = []
+        for file_hash, uploaded_file in new_files.items():
+            blob_paths[file_hash] = blob_rel_path(file_hash)
+            if settings.ASSET_CHUNK_DEDUP_ENABLED and uploaded_file.size >= settings.ASSET_CHUNK_DEDUP_MIN_SIZE:
+                chunked_files.append((file_hash, uploaded_file))
+                continue
+            futures[file_hash] = _get_executor().submit(
+                storage.save, blob_paths[file_hash], uploaded_file.temporary_file_path()
+            )
+
+        # 等待全部写入结束后再抛出首个错误，已写入的文件都能登记回收
+        write_error = None
+        try:
+            # 分块保存需要写入分块记录，在当前线程完成（线程池中的数据库连接不会随请求关闭）
+            for file_hash, uploaded_file in chunked_files:
+                storage.save(blob_paths[file_hash], uploaded_file.temporary_file_path())
+                written_sizes[file_hash] = uploaded_file.size
+        except Exception as e:
+            write_error = e
+        for file_hash, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                write_error = write_error or e
+            else:
+                written_sizes[file_hash] = new_files[file_hash].size
+        if write_error is not None:
+            raise write_error
+
+        # 并发请求可能已创建相同内容的记录，忽略冲突后统一累加引用
+        new_refs = {file_hash: ref_counts[file_hash] for file_hash in new_files}
+        with transaction.atomic():
+            AssetBlob.objects.bulk_create([
+                AssetBlob(
+                    file_hash=file_hash,
+                    file_size=uploaded_file.size,
+                    file_path=blob_paths[file_hash],
+                    ref_count=0
+                )
+                for file_hash, uploaded_file in new_files.items()
+            ], ignore_conflicts=True)
+            if AssetBlob.add_refs(new_refs) != len(new_refs):
+                raise ContentBusyError('相同内容正在被回收，请稍后重试')
+        taken_refs.update(new_refs)
+        written_sizes.clear()
+
+        source_type = normalize_source_type(source_type)
+        assets = []
+        for uploaded_file in uploaded_files:
+            file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+            assets.append(Asset(
+                id=generate_asset_id(),
+                name=uploaded_file.name,
+                original_name=uploaded_file.name,
+                file_type=detect_file_type(file_extension),
+                file_size=uploaded_file.size,
+                file_path=blob_paths[uploaded_file.file_hash],
+                file_extension=file_extension,
+                mime_type=mimetypes.guess_type(uploaded_file.name)[0] or 'application/octet-stream',
+                file_hash=uploaded_file.file_hash,
+                blob_id=uploaded_file.file_hash,
+                uploader='admin',  # 直接写死admin用户
+                linked_article_id=linked_article_id,
+                is_linked=bool(linked_article_id),
+                source_type=source_type
+            ))
+
+        with transaction.atomic():
+            Asset.objects.bulk_create(assets)
+            schedule_metadata_extraction([asset.id for asset in assets])
+            schedule_text_extraction(assets)
+
+            # 空间统计按文件类型合并后累加
+            usage = Counter()
+            for asset in assets:
+                usage[asset.file_type, 'size'] += asset.file_size
+                usage[asset.file_type, 'count'] += 1
+            for file_type in {asset.file_type for asset in assets}:
+                AssetUsage.apply('admin', file_type, usage[file_type, 'size'], usage[file_type, 'count'])
+    except BaseException:
+        # 资源记录未能创建：释放本次加上的引用，新写入的存储块在保留期后由垃圾回收清理
+        AssetBlob.release_refs(taken_refs)
+        abandon_blob_files(written_sizes)
+        raise
+
+    # 同一批内重复的文件，除首个外都视为内容已存在
+    first_new = {id(uploaded_file) for uploaded_file in new_files.values()}
+    return [
+        (asset, id(uploaded_file) not in first_new)
+        for asset, uploaded_file in zip(assets, uploaded_files)
+    ]
@@ -0,0 +1,110 @@
+"""
+内容寻址存储
+资源文件按哈希存放在存储后端的 blobs/<hash[:2]>/<hash[2:4]>/<hash>，
+相同内容只保存一份，由 AssetBlob 的引用计数决定何时可以回收。
+写入在调用方的事务之外进行：引用与存储块记录先行提交，资源记录创建失败时释放引用（见 stored_blob），
+文件不会因事务回滚而留在存储中无人回收。
+"""
+import os
+import shutil
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import BLOB_DIR, AssetBlob, AssetText, ContentBusyError
+from .storage import get_asset_storage
+
+# 衍生文件（缩略图等）目录（相对于 MEDIA_ROOT），按存储块哈希分目录
+# 衍生文件可随时重新生成，始终缓存在本地磁盘；使用对象存储时即为各节点的本地缓存
+DERIVATIVE_DIR = 'derivatives'
+
+
+def blob_rel_path(file_hash):
+    """存储块的存储键，按哈希前缀分两级目录避免单目录文件过多"""
+    return os.path.join(BLOB_DIR, file_hash[:2], file_hash[2:4], file_hash)
+
+
+def derivative_dir(file_hash):
+    """存储块衍生文件（缩略图等）所在目录的绝对路径"""
+    return os.path.join(settings.MEDIA_ROOT, DERIVATIVE_DIR, file_hash[:2], file_hash)
+
+
+def store_blob(file_hash, file_size, src_path=None, staged_name=None):
+    """
+    将暂存文件存入内容寻址存储，并增加一次引用
+    - 已存在相同内容时只增加引用，暂存文件保持原样由调用方删除
+    - 不存在时将暂存文件移动为存储块（本地同盘重命名 / 对象存储上传或服务端复制）
+    - 相同内容正在被回收时等待其删除完成后重新写入，超时抛出 ContentBusyError
+    须在事务之外调用；调用方随后创建资源记录失败时需释放本次引用，一般通过 stored_blob 使用
+    :param file_hash: 文件哈希
+    :param file_size: 文件大小（字节）
+    :param src_path: 本地暂存文件绝对路径
+    :param staged_name: 已在存储后端中的暂存文件存储键（分片上传），与 src_path 二选一
+    :return: (AssetBlob 对象, 是否新写入)
+    """
+    # 先尝试引用已有存储块：引用成功后计数大于 0，不会再被垃圾回收认领
+    if AssetBlob.reserve({file_hash: 1}):
+        return AssetBlob.objects.get(file_hash=file_hash), False
+
+    storage = get_asset_storage()
+    rel_file_path = blob_rel_path(file_hash)
+    if staged_name is not None:
+        storage.move(staged_name, rel_file_path)
+    else:
+        storage.save(rel_file_path, src_path)
+
+    try:
+        with transaction.atomic():
+            blob = AssetBlob.objects.create(
+                file_hash=file_hash,
+                file_size=file_size,
+                file_path=rel_file_path,
+                ref_count=1
+            )
+        return blob, True
+    except IntegrityError:
+        # 并发上传了相同内容，文件内容一致，直接引用对方创建的记录
+        if not AssetBlob.add_ref(file_hash):
+            raise ContentBusyError('相同内容正在被回收，请稍后重试')
+        return AssetBlob.objects.get(file_hash=file_hash), False
+
+
+@contextmanager
+def stored_blob(file_hash, file_size, src_path=None, staged_name=None):
+    """
+    store_blob 的上下文管理器形式，产出 (AssetBlob 对象, 是否新写入)
+    with 块内抛出异常（如创建资源记录的事务回滚）时释放本次引用，存储块在保留期后由垃圾回收清理
+    """
+    blob, created = store_blob(file_hash, file_size, src_path=src_path, staged_name=staged_name)
+    try:
+        yield blob, created
+    except BaseException:
+        AssetBlob.release(blob.file_hash)
+        raise
+
+
+def abandon_blob_files(blob_sizes):
+    """
+    为已写入存储、但未能创建记录的新内容补建零引用的存储块记录，保留期后由垃圾回收删除文件
+    已有记录的（并发写入了相同内容，或正在回收）保持不变
+    :param blob_sizes: {文件哈希: 文件大小}
+    """
+    AssetBlob.objects.bulk_create([
+        AssetBlob(
+            file_hash=file_hash,
+            file_size=file_size,
+            file_path=blob_rel_path(file_hash),
+            ref_count=0,
+            unreferenced_at=timezone.now()
+        )
+        for file_hash, file_size in blob_sizes.items()
+    ], ignore_conflicts=True)
+
+
+def delete_blob_file(blob):
+    """删除存储块文件及其衍生文件（缩略图、提取的文本）"""
+    get_asset_storage().delete(blob.file_path)
+    shutil.rmtree(derivative_dir(blob.file_hash), ignore_errors=True)
+    AssetText.objects.filter(file_hash=blob.file_hash).delete()
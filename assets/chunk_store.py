@@ -0,0 +1,430 @@
+"""
+分块去重存储（可选，ASSET_CHUNK_DEDUP_ENABLED 开启）
+整文件哈希去重对“几乎相同”的文件无效：重新导出的 PDF、改了文件头的视频都会被完整再存一份。
+开启后，不小于 ASSET_CHUNK_DEDUP_MIN_SIZE 的文件按内容定义切块（滚动哈希选切点）后保存：
+- 分块以 SHA-256 为键存放在存储后端的 chunks/<hash[:2]>/<hash[2:4]>/<hash>，由 AssetChunk 引用计数
+- 文件本身只保存分块清单（AssetManifest），读取时按顺序拼接，支持任意偏移的 Range 读取
+- 切点只取决于附近的内容，文件局部修改后只有改动附近的分块变化，新版本只需保存变化的分块
+以存储后端包装层实现，调用方（上传、下载、缩略图、文本提取等）无需区分文件是否分块保存。
+"""
+import bisect
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from collections import Counter, deque
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import UPLOAD_TEMP_DIR, AssetChunk, AssetManifest, AssetManifestChunk, ContentBusyError
+
+# 分块目录（存储键前缀）
+CHUNK_DIR = 'chunks'
+
+# 分块大小：切点只在最小与最大长度之间选取，平均约为 CDC_MIN_SIZE + CDC_TARGET_GAP
+CDC_MIN_SIZE = 256 * 1024
+CDC_TARGET_GAP = 768 * 1024
+CDC_MAX_SIZE = 4 * 1024 * 1024
+
+# 滚动哈希窗口（字节）：窗口哈希低于阈值的位置为候选切点
+CDC_WINDOW_SIZE = 48
+CDC_CUT_THRESHOLD = np.uint64((1 << 64) // CDC_TARGET_GAP)
+
+# 每次读取并计算滚动哈希的数据量
+CDC_SEGMENT_SIZE = 1024 * 1024
+
+# 新分块累计到该大小后批量查询 / 写入
+CHUNK_WRITE_BATCH_BYTES = 16 * 1024 * 1024
+
+# 多项式滚动哈希：h = Σ T[b] * B^(窗口内距末尾的距离) mod 2^64
+# 字节映射表由固定种子生成，保证不同进程、不同版本的切点一致
+_BASE = 0x100000001B3
+_BASE_INVERSE = pow(_BASE, -1, 1 << 64)
+_BYTE_TABLE = np.array(
+    [int.from_bytes(hashlib.sha256(bytes([value])).digest()[:8], 'little') for value in range(256)],
+    dtype=np.uint64
+)
+
+
+def _power_table(base, length):
+    """base^0 .. base^(length-1) mod 2^64"""
+    powers = np.full(length, base, dtype=np.uint64)
+    powers[0] = 1
+    return np.cumprod(powers, dtype=np.uint64)
+
+
+_POWERS = _power_table(_BASE, CDC_SEGMENT_SIZE + CDC_WINDOW_SIZE)
+_INVERSE_POWERS = _power_table(_BASE_INVERSE, CDC_SEGMENT_SIZE + CDC_WINDOW_SIZE)
+
+
+def chunk_rel_path(chunk_hash):
+    """分块的存储键，按哈希前缀分两级目录"""
+    return os.path.join(CHUNK_DIR, chunk_hash[:2], chunk_hash[2:4], chunk_hash)
+
+
+def _cut_candidates(tail, segment, offset):
+    """
+    计算一段数据中所有窗口的滚动哈希（前缀和方式，向量化），返回候选切点
+    :param tail: 上一段末尾不足一个窗口的数据，用于计算跨段的窗口
+    :param segment: 本段数据
+    :param offset: 本段在文件中的偏移
+    :return: 候选切点（窗口末字节之后的文件偏移）列表
+    """
+    data = np.frombuffer(tail + segment, dtype=np.uint8)
+    length = len(data)
+    if length < CDC_WINDOW_SIZE:
+        return []
+
+    # S[k] = Σ_{j<k} T[b_j] * B^-j，窗口 [i, i+W) 的哈希为 (S[i+W] - S[i]) * B^(i+W-1)
+    prefix = np.zeros(length + 1, dtype=np.uint64)
+    np.cumsum(_BYTE_TABLE[data] * _INVERSE_POWERS[:length], dtype=np.uint64, out=prefix[1:])
+    window_hashes = (prefix[CDC_WINDOW_SIZE:] - prefix[:-CDC_WINDOW_SIZE]) * _POWERS[CDC_WINDOW_SIZE - 1:length]
+
+    positions = np.flatnonzero(window_hashes < CDC_CUT_THRESHOLD)
+    return (positions + (offset - len(tail) + CDC_WINDOW_SIZE)).tolist()
+
+
+def iter_chunks(file_obj):
+    """
+    按内容定义切块，逐块产出数据
+    切点由窗口内容决定，与读取方式无关；相邻切点过近时跳过，过远时在最大长度处强制切分
+    """
+    pending = bytearray()
+    pending_start = 0
+    scanned = 0
+    tail = b''
+    candidates = deque()
+    eof = False
+
+    while True:
+        segment = file_obj.read(CDC_SEGMENT_SIZE)
+        if segment:
+            candidates.extend(_cut_candidates(tail, segment, scanned))
+            tail = (tail + segment[-(CDC_WINDOW_SIZE - 1):])[-(CDC_WINDOW_SIZE - 1):]
+            pending += segment
+            scanned += len(segment)
+        else:
+            eof = True
+
+        while pending:
+            while candidates and candidates[0] < pending_start + CDC_MIN_SIZE:
+                candidates.popleft()
+            if candidates and candidates[0] <= pending_start + CDC_MAX_SIZE:
+                cut = candidates.popleft()
+            elif scanned >= pending_start + CDC_MAX_SIZE:
+                cut = pending_start + CDC_MAX_SIZE
+            elif eof:
+                cut = scanned
+            else:
+                break
+            yield bytes(pending[:cut - pending_start])
+            del pending[:cut - pending_start]
+            pending_start = cut
+
+        if eof:
+            return
+
+
+class ChunkedFileReader(io.RawIOBase):
+    """按清单顺序拼接分块的只读文件对象，seek 时只打开目标偏移所在的分块"""
+
+    def __init__(self, storage, entries, file_size):
+        """
+        :param storage: 保存分块的存储后端
+        :param entries: [(偏移, 大小, 分块存储键), ...]，按偏移排序
+        """
+        super().__init__()
+        self._storage = storage
+        self._entries = entries
+        self._offsets = [offset for offset, _, _ in entries]
+        self._file_size = file_size
+        self._position = 0
+        self._current = None
+        self._current_end = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._file_size
+        if offset != self._position:
+            self._close_current()
+            self._position = offset
+        return self._position
+
+    def _open_current(self):
+        """打开当前偏移所在的分块，并跳到块内对应位置"""
+        index = bisect.bisect_right(self._offsets, self._position) - 1
+        offset, size, chunk_path = self._entries[index]
+        try:
+            chunk_file = self._storage.open(chunk_path)
+        except Exception:
+            if self._storage.exists(chunk_path):
+                raise
+            raise FileNotFoundError(f"分块不存在: {chunk_path}")
+
+        skip = self._position - offset
+        if skip and chunk_file.seekable():
+            chunk_file.seek(skip)
+        else:
+            # 对象存储的响应体不支持 seek，读取丢弃（不超过一个分块）
+            while skip > 0:
+                skipped = len(chunk_file.read(min(skip, CDC_SEGMENT_SIZE)))
+                if not skipped:
+                    break
+                skip -= skipped
+        self._current = chunk_file
+        self._current_end = offset + size
+
+    def _close_current(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+
+    def read(self, size=-1):
+        """与普通文件一致，读满 size 字节（到达文件末尾除外），跨分块时不返回不足的数据"""
+        if size is None or size < 0:
+            return self.readall()
+        blocks = []
+        while size > 0:
+            block = super().read(size)
+            if not block:
+                break
+            blocks.append(block)
+            size -= len(block)
+        return b''.join(blocks)
+
+    def readinto(self, buffer):
+        if self._position >= self._file_size:
+            return 0
+        if self._current is None:
+            self._open_current()
+
+        data = self._current.read(min(len(buffer), self._current_end - self._position))
+        if not data:
+            raise OSError(f"分块数据不完整: 偏移 {self._position}")
+        buffer[:len(data)] = data
+        self._position += len(data)
+        if self._position >= self._current_end:
+            self._close_current()
+        return len(data)
+
+    def close(self):
+        self._close_current()
+        super().close()
+
+
+class ChunkedAssetStorage:
+    """
+    分块去重存储包装层
+    大文件写入时切块保存，读取、删除时按清单处理；小文件与分片上传等其他操作直接交给被包装的存储后端
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, attr):
+        # 分片上传、列目录等与分块无关的操作由被包装的存储后端处理
+        return getattr(self.inner, attr)
+
+    @staticmethod
+    def should_chunk(file_size):
+        """文件是否按分块保存"""
+        return file_size >= settings.ASSET_CHUNK_DEDUP_MIN_SIZE
+
+    @staticmethod
+    def _manifest(name):
+        return AssetManifest.objects.filter(name=name).first()
+
+    def _entries(self, manifest):
+        return list(
+            AssetManifestChunk.objects.filter(manifest=manifest)
+            .order_by('seq')
+            .values_list('offset', 'chunk__size', 'chunk__file_path')
+        )
+
+    def path(self, name):
+        """分块保存的文件没有单一的本地路径"""
+        if AssetManifest.objects.filter(name=name).exists():
+            return None
+        return self.inner.path(name)
+
+    def exists(self, name):
+        return AssetManifest.objects.filter(name=name).exists() or self.inner.exists(name)
+
+    def size(self, name):
+        manifest = self._manifest(name)
+        return manifest.file_size if manifest is not None else self.inner.size(name)
+
+    def open(self, name):
+        manifest = self._manifest(name)
+        if manifest is None:
+            return self.inner.open(name)
+        return ChunkedFileReader(self.inner, self._entries(manifest), manifest.file_size)
+
+    def save(self, name, src_path):
+        """保存本地文件：大文件切块保存后删除 src_path，其余交给被包装的存储后端"""
+        if not self.should_chunk(os.path.getsize(src_path)):
+            return self.inner.save(name, src_path)
+        with open(src_path, 'rb') as src_file:
+            self._write_chunked(name, src_file)
+        os.remove(src_path)
+
+    def move(self, src_name, dest_name):
+        """在存储内移动文件：大文件读出后切块保存，再删除源文件"""
+        if not self.should_chunk(self.inner.size(src_name)):
+            return self.inner.move(src_name, dest_name)
+        with self.inner.open(src_name) as src_file:
+            self._write_chunked(dest_name, src_file)
+        self.inner.delete(src_name)
+
+    def convert(self, name):
+        """将已整文件保存的文件改为分块保存（提交后再删除原文件，转换过程中读取不受影响）"""
+        with self.inner.open(name) as src_file:
+            self._write_chunked(name, src_file)
+        self.inner.delete(name)
+
+    def delete(self, name):
+        manifest = self._manifest(name)
+        if manifest is None:
+            return self.inner.delete(name)
+
+        # 释放清单对各分块的引用，归零的分块超过保留期后由 gc_asset_blobs 命令回收
+        with transaction.atomic():
+            ref_counts = Counter(manifest.entries.values_list('chunk_id', flat=True))
+            manifest.delete()
+            AssetChunk.release_refs(ref_counts)
+
+    @contextmanager
+    def local_copy(self, name):
+        """分块保存的文件拼接到临时文件供本地处理，退出时删除"""
+        if not AssetManifest.objects.filter(name=name).exists():
+            with self.inner.local_copy(name) as file_path:
+                yield file_path
+            return
+
+        fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(name)[1])
+        try:
+            with os.fdopen(fd, 'wb') as temp_file, self.open(name) as src_file:
+                shutil.copyfileobj(src_file, temp_file, CDC_SEGMENT_SIZE)
+            yield temp_path
+        finally:
+            os.remove(temp_path)
+
+    def download_url(self, name, file_name, as_attachment, content_type):
+        """分块保存的文件需由应用拼接输出，不提供直链"""
+        if AssetManifest.objects.filter(name=name).exists():
+            return None
+        return self.inner.download_url(name, file_name, as_attachment, content_type)
+
+    def _write_chunk_file(self, chunk_hash, data):
+        """经由暂存文件写入一个新分块（本地存储时与存储目录同盘，直接重命名）"""
+        temp_dir = os.path.join(settings.MEDIA_ROOT, UPLOAD_TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix='.chunk')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+            self.inner.save(chunk_rel_path(chunk_hash), temp_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _flush_chunks(self, batch, taken_refs, written_sizes):
+        """
+        写入一批分块并累加引用（在事务之外进行）
+        先为已有分块加引用（加上后不会再被回收认领），其余的写入存储后再创建记录
+        :param taken_refs: 已累加的引用 {分块哈希: 次数}，本批累加的引用计入其中
+        :param written_sizes: 已写入存储但尚未创建记录的分块 {分块哈希: 大小}
+        """
+        ref_counts = Counter(chunk_hash for chunk_hash, _ in batch)
+        existing = AssetChunk.reserve(ref_counts)
+        for chunk_hash in existing:
+            taken_refs[chunk_hash] = taken_refs.get(chunk_hash, 0) + ref_counts[chunk_hash]
+
+        new_chunks = {}
+        for chunk_hash, data in batch:
+            if chunk_hash not in existing and chunk_hash not in new_chunks:
+                self._write_chunk_file(chunk_hash, data)
+                new_chunks[chunk_hash] = written_sizes[chunk_hash] = len(data)
+
+        # 并发写入了相同分块时忽略冲突后统一累加引用
+        new_refs = {chunk_hash: ref_counts[chunk_hash] for chunk_hash in new_chunks}
+        with transaction.atomic():
+            AssetChunk.objects.bulk_create([
+                AssetChunk(chunk_hash=chunk_hash, size=size, file_path=chunk_rel_path(chunk_hash), ref_count=0)
+                for chunk_hash, size in new_chunks.items()
+            ], ignore_conflicts=True)
+            if AssetChunk.add_refs(new_refs) != len(new_refs):
+                raise ContentBusyError('相同分块正在被回收，请稍后重试')
+        for chunk_hash, count in new_refs.items():
+            taken_refs[chunk_hash] = taken_refs.get(chunk_hash, 0) + count
+            del written_sizes[chunk_hash]
+
+    @staticmethod
+    def _abandon_chunk_files(chunk_sizes):
+        """为已写入存储、但未能创建记录的分块补建零引用记录，保留期后由垃圾回收删除文件"""
+        AssetChunk.objects.bulk_create([
+            AssetChunk(chunk_hash=chunk_hash, size=size, file_path=chunk_rel_path(chunk_hash), ref_count=0,
+                       unreferenced_at=timezone.now())
+            for chunk_hash, size in chunk_sizes.items()
+        ], ignore_conflicts=True)
+
+    def _write_chunked(self, name, file_obj):
+        """
+        切块写入文件并创建清单（须在事务之外调用，同 store_blob）
+        分块按批写入并累加引用，全部写完后在一个事务中创建清单；失败时释放已累加的引用，
+        已写入但未登记的分块补建零引用记录，都在保留期后由 gc_asset_blobs 回收
+        """
+        taken_refs = {}
+        written_sizes = {}
+        entries = []
+        offset = 0
+        try:
+            batch = []
+            batch_size = 0
+            for data in iter_chunks(file_obj):
+                chunk_hash = hashlib.sha256(data).hexdigest()
+                entries.append(AssetManifestChunk(manifest_id=name, seq=len(entries), offset=offset,
+                                                  chunk_id=chunk_hash))
+                offset += len(data)
+                batch.append((chunk_hash, data))
+                batch_size += len(data)
+                if batch_size >= CHUNK_WRITE_BATCH_BYTES:
+                    self._flush_chunks(batch, taken_refs, written_sizes)
+                    batch = []
+                    batch_size = 0
+            if batch:
+                self._flush_chunks(batch, taken_refs, written_sizes)
+
+            try:
+                with transaction.atomic():
+                    manifest = AssetManifest.objects.create(name=name, file_size=offset, chunk_count=len(entries))
+                    AssetManifestChunk.objects.bulk_create(entries)
+                return manifest
+            except IntegrityError:
+                manifest = self._manifest(name)
+                if manifest is None:
+                    raise
+        except BaseException:
+            AssetChunk.release_refs(taken_refs)
+            self._abandon_chunk_files(written_sizes)
+            raise
+
+        # 并发写入了同名文件（存储键由内容哈希决定，内容一致），使用对方的清单
+        AssetChunk.release_refs(taken_refs)
+        return manifest
@@ -0,0 +1,212 @@
+"""
+分片上传完成
+分片合并后需要整文件哈希用于去重：
+- 客户端在初始化时提供了哈希且与已有内容（哈希、大小均一致）相同时直接引用，与秒传相同，不读取文件
+- 整文件哈希在分片上传时按分片顺序累计（见 begin_part_hash / record_part_hash），
+  按顺序到达的分片在接收时顺带计入，完成时无需再次读取合并后的文件；
+  乱序到达的分片在前面的空缺补齐后从本地暂存文件读取该分片计入（每个分片最多读取一次）
+- 累计进度保存在当前 worker 进程内存中，分片落在不同进程、进程重启或对象存储上乱序上传时不完整，
+  此时退回读取暂存文件计算：本地存储在请求内完成；对象存储需完整下载对象，改在后台线程池中进行，
+  请求立即返回“合并中”，客户端轮询上传进度直到会话完成（asset_id 即生成的资源）
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .blob_store import stored_blob
+from .models import AssetBlob, UploadSession
+from .storage import get_asset_storage
+from .upload_utils import IO_BLOCK_SIZE, hash_stream, new_file_hash, save_asset_record
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# 每个进程最多保留的累计哈希数（超出时丢弃最早的，对应会话完成时退回读取文件）
+MAX_RUNNING_HASHES = 1024
+
+_running_hashes = OrderedDict()
+_running_hashes_lock = threading.Lock()
+
+
+def _get_executor():
+    """懒加载后台入库线程池（每个 worker 进程各自持有）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.ASSET_UPLOAD_COMPLETE_WORKERS)
+        return _executor
+
+
+class _RunningHash:
+    """会话的整文件哈希累计进度：按顺序计入了前 next_part 个分片"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.file_hash = new_file_hash()
+        self.next_part = 0
+        self.checksums = []
+
+
+def _get_running_hash(session_id, create=False):
+    with _running_hashes_lock:
+        state = _running_hashes.get(session_id)
+        if state is None and create:
+            state = _running_hashes[session_id] = _RunningHash()
+            while len(_running_hashes) > MAX_RUNNING_HASHES:
+                _running_hashes.popitem(last=False)
+        return state
+
+
+def discard_running_hash(session_id):
+    """丢弃会话的累计哈希（会话取消、过期或分片内容变化时）"""
+    with _running_hashes_lock:
+        _running_hashes.pop(session_id, None)
+
+
+def begin_part_hash(session, part_number):
+    """
+    分片正好是下一个待计入的分片时，返回累计哈希的副本，由调用方在接收分片时顺带更新
+    分片校验失败时直接丢弃副本即可；其他情况返回 None
+    """
+    state = _get_running_hash(session.id, create=part_number == 0)
+    if state is None:
+        return None
+    with state.lock:
+        if state.next_part != part_number:
+            return None
+        return state.file_hash.copy()
+
+
+def record_part_hash(session, part_number, checksum, part_hash):
+    """
+    分片写入并记录后调用，推进累计哈希
+    :param part_hash: begin_part_hash 返回并已计入该分片数据的哈希，未计入时为 None
+    """
+    state = _get_running_hash(session.id)
+    if state is None:
+        return
+    with state.lock:
+        if part_number < state.next_part:
+            # 已计入的分片被重传：内容不同时累计结果作废
+            if state.checksums[part_number] != checksum:
+                discard_running_hash(session.id)
+            return
+        if part_hash is None or part_number != state.next_part:
+            return
+        state.file_hash = part_hash
+        state.checksums.append(checksum)
+        state.next_part += 1
+        _catch_up_parts(session, state)
+
+
+def _catch_up_parts(session, state):
+    """空缺补齐后，从本地暂存文件依次计入之前乱序到达的分片（对象存储合并前无法读取，跳过）"""
+    staged_path = get_asset_storage().path(session.staging_name)
+    if staged_path is None:
+        return
+    uploaded = dict(session.parts.filter(part_number__gte=state.next_part).values_list('part_number', 'checksum'))
+    if state.next_part not in uploaded:
+        return
+    with open(staged_path, 'rb') as staged_file:
+        while state.next_part in uploaded:
+            staged_file.seek(session.part_offset(state.next_part))
+            remaining = session.part_length(state.next_part)
+            while remaining > 0:
+                block = staged_file.read(min(IO_BLOCK_SIZE, remaining))
+                if not block:
+                    raise IOError('暂存文件长度不足')
+                state.file_hash.update(block)
+                remaining -= len(block)
+            state.checksums.append(uploaded[state.next_part])
+            state.next_part += 1
+
+
+def take_running_hash(session):
+    """取出会话的累计哈希：全部分片均已计入时返回十六进制哈希，否则返回 None"""
+    with _running_hashes_lock:
+        state = _running_hashes.pop(session.id, None)
+    if state is None:
+        return None
+    with state.lock:
+        if state.next_part != session.total_parts:
+            return None
+        return state.file_hash.hexdigest()
+
+
+def _create_asset(session, blob):
+    """创建资源记录并将会话标记为已完成"""
+    with transaction.atomic():
+        asset = save_asset_record(
+            blob,
+            session.file_name,
+            source_type=session.source_type,
+            linked_article_id=session.linked_article_id
+        )
+        session.status = 'completed'
+        session.asset_id = asset.id
+        session.save(update_fields=['status', 'asset_id', 'updated_at'])
+        session.parts.all().delete()
+    return asset
+
+
+def reuse_known_content(session):
+    """
+    客户端提供的哈希与已有内容一致时直接引用并创建资源，返回资源；不一致或未提供时返回 None
+    与秒传相同，只比对哈希与大小，不读取暂存文件
+    """
+    if not session.file_hash or not AssetBlob.add_ref(session.file_hash, file_size=session.file_size):
+        return None
+    try:
+        asset = _create_asset(session, AssetBlob.objects.get(file_hash=session.file_hash))
+    except BaseException:
+        AssetBlob.release(session.file_hash)
+        raise
+    get_asset_storage().delete(session.staging_name)
+    return asset
+
+
+def store_session_file(session, file_hash_hex=None):
+    """
+    存入内容寻址存储并创建资源记录（须在事务之外调用，见 store_blob）
+    :param file_hash_hex: 上传时累计的整文件哈希，未提供时读取已合并的暂存文件计算
+    :return: (Asset 对象, 内容是否新写入)
+    """
+    storage = get_asset_storage()
+    if file_hash_hex is None:
+        staged_file = storage.open(session.staging_name)
+        try:
+            file_hash_hex = hash_stream(staged_file)
+        finally:
+            staged_file.close()
+
+    # 本地同盘重命名 / 对象存储服务端复制，内容重复时只增加引用，资源记录创建失败时释放引用
+    with stored_blob(file_hash_hex, session.file_size, staged_name=session.staging_name) as (blob, created):
+        asset = _create_asset(session, blob)
+
+    # 内容已存在时暂存文件未被移动，资源创建成功后再删除
+    if not created:
+        storage.delete(session.staging_name)
+    return asset, created
+
+
+def _store_in_worker(session_id):
+    """
+    线程池任务：失败时恢复为上传中，客户端可重新调用完成接口
+    线程中的数据库连接不会被请求结束信号关闭，用完即关
+    """
+    try:
+        session = UploadSession.objects.get(id=session_id, status='completing')
+        store_session_file(session)
+    except Exception as e:
+        print(f"分片上传入库失败: {session_id}: {str(e)}")
+        UploadSession.objects.filter(id=session_id, status='completing').update(status='uploading')
+    finally:
+        connection.close()
+
+
+def schedule_session_store(session_id):
+    """在后台计算哈希并入库（会话已由调用方认领为合并中）"""
+    _get_executor().submit(_store_in_worker, session_id)
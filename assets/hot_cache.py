@@ -0,0 +1,138 @@
+"""
+热点小文件内存缓存
+文章中的内联图片每次渲染都会请求 /api/resource/view/<id>，这里在进程内缓存小文件的内容：
+- 以 (内容哈希, 缩略图参数) 为键，内容不变则条目不变，相同内容的资源共用条目，命中时不读取磁盘
+- 资源ID先经主键查询解析为内容哈希并确认有效：任一进程删除 / 替换资源后立即生效，不会返回旧内容
+- 按条目数与总字节数双重限制，超出时淘汰最久未使用的条目（LRU），条目超过 ASSET_HOT_CACHE_TTL 秒过期
+- 支持 If-None-Match 协商，命中时直接返回 304
+缓存为每个 worker 进程独立持有。
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from .streaming import etag_matches, not_modified_response
+
+# 缓存的响应头（Content-Length 由响应自行计算）
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Content-Disposition', 'Cache-Control')
+
+CachedAsset = namedtuple('CachedAsset', ['body', 'headers', 'expires_at'])
+
+
+class HotAssetCache:
+    """
+    线程安全的 LRU 缓存
+    :param max_bytes: 缓存内容总字节数上限
+    :param max_entries: 条目数上限
+    :param ttl: 条目有效期（秒）
+    """
+
+    def __init__(self, max_bytes, max_entries, ttl):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """获取条目并标记为最近使用，过期时删除"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, headers):
+        """写入条目，必要时淘汰最久未使用的条目"""
+        if len(body) > self.max_bytes:
+            return None
+        entry = CachedAsset(body, headers, time.monotonic() + self.ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.total_bytes += len(body)
+            while self.total_bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= len(entry.body)
+
+
+_hot_cache = None
+_hot_cache_lock = threading.Lock()
+
+
+def get_hot_cache():
+    """获取当前进程的热点缓存"""
+    global _hot_cache
+    if _hot_cache is None:
+        with _hot_cache_lock:
+            if _hot_cache is None:
+                _hot_cache = HotAssetCache(
+                    max_bytes=settings.ASSET_HOT_CACHE_MAX_BYTES,
+                    max_entries=settings.ASSET_HOT_CACHE_MAX_ENTRIES,
+                    ttl=settings.ASSET_HOT_CACHE_TTL
+                )
+    return _hot_cache
+
+
+def hot_cache_key(file_hash, variant=None):
+    """缓存键：内容哈希 + 缩略图参数 (宽, 高, 格式)，原文件为 None"""
+    return file_hash, variant
+
+
+def is_hot_cacheable(request):
+    """Range 请求不走缓存（小文件整体返回即可，交给常规流程处理）"""
+    return 'HTTP_RANGE' not in request.META
+
+
+def build_cached_response(request, entry, headers=None):
+    """
+    由缓存条目构建响应，If-None-Match 命中时返回 304
+    :param headers: 响应头，默认使用条目中缓存的响应头
+    """
+    headers = entry.headers if headers is None else headers
+    etag = headers.get('ETag')
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+
+    response = HttpResponse(entry.body)
+    for header, value in headers.items():
+        if header in CACHED_HEADERS:
+            response[header] = value
+    return response
+
+
+def cache_file(key, file_obj, headers):
+    """
+    读取小文件内容写入缓存
+    :param file_obj: 已打开的二进制文件对象（由本函数关闭）
+    :param headers: 响应头，只保留 CACHED_HEADERS 中的项
+    :return: 缓存条目
+    """
+    try:
+        body = file_obj.read()
+    finally:
+        file_obj.close()
+    headers = {header: value for header, value in headers.items() if header in CACHED_HEADERS}
+    return get_hot_cache().put(key, body, headers) or CachedAsset(body, headers, 0)
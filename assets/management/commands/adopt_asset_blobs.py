@@ -0,0 +1,63 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from assets.blob_store import stored_blob
+from assets.models import Asset
+from assets.upload_utils import hash_file
+
+
+class Command(BaseCommand):
+    """
+    将旧版按资源单独存放的文件迁移到内容寻址存储
+    重新计算文件哈希（旧数据为 MD5），相同内容合并为一个存储块，多余的副本直接删除。
+    """
+    help = '将未使用内容寻址存储的旧资源文件迁移为共享存储块'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='每批处理的资源数量')
+        parser.add_argument('--sleep', type=float, default=0, help='每个文件处理后的休眠秒数，用于限速')
+
+    def handle(self, *args, **options):
+        adopted_count = 0
+        missing_count = 0
+        last_id = ''
+
+        while True:
+            assets = list(
+                Asset.objects.filter(blob__isnull=True, is_valid=True, id__gt=last_id)
+                .order_by('id')[:options['batch_size']]
+            )
+            if not assets:
+                break
+
+            for asset in assets:
+                last_id = asset.id
+                abs_file_path = os.path.join(settings.MEDIA_ROOT, asset.file_path)
+                if not os.path.exists(abs_file_path):
+                    missing_count += 1
+                    self.stdout.write(self.style.WARNING(f"文件不存在，跳过: {asset.id} {asset.file_path}"))
+                    continue
+
+                file_hash = hash_file(abs_file_path)
+                # 存储块在事务之外写入，资源更新失败时释放引用
+                with stored_blob(file_hash, os.path.getsize(abs_file_path), abs_file_path) as (blob, _), \
+                        transaction.atomic():
+                    asset.blob = blob
+                    asset.file_hash = blob.file_hash
+                    asset.file_path = blob.file_path
+                    asset.file_size = blob.file_size
+                    asset.save(update_fields=['blob', 'file_hash', 'file_path', 'file_size'])
+
+                # 内容已存在时原文件未被移动，删除多余的副本
+                if os.path.exists(abs_file_path):
+                    os.remove(abs_file_path)
+
+                adopted_count += 1
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"已迁移 {adopted_count} 个资源，{missing_count} 个文件缺失"))
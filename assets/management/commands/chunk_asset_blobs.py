@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from assets.models import AssetBlob, AssetManifest
+from assets.storage import get_asset_storage
+
+
+class Command(BaseCommand):
+    """
+    将已整文件保存的大存储块改为分块保存
+    开启分块去重前上传的文件不会自动转换，由本命令处理后才能与新版本共享分块；可重复执行，已转换的会被跳过。
+    """
+    help = '将不小于 ASSET_CHUNK_DEDUP_MIN_SIZE 的整文件存储块转换为分块保存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='每批处理的存储块数量')
+        parser.add_argument('--sleep', type=float, default=0, help='每个文件处理后的休眠秒数，用于限速')
+
+    def handle(self, *args, **options):
+        if not settings.ASSET_CHUNK_DEDUP_ENABLED:
+            raise CommandError('未开启分块去重存储（ASSET_CHUNK_DEDUP_ENABLED）')
+
+        storage = get_asset_storage()
+        converted_count = 0
+        skipped_count = 0
+        last_hash = ''
+
+        while True:
+            blobs = list(
+                AssetBlob.objects.filter(file_hash__gt=last_hash, file_size__gte=settings.ASSET_CHUNK_DEDUP_MIN_SIZE)
+                .exclude(file_path__in=AssetManifest.objects.values('name'))
+                .order_by('file_hash')[:options['batch_size']]
+            )
+            if not blobs:
+                break
+
+            for blob in blobs:
+                last_hash = blob.file_hash
+                if not storage.inner.exists(blob.file_path):
+                    skipped_count += 1
+                    self.stdout.write(self.style.WARNING(f"文件不存在，跳过: {blob.file_path}"))
+                    continue
+
+                storage.convert(blob.file_path)
+                converted_count += 1
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"已转换 {converted_count} 个存储块，{skipped_count} 个文件缺失"
+        ))
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from assets.metadata import extract_asset_metadata, get_extractable_assets
+
+
+def _extract(asset_id):
+    try:
+        return extract_asset_metadata(asset_id)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    """
+    补齐资源元数据
+    上传后的后台提取任务在进程重启时可能丢失，历史资源也从未提取过，由本命令统一处理。
+    """
+    help = '为尚未提取元数据的资源提取图片尺寸、PDF 页数、音视频时长等信息'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='并发提取的线程数')
+        parser.add_argument('--batch-size', type=int, default=100, help='每批处理的资源数量')
+
+    def handle(self, *args, **options):
+        succeeded = 0
+        failed = 0
+        last_id = ''
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                asset_ids = list(
+                    get_extractable_assets().filter(id__gt=last_id)
+                    .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+                )
+                if not asset_ids:
+                    break
+                last_id = asset_ids[-1]
+
+                for ok in executor.map(_extract, asset_ids):
+                    if ok:
+                        succeeded += 1
+                    else:
+                        failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"已提取 {succeeded} 个资源的元数据，{failed} 个失败"))
@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from assets.text_index import get_unindexed_assets, index_asset_text
+
+
+def _index(asset):
+    try:
+        text = index_asset_text(asset)
+        return text.status if text is not None else None
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    """
+    补齐文档文本提取
+    上传后的后台提取任务在进程重启时可能丢失，历史文档也从未提取过，由本命令统一处理。
+    文本提取在进程池中执行，并发数为 ASSET_TEXT_WORKERS。
+    """
+    help = '为尚未提取文本的 PDF / DOCX / TXT / MD / CSV 资源提取正文'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='每批处理的资源数量')
+
+    def handle(self, *args, **options):
+        done_count = 0
+        failed_count = 0
+        last_id = ''
+
+        with ThreadPoolExecutor(max_workers=settings.ASSET_TEXT_WORKERS) as executor:
+            while True:
+                assets = list(get_unindexed_assets().filter(id__gt=last_id).order_by('id')[:options['batch_size']])
+                if not assets:
+                    break
+                last_id = assets[-1].id
+
+                # 相同内容的资源只提取一次
+                unique_assets = list({asset.file_hash: asset for asset in assets}.values())
+                for status in executor.map(_index, unique_assets):
+                    if status == 'done':
+                        done_count += 1
+                    elif status == 'failed':
+                        failed_count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"已提取 {done_count} 个文档，{failed_count} 个失败"))
@@ -0,0 +1,84 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from assets.blob_store import delete_blob_file
+from assets.models import AssetBlob, AssetChunk
+from assets.storage import get_asset_storage
+
+
+class Command(BaseCommand):
+    """
+    回收无引用的内容存储块（及分块去重存储中无引用的分块）
+    引用计数归零超过保留期（默认 ASSET_BLOB_GC_GRACE_HOURS）的存储块 / 分块才会被删除，
+    按批次处理并限制每秒删除数量，避免集中删除占满磁盘 IO。
+    中断后重新执行会继续处理已认领（回收中）的存储块 / 分块，期间上传相同内容会等待并可能提示稍后重试。
+    """
+    help = '回收引用计数归零且超过保留期的内容存储块'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=settings.ASSET_BLOB_GC_GRACE_HOURS,
+                            help='引用归零后的保留时间（小时）')
+        parser.add_argument('--batch-size', type=int, default=100, help='每批处理的存储块数量')
+        parser.add_argument('--max-per-second', type=float, default=20, help='每秒最多删除的文件数量')
+        parser.add_argument('--dry-run', action='store_true', help='只列出可回收的存储块，不删除')
+
+    def handle(self, *args, **options):
+        grace_seconds = options['grace_hours'] * 3600
+        interval = 1 / options['max_per_second'] if options['max_per_second'] > 0 else 0
+        deleted_count = 0
+        freed_size = 0
+
+        while True:
+            blobs = list(AssetBlob.get_collectable(grace_seconds).order_by('unreferenced_at')[:options['batch_size']])
+            if not blobs:
+                break
+
+            for blob in blobs:
+                if options['dry_run']:
+                    self.stdout.write(f"{blob.file_path} ({blob.file_size} 字节)")
+                    continue
+
+                # 先认领（条件 UPDATE 标记为回收中，被重新引用的跳过），认领后不会再被引用；
+                # 删除文件后再删除记录，期间写入相同内容的一方等待记录删除后重新写入，新文件不会被误删
+                if AssetBlob.claim(blob.file_hash, grace_seconds):
+                    delete_blob_file(blob)
+                    AssetBlob.objects.filter(file_hash=blob.file_hash, is_deleting=True).delete()
+                    deleted_count += 1
+                    freed_size += blob.file_size
+                    if interval:
+                        time.sleep(interval)
+
+            if options['dry_run']:
+                break
+
+        # 分块：存储块删除时释放了清单对分块的引用，归零的分块同样过了保留期才删除
+        storage = get_asset_storage()
+        chunk_count = 0
+        chunk_freed_size = 0
+        while True:
+            chunks = list(AssetChunk.get_collectable(grace_seconds).order_by('unreferenced_at')[:options['batch_size']])
+            if not chunks:
+                break
+
+            for chunk in chunks:
+                if options['dry_run']:
+                    self.stdout.write(f"{chunk.file_path} ({chunk.size} 字节)")
+                    continue
+
+                # 与存储块相同：认领后删除文件，再删除记录
+                if AssetChunk.claim(chunk.chunk_hash, grace_seconds):
+                    storage.delete(chunk.file_path)
+                    AssetChunk.objects.filter(chunk_hash=chunk.chunk_hash, is_deleting=True).delete()
+                    chunk_count += 1
+                    chunk_freed_size += chunk.size
+                    if interval:
+                        time.sleep(interval)
+
+            if options['dry_run']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(
+            f"已回收 {deleted_count} 个存储块，释放 {freed_size} 字节；{chunk_count} 个分块，释放 {chunk_freed_size} 字节"
+        ))
@@ -0,0 +1,54 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from assets.models import AssetBlob
+from assets.storage import get_asset_storage
+
+
+class Command(BaseCommand):
+    """
+    将本地磁盘（MEDIA_ROOT）中的存储块迁移到当前配置的存储后端
+    存储键不变，上传成功后删除本地文件；可重复执行，已迁移的存储块会被跳过。
+    旧版未使用内容寻址存储的资源请先执行 adopt_asset_blobs。
+    """
+    help = '将本地存储块迁移到 ASSET_STORAGE_BACKEND 配置的存储后端'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='每批处理的存储块数量')
+        parser.add_argument('--sleep', type=float, default=0, help='每个文件上传后的休眠秒数，用于限速')
+
+    def handle(self, *args, **options):
+        storage = get_asset_storage()
+        if storage.path('') is not None:
+            raise CommandError('当前存储后端为本地磁盘，无需迁移')
+
+        migrated_count = 0
+        skipped_count = 0
+        last_hash = ''
+
+        while True:
+            blobs = list(
+                AssetBlob.objects.filter(file_hash__gt=last_hash)
+                .order_by('file_hash')[:options['batch_size']]
+            )
+            if not blobs:
+                break
+
+            for blob in blobs:
+                last_hash = blob.file_hash
+                abs_file_path = os.path.join(settings.MEDIA_ROOT, blob.file_path)
+                if not os.path.exists(abs_file_path):
+                    skipped_count += 1
+                    continue
+
+                storage.save(blob.file_path, abs_file_path)
+                migrated_count += 1
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"已迁移 {migrated_count} 个存储块，{skipped_count} 个不在本地（已迁移或缺失）"
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from assets.models import Asset, AssetUsage
+
+
+class Command(BaseCommand):
+    """
+    根据资源表重新计算空间占用统计
+    统计出现偏差时用于校正；首次启用增量统计时缺失的统计会在使用时自动补建，无需执行。
+    """
+    help = '根据有效资源重新计算按上传者和类型的空间占用统计'
+
+    def handle(self, *args, **options):
+        rows = (
+            Asset.objects.filter(is_valid=True)
+            .order_by()
+            .values('uploader', 'file_type')
+            .annotate(file_count=Count('id'), total_size=Sum('file_size'))
+        )
+
+        with transaction.atomic():
+            AssetUsage.objects.all().delete()
+            AssetUsage.objects.bulk_create([
+                AssetUsage(
+                    uploader=row['uploader'],
+                    file_type=row['file_type'],
+                    file_count=row['file_count'],
+                    total_size=row['total_size'] or 0
+                )
+                for row in rows
+            ])
+
+        self.stdout.write(self.style.SUCCESS(f"已重建 {len(rows)} 条空间统计"))
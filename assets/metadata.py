@@ -0,0 +1,161 @@
+"""
+资源元数据提取
+上传完成（事务提交）后在后台线程池中提取，写入 Asset.metadata，列表页无需下载原文件即可排版预览：
+- 图片：宽高（已按 EXIF 方向校正）、格式、拍摄时间与设备
+- PDF：页数、标题
+- 音频 / 视频：时长、码率等，只读取容器头部信息
+相同内容（文件哈希一致）的资源直接复用已提取的结果。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Asset
+from .storage import get_asset_storage
+
+# EXIF 标签
+EXIF_ORIENTATION = 0x0112
+EXIF_MAKE = 0x010F
+EXIF_MODEL = 0x0110
+EXIF_DATETIME = 0x0132
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """懒加载提取线程池（每个 worker 进程各自持有）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.ASSET_METADATA_WORKERS)
+        return _executor
+
+
+def extract_image_metadata(file_path):
+    """图片宽高与常用 EXIF 信息（只解析文件头，不解码像素）"""
+    from PIL import Image
+
+    with Image.open(file_path) as image:
+        width, height = image.size
+        exif = image.getexif()
+        metadata = {'width': width, 'height': height, 'format': image.format}
+
+    # 方向为 5~8 时图片需旋转 90 度显示，宽高互换
+    orientation = exif.get(EXIF_ORIENTATION)
+    if orientation in (5, 6, 7, 8):
+        metadata['width'], metadata['height'] = height, width
+
+    taken_at = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+    camera = ' '.join(str(exif[tag]).strip() for tag in (EXIF_MAKE, EXIF_MODEL) if exif.get(tag))
+    if taken_at:
+        metadata['taken_at'] = str(taken_at).strip()
+    if camera:
+        metadata['camera'] = camera
+    return metadata
+
+
+def extract_pdf_metadata(file_path):
+    """PDF 页数与标题（按需解析交叉引用表，不读取页面内容）"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    metadata = {'page_count': len(reader.pages)}
+    title = reader.metadata.title if reader.metadata else None
+    if title:
+        metadata['title'] = str(title)
+    return metadata
+
+
+def extract_media_metadata(file_path):
+    """音频 / 视频时长等信息（读取容器头部，不解码媒体数据）"""
+    import mutagen
+
+    media = mutagen.File(file_path)
+    if media is None or media.info is None:
+        return {}
+
+    metadata = {'duration': round(media.info.length, 3)}
+    for key in ('bitrate', 'sample_rate', 'channels'):
+        value = getattr(media.info, key, None)
+        if value:
+            metadata[key] = value
+    return metadata
+
+
+def extract_metadata(file_path, file_type, file_extension):
+    """
+    按资源类型提取元数据
+    :return: 元数据字典，不支持的类型返回空字典
+    """
+    if file_type == 'image' and file_extension != '.svg':
+        return extract_image_metadata(file_path)
+    if file_extension == '.pdf':
+        return extract_pdf_metadata(file_path)
+    if file_type in ('audio', 'video'):
+        return extract_media_metadata(file_path)
+    return {}
+
+
+def extract_asset_metadata(asset_id):
+    """
+    提取单个资源的元数据并写入数据库；已有的元数据键不会被覆盖
+    :return: 是否成功
+    """
+    try:
+        asset = Asset.objects.get(id=asset_id)
+
+        # 相同内容已提取过时直接复用
+        sibling = (
+            Asset.objects.filter(file_hash=asset.file_hash, metadata_extracted_at__isnull=False)
+            .exclude(id=asset.id)
+            .only('metadata')
+            .first()
+        ) if asset.file_hash else None
+        if sibling is not None:
+            metadata = sibling.metadata
+        else:
+            with get_asset_storage().local_copy(asset.file_path) as file_path:
+                try:
+                    metadata = extract_metadata(file_path, asset.file_type, asset.file_extension)
+                except Exception as e:
+                    # 文件无法解析（损坏或格式不符）时记为已提取，避免反复重试
+                    print(f"解析资源元数据失败: {asset_id}: {str(e)}")
+                    metadata = {}
+
+        Asset.objects.filter(id=asset.id).update(
+            metadata={**metadata, **asset.metadata},
+            metadata_extracted_at=timezone.now()
+        )
+        return True
+    except Exception as e:
+        print(f"提取资源元数据失败: {asset_id}: {str(e)}")
+        return False
+
+
+def _extract_in_worker(asset_id):
+    """线程池任务：线程中的数据库连接不会被请求结束信号关闭，用完即关"""
+    try:
+        extract_asset_metadata(asset_id)
+    finally:
+        connection.close()
+
+
+def schedule_metadata_extraction(asset_ids):
+    """在当前事务提交后提交后台提取任务（未完成的任务可由 extract_asset_metadata 命令补齐）"""
+    def submit():
+        executor = _get_executor()
+        for asset_id in asset_ids:
+            executor.submit(_extract_in_worker, asset_id)
+
+    transaction.on_commit(submit)
+
+
+def get_extractable_assets():
+    """尚未提取元数据的资源"""
+    return Asset.objects.filter(is_valid=True, metadata_extracted_at__isnull=True)
@@ -1,5 +1,270 @@
-from django.db import models
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
 from article.models import Article
+from utils.id_generator import generate_upload_id
+
+# 上传暂存目录（相对于 MEDIA_ROOT；分片上传时为存储后端中的存储键前缀）
+UPLOAD_TEMP_DIR = '.uploads'
+# 内容寻址存储的存储块目录（存储键前缀）
+BLOB_DIR = 'blobs'
+
+# 等待回收中的内容删除完成时的轮询间隔（秒）
+GC_WAIT_INTERVAL = 0.2
+
+
+class ContentBusyError(Exception):
+    """相同内容正在被垃圾回收，等待其删除完成超时"""
+
+
+def wait_until_collected(queryset):
+    """
+    等待回收中的记录被 gc_asset_blobs 删除，超过 ASSET_BLOB_GC_WAIT_TIMEOUT 秒抛出 ContentBusyError
+    须在事务之外调用：事务内看不到回收进程随后的提交，SQLite 下还会与其争用写锁
+    """
+    deadline = time.monotonic() + settings.ASSET_BLOB_GC_WAIT_TIMEOUT
+    while queryset.exists():
+        if time.monotonic() >= deadline:
+            raise ContentBusyError('相同内容正在被回收，请稍后重试')
+        time.sleep(GC_WAIT_INTERVAL)
+
+
+class RefCountedContent(models.Model):
+    """
+    以内容哈希为主键、按引用计数回收的内容（存储块 / 分块）
+    回收分三步：gc_asset_blobs 以条件 UPDATE 认领（标记回收中）→ 删除文件 → 删除记录。
+    回收中的记录不能再被引用，写入相同内容的一方等待记录删除后重新写入文件，新文件不会被回收删除。
+    """
+
+    # 引用计数归零超过保留期由 gc_asset_blobs 命令清理
+    ref_count = models.IntegerField(default=0, verbose_name='引用计数')
+    unreferenced_at = models.DateTimeField(null=True, blank=True, verbose_name='引用归零时间')
+    is_deleting = models.BooleanField(default=False, verbose_name='回收中')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def add_refs(cls, ref_counts):
+        """按哈希一次性累加多个记录的引用计数（单条 UPDATE），回收中的不计入，返回更新的记录数"""
+        if not ref_counts:
+            return 0
+        return cls.objects.filter(pk__in=ref_counts, is_deleting=False).update(
+            ref_count=F('ref_count') + Case(
+                *[When(pk=key, then=Value(count)) for key, count in ref_counts.items()],
+                default=Value(0),
+                output_field=IntegerField()
+            ),
+            unreferenced_at=None
+        )
+
+    @classmethod
+    def release_refs(cls, ref_counts):
+        """按哈希一次性减少多个记录的引用计数，归零的记录时间作为垃圾回收保留期的起点"""
+        if not ref_counts:
+            return
+        with transaction.atomic():
+            cls.objects.filter(pk__in=ref_counts).update(
+                ref_count=F('ref_count') - Case(
+                    *[When(pk=key, then=Value(count)) for key, count in ref_counts.items()],
+                    default=Value(0),
+                    output_field=IntegerField()
+                )
+            )
+            cls.objects.filter(pk__in=ref_counts, ref_count__lte=0, unreferenced_at__isnull=True).update(
+                unreferenced_at=timezone.now()
+            )
+
+    @classmethod
+    def reserve(cls, ref_counts):
+        """
+        写入内容前为已有记录累加引用，返回已引用的哈希集合，其余哈希由调用方写入新内容
+        引用成功后计数大于 0，不会再被回收认领；相同内容正在回收时等待其删除完成（须在事务之外调用）
+        """
+        with transaction.atomic():
+            existing = set(
+                cls.objects.select_for_update()
+                .filter(pk__in=ref_counts, is_deleting=False)
+                .values_list('pk', flat=True)
+            )
+            cls.add_refs({key: ref_counts[key] for key in existing})
+        wait_until_collected(cls.objects.filter(pk__in=set(ref_counts) - existing, is_deleting=True))
+        return existing
+
+    @classmethod
+    def get_collectable(cls, grace_seconds):
+        """获取引用归零且超过保留期、可以回收的记录（含已认领但未删完的，中断的回收可以继续）"""
+        expire_before = timezone.now() - timedelta(seconds=grace_seconds)
+        return cls.objects.filter(ref_count=0, unreferenced_at__lt=expire_before)
+
+    @classmethod
+    def claim(cls, key, grace_seconds):
+        """认领一条可回收的记录（条件 UPDATE 标记为回收中），返回是否认领成功；被重新引用的不会被认领"""
+        return cls.get_collectable(grace_seconds).filter(pk=key).update(is_deleting=True) > 0
+
+
+class AssetBlob(RefCountedContent):
+    """内容存储块 - 以文件哈希为键，相同内容在磁盘上只保存一份，由多个资源共享（引用计数为有效资源的数量）"""
+
+    file_hash = models.CharField(max_length=64, primary_key=True, verbose_name='文件哈希值')
+    file_size = models.BigIntegerField(verbose_name='文件大小(字节)')
+    file_path = models.CharField(max_length=500, verbose_name='文件存储路径')
+
+    class Meta:
+        db_table = 'asset_blob'
+        verbose_name = '内容存储块'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['ref_count', 'unreferenced_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.file_hash} (refs={self.ref_count})"
+
+    @classmethod
+    def add_ref(cls, file_hash, file_size=None):
+        """增加一次引用，返回存储块是否存在；指定 file_size 时大小不一致视为不存在，回收中的视为不存在"""
+        queryset = cls.objects.filter(file_hash=file_hash, is_deleting=False)
+        if file_size is not None:
+            queryset = queryset.filter(file_size=file_size)
+        return queryset.update(
+            ref_count=F('ref_count') + 1,
+            unreferenced_at=None
+        ) > 0
+
+    @classmethod
+    def release(cls, file_hash):
+        """减少一次引用，归零时记录时间，作为垃圾回收保留期的起点"""
+        cls.objects.filter(file_hash=file_hash, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        cls.objects.filter(file_hash=file_hash, ref_count=0, unreferenced_at__isnull=True).update(
+            unreferenced_at=timezone.now()
+        )
+
+
+class AssetChunk(RefCountedContent):
+    """内容分块 - 分块去重存储中按内容切分的数据块，以块哈希为键，由多个分块文件共享（引用计数为清单中引用该块的次数）"""
+
+    chunk_hash = models.CharField(max_length=64, primary_key=True, verbose_name='分块哈希值')
+    size = models.IntegerField(verbose_name='分块大小(字节)')
+    file_path = models.CharField(max_length=500, verbose_name='分块存储路径')
+
+    class Meta:
+        db_table = 'asset_chunk'
+        verbose_name = '内容分块'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['ref_count', 'unreferenced_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.chunk_hash} (refs={self.ref_count})"
+
+
+class AssetManifest(models.Model):
+    """分块文件清单 - 以分块形式保存的文件（以存储键标识），读取时按顺序拼接各分块"""
+
+    name = models.CharField(max_length=500, primary_key=True, verbose_name='存储键')
+    file_size = models.BigIntegerField(default=0, verbose_name='文件大小(字节)')
+    chunk_count = models.IntegerField(default=0, verbose_name='分块数量')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        db_table = 'asset_manifest'
+        verbose_name = '分块文件清单'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.name} ({self.chunk_count} 块)"
+
+
+class AssetManifestChunk(models.Model):
+    """分块文件清单项 - 文件中按顺序排列的一个分块"""
+
+    manifest = models.ForeignKey(AssetManifest, related_name='entries', on_delete=models.CASCADE, db_column='name',
+                                 verbose_name='分块文件清单')
+    seq = models.IntegerField(verbose_name='块序号')
+    offset = models.BigIntegerField(verbose_name='块在文件中的偏移')
+    chunk = models.ForeignKey(AssetChunk, related_name='+', on_delete=models.PROTECT, db_column='chunk_hash',
+                              verbose_name='内容分块')
+
+    class Meta:
+        db_table = 'asset_manifest_chunk'
+        verbose_name = '分块文件清单项'
+        verbose_name_plural = verbose_name
+        unique_together = ('manifest', 'seq')
+
+
+class AssetUsage(models.Model):
+    """资源空间占用统计 - 按上传者和文件类型在上传、删除、恢复时增量维护，列表页无需全表聚合"""
+
+    uploader = models.CharField(max_length=50, verbose_name='上传者')
+    file_type = models.CharField(max_length=20, verbose_name='文件类型')
+    file_count = models.IntegerField(default=0, verbose_name='有效资源数量')
+    total_size = models.BigIntegerField(default=0, verbose_name='有效资源总大小(字节)')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'asset_usage'
+        verbose_name = '资源空间统计'
+        verbose_name_plural = verbose_name
+        unique_together = ('uploader', 'file_type')
+
+    def __str__(self):
+        return f"{self.uploader}/{self.file_type}: {self.file_count} 个, {self.total_size} 字节"
+
+    @classmethod
+    def apply(cls, uploader, file_type, size_delta, count_delta):
+        """原子地累加统计值，记录不存在时创建"""
+        updated = cls.objects.filter(uploader=uploader, file_type=file_type).update(
+            file_count=F('file_count') + count_delta,
+            total_size=F('total_size') + size_delta,
+            updated_at=timezone.now()
+        )
+        if updated:
+            return
+        # 尚无记录时按资源表计算初始值（调用方已先写入资源，初始值已包含本次变化），
+        # 增量统计上线前已有的资源也能计入
+        file_count, total_size = cls._count_valid_assets(uploader, [file_type]).get(file_type, (0, 0))
+        try:
+            with transaction.atomic():
+                cls.objects.create(uploader=uploader, file_type=file_type,
+                                   file_count=file_count, total_size=total_size)
+        except IntegrityError:
+            # 并发创建，改为累加
+            cls.apply(uploader, file_type, size_delta, count_delta)
+
+    @classmethod
+    def initialize(cls, uploader, file_types):
+        """为尚无记录的文件类型按资源表创建统计（含数量为 0 的类型，此后不再重复计算），已有记录的保持不变"""
+        counts = cls._count_valid_assets(uploader, file_types)
+        cls.objects.bulk_create([
+            cls(uploader=uploader, file_type=file_type, file_count=counts.get(file_type, (0, 0))[0],
+                total_size=counts.get(file_type, (0, 0))[1])
+            for file_type in file_types
+        ], ignore_conflicts=True)
+
+    @staticmethod
+    def _count_valid_assets(uploader, file_types):
+        """按资源表统计有效资源：{文件类型: (数量, 总大小)}"""
+        rows = (
+            Asset.objects.filter(uploader=uploader, is_valid=True, file_type__in=file_types)
+            .order_by()
+            .values('file_type')
+            .annotate(file_count=Count('id'), total_size=Sum('file_size'))
+        )
+        return {row['file_type']: (row['file_count'], row['total_size'] or 0) for row in rows}
+
+    @classmethod
+    def touch(cls, uploader):
+        """资源的筛选属性变化（如关联状态）时刷新更新时间，使筛选统计缓存失效"""
+        cls.objects.filter(uploader=uploader).update(updated_at=timezone.now())
 
 
 class Asset(models.Model):
@@ -23,6 +288,14 @@ class Asset(models.Model):
         ('other', '其他'),
     ]
     
+    # 文件完整性状态枚举 - 由 scrub_assets 命令巡检填充
+    INTEGRITY_STATUS_CHOICES = [
+        ('unchecked', '未检查'),
+        ('ok', '正常'),
+        ('missing', '文件缺失'),
+        ('corrupted', '内容损坏'),
+    ]
+    
     # 基础信息
     id = models.CharField(max_length=32, primary_key=True, verbose_name='资源ID')
     name = models.CharField(max_length=255, verbose_name='文件名')
@@ -48,9 +321,19 @@ class Asset(models.Model):
     
     # 文件哈希（用于去重）
     file_hash = models.CharField(max_length=64, db_index=True, verbose_name='文件哈希值')
+    # 内容存储块（旧数据为空，文件按资源单独存放）
+    blob = models.ForeignKey(AssetBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name='assets',
+                             verbose_name='内容存储块')
     
     # 元数据（JSON格式存储额外信息）
     metadata = models.JSONField(default=dict, blank=True, verbose_name='文件元数据')
+    # 元数据提取完成时间，为空表示尚未提取（上传后由后台线程池填充）
+    metadata_extracted_at = models.DateTimeField(null=True, blank=True, verbose_name='元数据提取时间')
+    
+    # 文件完整性巡检结果
+    integrity_status = models.CharField(max_length=20, choices=INTEGRITY_STATUS_CHOICES, default='unchecked',
+                                        verbose_name='完整性状态')
+    integrity_checked_at = models.DateTimeField(null=True, blank=True, verbose_name='完整性检查时间')
     
     class Meta:
         db_table = 'assets'
@@ -65,6 +348,7 @@ class Asset(models.Model):
             models.Index(fields=['file_hash']),
             models.Index(fields=['upload_time']),
             models.Index(fields=['source_type']),  # 添加来源类型索引
+            models.Index(fields=['integrity_status']),
         ]
     
     def __str__(self):
@@ -94,10 +378,39 @@ class Asset(models.Model):
             }
         return None
     
+    def record_usage(self, sign=1):
+        """将资源计入（sign=1）或移出（sign=-1）空间占用统计"""
+        AssetUsage.apply(self.uploader, self.file_type, sign * self.file_size, sign)
+
     def soft_delete(self):
-        """软删除"""
-        self.is_valid = False
-        self.save(update_fields=['is_valid'])
+        """软删除，同时释放对内容存储块的引用并更新空间统计"""
+        if not self.is_valid:
+            return
+        with transaction.atomic():
+            self.is_valid = False
+            self.save(update_fields=['is_valid'])
+            if self.blob_id:
+                AssetBlob.release(self.blob_id)
+            self.record_usage(-1)
+
+    def restore(self):
+        """
+        恢复软删除的资源，重新引用内容存储块并更新空间统计，返回是否恢复成功
+        存储块已被回收（blob 已置空）时按文件哈希重新关联此后上传的相同内容；内容已不存在或正在回收时不恢复
+        """
+        if self.is_valid:
+            return True
+        with transaction.atomic():
+            blob = AssetBlob.objects.filter(file_hash=self.blob_id or self.file_hash).first()
+            if blob is not None and AssetBlob.add_ref(blob.file_hash):
+                self.blob = blob
+                self.file_path = blob.file_path
+            elif self.blob_id or self.file_path.startswith(BLOB_DIR + os.sep):
+                return False
+            self.is_valid = True
+            self.save(update_fields=['is_valid', 'blob', 'file_path'])
+            self.record_usage(1)
+        return True
     
     @classmethod
     def get_by_hash(cls, file_hash):
@@ -118,3 +431,121 @@ class Asset(models.Model):
     def get_unlinked_assets(cls):
         """获取未关联的资源"""
         return cls.objects.filter(is_linked=False, is_valid=True)
+
+
+class AssetText(models.Model):
+    """文档文本提取结果 - 按内容哈希保存，相同内容只提取一次，正文切块存放在 AssetTextChunk"""
+
+    STATUS_CHOICES = [
+        ('done', '已提取'),
+        ('failed', '提取失败'),
+    ]
+
+    file_hash = models.CharField(max_length=64, primary_key=True, verbose_name='文件哈希值')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='done', verbose_name='提取状态')
+    chunk_count = models.IntegerField(default=0, verbose_name='文本块数量')
+    char_count = models.IntegerField(default=0, verbose_name='文本字符数')
+    truncated = models.BooleanField(default=False, verbose_name='是否超出长度上限被截断')
+    extracted_at = models.DateTimeField(auto_now=True, verbose_name='提取时间')
+
+    class Meta:
+        db_table = 'asset_text'
+        verbose_name = '文档文本'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.file_hash} ({self.get_status_display()}, {self.char_count} 字)"
+
+
+class AssetTextChunk(models.Model):
+    """文档文本块 - 按顺序切分的正文片段，用于全文检索与 AI 检索"""
+
+    text = models.ForeignKey(AssetText, related_name='chunks', on_delete=models.CASCADE, db_column='file_hash',
+                             verbose_name='文档文本')
+    seq = models.IntegerField(verbose_name='块序号')
+    content = models.TextField(verbose_name='文本内容')
+
+    class Meta:
+        db_table = 'asset_text_chunk'
+        verbose_name = '文档文本块'
+        verbose_name_plural = verbose_name
+        unique_together = ('text', 'seq')
+
+
+class UploadSession(models.Model):
+    """分片上传会话 - 记录可断点续传的大文件上传状态"""
+
+    STATUS_CHOICES = [
+        ('uploading', '上传中'),
+        ('completing', '合并中'),
+        ('completed', '已完成'),
+    ]
+
+    id = models.CharField(max_length=40, primary_key=True, default=generate_upload_id, verbose_name='上传会话ID')
+    file_name = models.CharField(max_length=255, verbose_name='原始文件名')
+    file_size = models.BigIntegerField(verbose_name='文件总大小(字节)')
+    chunk_size = models.IntegerField(verbose_name='分片大小(字节)')
+    total_parts = models.IntegerField(verbose_name='分片总数')
+    file_hash = models.CharField(max_length=64, blank=True, default='', verbose_name='客户端提供的文件哈希值')
+
+    # 完成后写入 Asset 的信息
+    uploader = models.CharField(max_length=50, default='admin', verbose_name='上传者')
+    source_type = models.CharField(max_length=20, default='other', verbose_name='资源来源类型')
+    linked_article_id = models.CharField(max_length=32, null=True, blank=True, verbose_name='关联文章ID')
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading', verbose_name='上传状态')
+    storage_upload_id = models.CharField(max_length=255, blank=True, default='', verbose_name='存储后端分片上传ID')
+    asset_id = models.CharField(max_length=32, null=True, blank=True, verbose_name='生成的资源ID')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'asset_upload_session'
+        verbose_name = '分片上传会话'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.get_status_display()})"
+
+    @property
+    def staging_name(self):
+        """分片组装用的临时文件存储键（与存储块同在存储后端，完成时直接移动，无需拷贝）"""
+        return os.path.join(UPLOAD_TEMP_DIR, f"{self.id}.part")
+
+    def part_offset(self, part_number):
+        """分片在文件中的起始偏移"""
+        return part_number * self.chunk_size
+
+    def part_length(self, part_number):
+        """分片的预期长度（最后一片可能不足 chunk_size）"""
+        return min(self.chunk_size, self.file_size - self.part_offset(part_number))
+
+    def uploaded_part_numbers(self):
+        """已上传的分片序号列表"""
+        return list(self.parts.order_by('part_number').values_list('part_number', flat=True))
+
+    @classmethod
+    def get_expired_sessions(cls):
+        """获取超过保留时间仍未完成的上传会话（含合并中途进程退出、停留在合并中的会话）"""
+        expire_before = timezone.now() - timedelta(seconds=settings.ASSET_UPLOAD_SESSION_TTL)
+        return cls.objects.filter(status__in=('uploading', 'completing'), updated_at__lt=expire_before)
+
+
+class UploadPart(models.Model):
+    """分片上传记录 - 每个已成功写入的分片一行，并发上传不同分片互不冲突"""
+
+    session = models.ForeignKey(UploadSession, related_name='parts', on_delete=models.CASCADE, verbose_name='上传会话')
+    part_number = models.IntegerField(verbose_name='分片序号')
+    size = models.IntegerField(verbose_name='分片大小(字节)')
+    checksum = models.CharField(max_length=64, verbose_name='分片MD5')
+    etag = models.CharField(max_length=255, blank=True, default='', verbose_name='存储后端分片标识')
+    uploaded_at = models.DateTimeField(auto_now=True, verbose_name='上传时间')
+
+    class Meta:
+        db_table = 'asset_upload_part'
+        verbose_name = '上传分片'
+        verbose_name_plural = verbose_name
+        unique_together = ('session', 'part_number')
@@ -0,0 +1,40 @@
+"""
+资源列表游标分页
+按 (upload_time, id) 倒序做键集分页：下一页条件为“排在上一页最后一条之后”，
+借助 upload_time 索引直接定位，翻到多深都不需要 OFFSET 扫描。
+游标对客户端不透明，内容为最后一条记录的上传时间与ID。
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析"""
+
+
+def encode_cursor(asset):
+    """以资源的 (上传时间, ID) 生成游标"""
+    position = json.dumps({'t': asset.upload_time.isoformat(), 'id': asset.id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标
+    :return: (上传时间, 资源ID)
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(position['t']), str(position['id'])
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def after_cursor(queryset, cursor):
+    """筛选排在游标之后（更早上传）的记录，queryset 需按 (-upload_time, -id) 排序"""
+    upload_time, asset_id = decode_cursor(cursor)
+    return queryset.filter(Q(upload_time__lt=upload_time) | Q(upload_time=upload_time, id__lt=asset_id))
@@ -0,0 +1,173 @@
+"""
+资源文件完整性巡检
+按批遍历资源记录，检查文件是否存在、大小与内容哈希是否与记录一致，结果写入 Asset.integrity_status；
+另可列出存储中没有任何记录引用的孤立文件。
+巡检的读取次数与读取字节数均按速率上限限流，与线上请求共用磁盘 / 对象存储时不影响正常访问。
+"""
+import hashlib
+import os
+import time
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .blob_store import DERIVATIVE_DIR
+from .models import UPLOAD_TEMP_DIR, Asset, AssetBlob, AssetChunk
+from .upload_utils import new_file_hash
+
+# 巡检读取文件的块大小，每读取一块计为一次 IO
+SCRUB_READ_BLOCK_SIZE = 1024 * 1024
+
+# 孤立文件按批比对数据库记录
+ORPHAN_LOOKUP_BATCH_SIZE = 500
+
+# 不属于资源文件的存储前缀：上传暂存文件由上传会话管理，衍生文件可随时重新生成
+SCRUB_EXCLUDED_PREFIXES = (UPLOAD_TEMP_DIR + os.sep, DERIVATIVE_DIR + os.sep)
+
+
+class RateLimiter:
+    """
+    按平均速率限流：累计的 IO 次数与字节数超出配额时休眠
+    :param max_iops: 每秒最多 IO 次数，0 表示不限
+    :param max_bytes_per_second: 每秒最多读取字节数，0 表示不限
+    """
+
+    # 落后配额超过该秒数（如等待数据库）时重新计时，避免随后集中突发读取
+    max_idle_credit = 1.0
+
+    def __init__(self, max_iops, max_bytes_per_second):
+        self.max_iops = max_iops
+        self.max_bytes_per_second = max_bytes_per_second
+        self._reset(time.monotonic())
+
+    def _reset(self, now):
+        self._started_at = now
+        self._ops = 0
+        self._bytes = 0
+
+    def consume(self, ops=1, nbytes=0):
+        """记录一次（或多次）IO，必要时休眠到速率回到上限以内"""
+        now = time.monotonic()
+        self._ops += ops
+        self._bytes += nbytes
+        required = max(
+            self._ops / self.max_iops if self.max_iops > 0 else 0,
+            self._bytes / self.max_bytes_per_second if self.max_bytes_per_second > 0 else 0
+        )
+        delay = required - (now - self._started_at)
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -self.max_idle_credit:
+            self._reset(now)
+
+
+def _hash_for(file_hash):
+    """按记录的哈希长度选择算法：旧数据为 MD5，其余与上传去重一致"""
+    if len(file_hash) == hashlib.md5().digest_size * 2:
+        return hashlib.md5()
+    file_hasher = new_file_hash()
+    return file_hasher if len(file_hash) == file_hasher.digest_size * 2 else None
+
+
+def verify_file(storage, file_path, file_size, file_hash, limiter, check_hash=True):
+    """
+    校验单个存储文件
+    :param check_hash: 是否读取全文校验哈希，否则只比较大小
+    :return: 'ok' / 'missing' / 'corrupted'
+    """
+    limiter.consume()
+    if not storage.exists(file_path):
+        return 'missing'
+
+    file_hasher = _hash_for(file_hash) if check_hash and file_hash else None
+    if file_hasher is None:
+        limiter.consume()
+        return 'ok' if storage.size(file_path) == file_size else 'corrupted'
+
+    read_size = 0
+    file_obj = storage.open(file_path)
+    try:
+        while True:
+            block = file_obj.read(SCRUB_READ_BLOCK_SIZE)
+            limiter.consume(nbytes=len(block))
+            if not block:
+                break
+            read_size += len(block)
+            file_hasher.update(block)
+    finally:
+        file_obj.close()
+
+    if read_size != file_size or file_hasher.hexdigest() != file_hash:
+        return 'corrupted'
+    return 'ok'
+
+
+def get_scrub_candidates(recheck_after_hours):
+    """
+    从未检查，或距上次检查超过 recheck_after_hours 小时的有效资源
+    回收站中的资源已释放内容引用，存储块随时可能被回收，不再巡检
+    """
+    cutoff = timezone.now() - timedelta(hours=recheck_after_hours)
+    return Asset.objects.filter(
+        Q(integrity_checked_at__isnull=True) | Q(integrity_checked_at__lt=cutoff),
+        is_valid=True
+    )
+
+
+def scrub_batch(storage, assets, limiter, check_hash=True):
+    """
+    巡检一批资源：引用同一文件的资源只读取一次，结果按状态批量写回
+    :return: {资源ID: 状态}
+    """
+    results = {}
+    by_path = {}
+    for asset in assets:
+        by_path.setdefault(asset.file_path, []).append(asset)
+
+    for file_path, path_assets in by_path.items():
+        asset = path_assets[0]
+        try:
+            status = verify_file(storage, file_path, asset.file_size, asset.file_hash, limiter, check_hash)
+        except Exception as e:
+            # 存储暂时不可用等错误不记录结果，下次巡检重试
+            print(f"巡检资源文件失败: {file_path}: {str(e)}")
+            continue
+        for path_asset in path_assets:
+            results[path_asset.id] = status
+
+    checked_at = timezone.now()
+    for status in set(results.values()):
+        Asset.objects.filter(id__in=[asset_id for asset_id, value in results.items() if value == status]).update(
+            integrity_status=status,
+            integrity_checked_at=checked_at
+        )
+    return results
+
+
+def _is_scrubbable(name):
+    return not name.startswith(SCRUB_EXCLUDED_PREFIXES)
+
+
+def find_orphan_files(storage, limiter):
+    """
+    列出存储中没有资源、存储块或分块记录引用的文件
+    每次列目录（对象存储为一次列表请求）计为一次 IO，按批比对数据库，内存占用与文件总数无关
+    :return: 迭代器，产出 (存储键, 大小)
+    """
+    def lookup(pending):
+        names = [name for name, _ in pending]
+        known = set(Asset.objects.filter(file_path__in=names).values_list('file_path', flat=True))
+        known.update(AssetBlob.objects.filter(file_path__in=names).values_list('file_path', flat=True))
+        known.update(AssetChunk.objects.filter(file_path__in=names).values_list('file_path', flat=True))
+        return [(name, size) for name, size in pending if name not in known]
+
+    pending = []
+    for entries in storage.list_dir():
+        limiter.consume()
+        pending.extend(entry for entry in entries if _is_scrubbable(entry[0]))
+        while len(pending) >= ORPHAN_LOOKUP_BATCH_SIZE:
+            yield from lookup(pending[:ORPHAN_LOOKUP_BATCH_SIZE])
+            pending = pending[ORPHAN_LOOKUP_BATCH_SIZE:]
+    if pending:
+        yield from lookup(pending)
@@ -0,0 +1,311 @@
+"""
+资源文件存储后端
+Asset / AssetBlob 的 file_path 保存的是存储键（相对路径），文件的读写统一经由存储后端完成：
+- local：本地磁盘（MEDIA_ROOT），下载支持 Range 与 sendfile 卸载
+- s3：S3 兼容对象存储（AWS S3 / MinIO 等），应用节点无需共享磁盘；
+  客户端在进程内复用连接池，大文件分片上传，下载通过预签名 URL 直连对象存储
+通过 ASSET_STORAGE_BACKEND 配置切换；开启 ASSET_CHUNK_DEDUP_ENABLED 时外层再包装分块去重存储（见 chunk_store）。
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+class LocalAssetStorage:
+    """本地磁盘存储"""
+
+    # 分片上传的最小分片大小（本地按偏移写入，无限制）
+    min_part_size = 1
+
+    def __init__(self, root=None):
+        self.root = str(root or settings.MEDIA_ROOT)
+
+    def path(self, name):
+        """存储键对应的本地绝对路径"""
+        return os.path.join(self.root, name)
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def size(self, name):
+        return os.path.getsize(self.path(name))
+
+    def open(self, name):
+        """以二进制只读方式打开文件"""
+        return open(self.path(name), 'rb')
+
+    def save(self, name, src_path):
+        """将本地文件存入存储（暂存目录与 MEDIA_ROOT 同盘，直接重命名），src_path 随之失效"""
+        dest_path = self.path(name)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        os.replace(src_path, dest_path)
+
+    def move(self, src_name, dest_name):
+        """在存储内移动文件"""
+        self.save(dest_name, self.path(src_name))
+
+    def delete(self, name):
+        if os.path.exists(self.path(name)):
+            os.remove(self.path(name))
+
+    def list_dir(self, prefix=''):
+        """
+        逐目录列出前缀下的所有文件
+        :return: 迭代器，每次产出一个目录（一次读取）中的 [(存储键, 大小), ...]
+        """
+        top = self.path(prefix)
+        for dir_path, dir_names, file_names in os.walk(top):
+            dir_names.sort()
+            entries = []
+            for file_name in sorted(file_names):
+                abs_file_path = os.path.join(dir_path, file_name)
+                try:
+                    entries.append((os.path.relpath(abs_file_path, self.root), os.path.getsize(abs_file_path)))
+                except FileNotFoundError:
+                    continue
+            yield entries
+
+    @contextmanager
+    def local_copy(self, name):
+        """获取可供本地读取的文件路径（本地存储直接返回原路径）"""
+        yield self.path(name)
+
+    def download_url(self, name, file_name, as_attachment, content_type):
+        """本地存储不提供直链，由应用自行输出文件"""
+        return None
+
+    def create_multipart(self, name, file_size):
+        """开始分片上传：预分配（稀疏）文件，各分片按偏移直接写入，完成时无需拼接"""
+        temp_path = self.path(name)
+        os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            f.truncate(file_size)
+        return ''
+
+    def write_part(self, name, upload_id, part_number, offset, blocks):
+        """
+        写入一个分片
+        :param blocks: 分片数据块的迭代器，迭代中抛出异常时该分片视为失败
+        :return: 分片标识（本地存储无需）
+        """
+        with open(self.path(name), 'r+b') as f:
+            f.seek(offset)
+            for block in blocks:
+                f.write(block)
+        return ''
+
+    def complete_multipart(self, name, upload_id, parts):
+        """完成分片上传（本地文件已就位）"""
+
+    def abort_multipart(self, name, upload_id):
+        """取消分片上传，删除临时文件"""
+        self.delete(name)
+
+
+class S3AssetStorage:
+    """
+    S3 兼容对象存储
+    boto3 客户端线程安全，每个进程只创建一次，复用 HTTP 连接池
+    """
+
+    # S3 要求除最后一片外每个分片不小于 5MB
+    min_part_size = 5 * 1024 * 1024
+    # 超过该大小的文件使用分片上传 / 分片复制
+    multipart_threshold = 16 * 1024 * 1024
+    multipart_chunksize = 16 * 1024 * 1024
+    # 分片数据先缓存在内存，超过该大小后转存临时文件
+    spool_max_size = 1024 * 1024
+
+    def __init__(self):
+        # 仅在启用对象存储时才需要安装 boto3
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        self.bucket = settings.ASSET_S3_BUCKET
+        self.key_prefix = settings.ASSET_S3_KEY_PREFIX
+        self.client = boto3.session.Session().client(
+            's3',
+            endpoint_url=settings.ASSET_S3_ENDPOINT_URL,
+            region_name=settings.ASSET_S3_REGION,
+            aws_access_key_id=settings.ASSET_S3_ACCESS_KEY,
+            aws_secret_access_key=settings.ASSET_S3_SECRET_KEY,
+            config=Config(
+                signature_version='s3v4',
+                max_pool_connections=settings.ASSET_S3_MAX_POOL_CONNECTIONS,
+                connect_timeout=5,
+                read_timeout=60,
+                retries={'max_attempts': 3, 'mode': 'standard'},
+                s3={'addressing_style': settings.ASSET_S3_ADDRESSING_STYLE}
+            )
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=4
+        )
+
+    def _key(self, name):
+        """存储键 -> 对象键"""
+        return self.key_prefix + name.replace(os.sep, '/')
+
+    def path(self, name):
+        """对象存储没有本地路径"""
+        return None
+
+    def exists(self, name):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def size(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=self._key(name))['ContentLength']
+
+    def open(self, name):
+        """返回流式读取的响应体，支持 read(size) 分块读取"""
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(name))['Body']
+
+    def save(self, name, src_path):
+        """上传本地文件（大文件自动分片并发上传），完成后删除 src_path"""
+        self.client.upload_file(src_path, self.bucket, self._key(name), Config=self.transfer_config)
+        os.remove(src_path)
+
+    def move(self, src_name, dest_name):
+        """服务端复制后删除源对象，数据不经过应用节点"""
+        self.client.copy(
+            {'Bucket': self.bucket, 'Key': self._key(src_name)},
+            self.bucket,
+            self._key(dest_name),
+            Config=self.transfer_config
+        )
+        self.delete(src_name)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def list_dir(self, prefix=''):
+        """
+        分页列出前缀下的所有对象
+        :return: 迭代器，每次产出一页（一次 ListObjects 请求）的 [(存储键, 大小), ...]
+        """
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            yield [
+                (item['Key'][len(self.key_prefix):], item['Size'])
+                for item in page.get('Contents', [])
+            ]
+
+    @contextmanager
+    def local_copy(self, name):
+        """下载到临时文件供本地处理（如生成缩略图），退出时删除"""
+        fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(name)[1])
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._key(name), temp_path, Config=self.transfer_config)
+            yield temp_path
+        finally:
+            os.remove(temp_path)
+
+    def download_url(self, name, file_name, as_attachment, content_type):
+        """生成预签名下载地址，由对象存储直接响应（含 Range 请求）"""
+        from django.utils.http import content_disposition_header
+
+        params = {'Bucket': self.bucket, 'Key': self._key(name), 'ResponseContentType': content_type}
+        content_disposition = content_disposition_header(as_attachment, file_name)
+        if content_disposition:
+            params['ResponseContentDisposition'] = content_disposition
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params=params,
+            ExpiresIn=settings.ASSET_S3_PRESIGNED_URL_EXPIRE
+        )
+
+    def create_multipart(self, name, file_size):
+        """开始分片上传，返回对象存储的 UploadId"""
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self._key(name))
+        return response['UploadId']
+
+    def write_part(self, name, upload_id, part_number, offset, blocks):
+        """
+        上传一个分片
+        数据先完整接收并校验（迭代结束）后才发送，校验失败的分片不会写入对象存储
+        :return: 分片 ETag，完成上传时需要
+        """
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_max_size) as spool:
+            for block in blocks:
+                spool.write(block)
+            spool.seek(0)
+            response = self.client.upload_part(
+                Bucket=self.bucket,
+                Key=self._key(name),
+                UploadId=upload_id,
+                PartNumber=part_number + 1,  # S3 分片序号从 1 开始
+                Body=spool
+            )
+        return response['ETag']
+
+    def complete_multipart(self, name, upload_id, parts):
+        """
+        合并分片（服务端完成，不经过应用节点）
+        :param parts: [(分片序号, ETag), ...]
+        """
+        from botocore.exceptions import ClientError
+        try:
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self._key(name),
+                UploadId=upload_id,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': part_number + 1, 'ETag': etag} for part_number, etag in parts
+                ]}
+            )
+        except ClientError as e:
+            # 上次完成请求已合并分片但后续步骤失败，重试时对象已存在
+            if e.response.get('Error', {}).get('Code') == 'NoSuchUpload' and self.exists(name):
+                return
+            raise
+
+    def abort_multipart(self, name, upload_id):
+        """取消分片上传；已合并完成的会话删除临时对象"""
+        from botocore.exceptions import ClientError
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(name), UploadId=upload_id)
+        except ClientError:
+            pass
+        self.delete(name)
+
+
+STORAGE_BACKENDS = {
+    'local': LocalAssetStorage,
+    's3': S3AssetStorage,
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_asset_storage():
+    """获取当前配置的存储后端（每个进程一个实例，对象存储客户端及其连接池在请求间复用）"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                backend = settings.ASSET_STORAGE_BACKEND
+                if backend not in STORAGE_BACKENDS:
+                    raise ValueError(f"不支持的资源存储后端: {backend}")
+                storage = STORAGE_BACKENDS[backend]()
+                if settings.ASSET_CHUNK_DEDUP_ENABLED:
+                    # 分块去重依赖数据库模型，按需导入
+                    from .chunk_store import ChunkedAssetStorage
+                    storage = ChunkedAssetStorage(storage)
+                _storage = storage
+    return _storage
+
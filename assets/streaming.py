@@ -0,0 +1,209 @@
+"""
+资源文件流式响应工具
+- 整文件下载使用 FileResponse 分块输出，WSGI 服务器可直接走 sendfile
+- 支持 HTTP Range / 206 部分内容，音视频预览可以即时拖动
+- 可选 X-Accel-Redirect(Nginx) / X-Sendfile(Apache) 卸载模式，由前置服务器发送文件
+- ASGI 模式下使用异步迭代器逐块输出（同步迭代器会被 Django 整体读入内存后才发送）
+"""
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from .storage import get_asset_storage
+
+# 流式输出的分块大小
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# 浏览器内直接显示（inline）的文件类型，其余按附件下载
+INLINE_FILE_TYPES = ('image',)
+
+# 仅支持单区间: bytes=start-end / bytes=start- / bytes=-suffix
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """Range 请求区间无法满足（对应 HTTP 416）"""
+
+
+class AssetFileResponse(FileResponse):
+    """按更大的块输出文件，减少大文件下载时的迭代次数"""
+    block_size = STREAM_BLOCK_SIZE
+
+
+def parse_range_header(range_header, file_size):
+    """
+    解析 Range 请求头
+    :param range_header: Range 请求头的值
+    :param file_size: 文件总大小
+    :return: (start, end) 闭区间；请求头缺失、格式不支持（如多区间）时返回 None，按整文件响应
+    :raises: RangeNotSatisfiable 区间超出文件范围时
+    """
+    if not range_header:
+        return None
+
+    match = _RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+
+    start_str, end_str = match.groups()
+    if not start_str and not end_str:
+        return None
+
+    if not start_str:
+        # 后缀区间：最后 N 个字节
+        suffix_length = int(end_str)
+        if suffix_length == 0 or file_size == 0:
+            raise RangeNotSatisfiable()
+        start = max(file_size - suffix_length, 0)
+        end = file_size - 1
+    else:
+        start = int(start_str)
+        if start >= file_size:
+            raise RangeNotSatisfiable()
+        end = int(end_str) if end_str else file_size - 1
+        if end < start:
+            return None
+        end = min(end, file_size - 1)
+
+    return start, end
+
+
+def iter_file_range(file_obj, start, length, block_size=STREAM_BLOCK_SIZE):
+    """从 start 开始按块读取 length 个字节，读取结束后关闭文件"""
+    try:
+        file_obj.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file_obj.read(min(block_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file_obj.close()
+
+
+async def aiter_file_range(file_obj, start, length, block_size=STREAM_BLOCK_SIZE):
+    """iter_file_range 的异步版本：每块在线程池中读取，不阻塞事件循环，读取结束或客户端断开后关闭文件"""
+    read = sync_to_async(file_obj.read, thread_sensitive=False)
+    try:
+        await sync_to_async(file_obj.seek, thread_sensitive=False)(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await read(min(block_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file_obj.close()
+
+
+def _is_asgi(request):
+    """请求是否由 ASGI 服务器处理（DRF 的 Request 包装了 Django 的请求对象）"""
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def _build_offload_response(asset, abs_file_path, content_type):
+    """构建交给前置服务器发送文件的空响应，Range 也由前置服务器处理"""
+    response = HttpResponse(content_type=content_type)
+    if settings.ASSET_SENDFILE_MODE == 'x-accel-redirect':
+        prefix = settings.ASSET_ACCEL_REDIRECT_PREFIX.rstrip('/')
+        response['X-Accel-Redirect'] = f"{prefix}/{quote(asset.file_path.replace(os.sep, '/'))}"
+    else:
+        response['X-Sendfile'] = abs_file_path
+    return response
+
+
+def etag_matches(request, etag):
+    """If-None-Match 是否命中当前 ETag（支持多个值、弱校验与 *）"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match or not etag:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or etag in [value[2:] if value.startswith('W/') else value for value in candidates]
+
+
+def not_modified_response(etag):
+    """304 响应，只携带 ETag"""
+    response = HttpResponse(status=304)
+    response['ETag'] = etag
+    return response
+
+
+def asset_file_headers(asset):
+    """资源原文件响应的公共头：Content-Type、ETag、Content-Disposition"""
+    headers = {'Content-Type': asset.mime_type or 'application/octet-stream'}
+    if asset.file_hash:
+        headers['ETag'] = f'"{asset.file_hash}"'
+    content_disposition = content_disposition_header(asset.file_type not in INLINE_FILE_TYPES, asset.original_name)
+    if content_disposition:
+        headers['Content-Disposition'] = content_disposition
+    return headers
+
+
+def build_file_response(request, asset, abs_file_path):
+    """
+    根据请求构建资源文件响应
+    :param request: 当前请求
+    :param asset: Asset 资源对象
+    :param abs_file_path: 文件的绝对路径；为 None 时经由存储后端读取（如分块保存的文件）
+    :return: 整文件 200 / 部分内容 206 / 区间无效 416 / 未修改 304 响应
+    """
+    headers = asset_file_headers(asset)
+    content_type = headers.pop('Content-Type')
+    etag = headers.get('ETag')
+
+    # 客户端缓存的内容未变化
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+
+    if settings.ASSET_SENDFILE_MODE and abs_file_path is not None:
+        response = _build_offload_response(asset, abs_file_path, content_type)
+    else:
+        if abs_file_path is not None:
+            file_size = os.path.getsize(abs_file_path)
+            open_file = lambda: open(abs_file_path, 'rb')
+        else:
+            storage = get_asset_storage()
+            file_size = storage.size(asset.file_path)
+            open_file = lambda: storage.open(asset.file_path)
+
+        # If-Range 与当前 ETag 不一致时说明文件已变化，忽略 Range 返回整文件
+        range_header = request.META.get('HTTP_RANGE')
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range and if_range != etag:
+            range_header = None
+
+        try:
+            byte_range = parse_range_header(range_header, file_size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{file_size}'
+            return response
+
+        asgi = _is_asgi(request)
+        if byte_range is None and not asgi:
+            response = AssetFileResponse(open_file(), content_type=content_type)
+        else:
+            start, end = byte_range or (0, file_size - 1)
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                (aiter_file_range if asgi else iter_file_range)(open_file(), start, length),
+                status=206 if byte_range else 200,
+                content_type=content_type
+            )
+            if byte_range:
+                response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+            response['Content-Length'] = length
+
+    response['Accept-Ranges'] = 'bytes'
+    for header, value in headers.items():
+        response[header] = value
+    return response
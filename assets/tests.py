@@ -1,3 +1,934 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from utils.error_codes import ErrorCode
+from .blob_store import blob_rel_path, delete_blob_file
+from .chunked_upload import discard_running_hash, store_session_file
+from .chunk_store import ChunkedAssetStorage, iter_chunks
+from .hot_cache import HotAssetCache
+from .models import (
+    Asset, AssetBlob, AssetChunk, AssetManifest, AssetManifestChunk, AssetUsage, UploadPart, UploadSession, wait_until_collected
+)
+from .storage import LocalAssetStorage, S3AssetStorage
+from .usage import get_usage_summary
+
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+S3_SETTINGS = {
+    'ASSET_S3_BUCKET': 'o-doc-test',
+    'ASSET_S3_KEY_PREFIX': 'assets/',
+    'ASSET_S3_ENDPOINT_URL': None,
+    'ASSET_S3_REGION': 'us-east-1',
+    'ASSET_S3_ACCESS_KEY': 'testing',
+    'ASSET_S3_SECRET_KEY': 'testing',
+    'ASSET_S3_ADDRESSING_STYLE': 'auto',
+}
+
+
+class MediaRootMixin:
+    """每个测试使用独立的临时 MEDIA_ROOT"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def write_temp_file(self, data):
+        """在 MEDIA_ROOT 下写入暂存文件（存储后端 save 后会删除）"""
+        fd, temp_path = tempfile.mkstemp(dir=self.media_root)
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(data)
+        return temp_path
+
+
+@skipIf(mock_aws is None, '未安装 moto')
+@override_settings(**S3_SETTINGS)
+class S3AssetStorageTests(MediaRootMixin, TestCase):
+    """S3 存储后端（moto 模拟对象存储）"""
+
+    def setUp(self):
+        super().setUp()
+        aws_mock = mock_aws()
+        aws_mock.start()
+        self.addCleanup(aws_mock.stop)
+        self.storage = S3AssetStorage()
+        self.storage.client.create_bucket(Bucket=S3_SETTINGS['ASSET_S3_BUCKET'])
+
+    def read(self, name):
+        body = self.storage.open(name)
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    def test_save_open_delete(self):
+        data = os.urandom(1000)
+        src_path = self.write_temp_file(data)
+        self.storage.save('blobs/aa/bb/file', src_path)
+
+        self.assertFalse(os.path.exists(src_path))
+        self.assertTrue(self.storage.exists('blobs/aa/bb/file'))
+        self.assertEqual(self.storage.size('blobs/aa/bb/file'), len(data))
+        self.assertEqual(self.read('blobs/aa/bb/file'), data)
+        self.assertIsNone(self.storage.path('blobs/aa/bb/file'))
+
+        self.storage.delete('blobs/aa/bb/file')
+        self.assertFalse(self.storage.exists('blobs/aa/bb/file'))
+
+    def test_open_reads_in_blocks(self):
+        data = os.urandom(300_000)
+        self.storage.save('blobs/file', self.write_temp_file(data))
+
+        body = self.storage.open('blobs/file')
+        blocks = list(iter(lambda: body.read(64 * 1024), b''))
+        body.close()
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(b''.join(blocks), data)
+
+    def test_range_read_of_chunked_file(self):
+        """分块保存的文件按偏移读取：只打开目标偏移所在的分块，对象响应体不支持 seek 时跳读"""
+        data = os.urandom(3 * 1024 * 1024)
+        storage = ChunkedAssetStorage(self.storage)
+        with override_settings(ASSET_CHUNK_DEDUP_MIN_SIZE=1024 * 1024):
+            storage.save('blobs/big', self.write_temp_file(data))
+
+        self.assertEqual(storage.size('blobs/big'), len(data))
+        reader = storage.open('blobs/big')
+        try:
+            # 跨越分块边界的读取也应读满
+            boundary = AssetManifestChunk.objects.get(manifest_id='blobs/big', seq=1).offset
+            for offset, length in ((0, 100), (1_500_000, 70_000), (boundary - 10, 20), (len(data) - 10, 10)):
+                reader.seek(offset)
+                self.assertEqual(reader.read(length), data[offset:offset + length])
+        finally:
+            reader.close()
+
+    def test_multipart_upload(self):
+        part_size = self.storage.min_part_size
+        data = os.urandom(part_size + 1000)
+        upload_id = self.storage.create_multipart('.uploads/u.part', len(data))
+
+        # 分片可乱序上传
+        parts = []
+        for part_number in (1, 0):
+            chunk = data[part_number * part_size:(part_number + 1) * part_size]
+            etag = self.storage.write_part('.uploads/u.part', upload_id, part_number, part_number * part_size,
+                                           iter([chunk[:100], chunk[100:]]))
+            parts.append((part_number, etag))
+        self.storage.complete_multipart('.uploads/u.part', upload_id, sorted(parts))
+        self.assertEqual(self.read('.uploads/u.part'), data)
+
+        # 重复完成（上次合并后续步骤失败时的重试）不报错
+        self.storage.complete_multipart('.uploads/u.part', upload_id, sorted(parts))
+
+    def test_failed_part_is_not_uploaded(self):
+        upload_id = self.storage.create_multipart('.uploads/u.part', 10)
+
+        def blocks():
+            yield b'12345'
+            raise ValueError('checksum mismatch')
+
+        with self.assertRaises(ValueError):
+            self.storage.write_part('.uploads/u.part', upload_id, 0, 0, blocks())
+        listed = self.storage.client.list_parts(Bucket=S3_SETTINGS['ASSET_S3_BUCKET'],
+                                                Key='assets/.uploads/u.part', UploadId=upload_id)
+        self.assertEqual(listed.get('Parts', []), [])
+
+        self.storage.abort_multipart('.uploads/u.part', upload_id)
+        self.assertFalse(self.storage.exists('.uploads/u.part'))
+
+    def test_move(self):
+        data = os.urandom(2000)
+        self.storage.save('.uploads/src', self.write_temp_file(data))
+        self.storage.move('.uploads/src', 'blobs/dest')
+
+        self.assertFalse(self.storage.exists('.uploads/src'))
+        self.assertEqual(self.read('blobs/dest'), data)
+
+    def test_list_dir(self):
+        for name in ('blobs/aa/1', 'blobs/aa/2', 'blobs/bb/3', 'chunks/cc/4'):
+            self.storage.save(name, self.write_temp_file(name.encode()))
+
+        listed = [entry for page in self.storage.list_dir('blobs/') for entry in page]
+        self.assertEqual(sorted(listed), [('blobs/aa/1', 10), ('blobs/aa/2', 10), ('blobs/bb/3', 10)])
+        self.assertEqual(len([entry for page in self.storage.list_dir() for entry in page]), 4)
+
+    def upload_parts(self, data, part_numbers=None):
+        """初始化分片上传会话并按给定顺序上传分片，返回会话信息"""
+        session = self.client.post('/api/resource/upload/init', {
+            'fileName': 'video.mp4',
+            'fileSize': len(data),
+            'chunkSize': self.storage.min_part_size,
+        }, content_type='application/json').json()['data']
+        for part_number in part_numbers or range(session['totalParts']):
+            chunk = data[part_number * session['chunkSize']:(part_number + 1) * session['chunkSize']]
+            response = self.client.put(
+                f"/api/resource/upload/{session['uploadId']}/part/{part_number}"
+                f"?checksum={hashlib.md5(chunk).hexdigest()}",
+                chunk, content_type='application/octet-stream'
+            ).json()
+            self.assertEqual(response['code'], 200)
+        return session
+
+    def test_chunked_upload_complete(self):
+        """对象存储上按序上传的分片：完成接口使用上传时累计的哈希，不读取对象，请求内完成"""
+        data = os.urandom(self.storage.min_part_size + 1000)
+        with mock.patch('assets.storage._storage', self.storage):
+            session = self.upload_parts(data)
+            with mock.patch.object(self.storage, 'open', side_effect=AssertionError('不应读取对象')):
+                result = self.client.post(f"/api/resource/upload/{session['uploadId']}/complete").json()
+
+        self.assertEqual(result['code'], 200)
+        asset = Asset.objects.get(id=result['data']['id'])
+        self.assertEqual(asset.file_hash, hashlib.sha256(data).hexdigest())
+        self.assertEqual(self.read(asset.file_path), data)
+        self.assertFalse(self.storage.exists(UploadSession.objects.get(id=session['uploadId']).staging_name))
+
+    def test_chunked_upload_complete_out_of_order(self):
+        """对象存储上乱序上传的分片：完成接口不在请求内下载对象计算哈希，后台入库后会话完成"""
+        data = os.urandom(self.storage.min_part_size + 1000)
+        with mock.patch('assets.storage._storage', self.storage):
+            session = self.upload_parts(data, part_numbers=[1, 0])
+            scheduled = []
+            with mock.patch('assets.views.schedule_session_store', side_effect=scheduled.append), \
+                    mock.patch.object(self.storage, 'open', side_effect=AssertionError('请求内不应读取对象')):
+                result = self.client.post(f"/api/resource/upload/{session['uploadId']}/complete").json()
+            self.assertEqual(result['data']['status'], 'completing')
+            self.assertEqual(scheduled, [session['uploadId']])
+
+            asset, created = store_session_file(UploadSession.objects.get(id=session['uploadId']))
+
+            self.assertTrue(created)
+            self.assertEqual(asset.file_hash, hashlib.sha256(data).hexdigest())
+            self.assertEqual(self.read(asset.file_path), data)
+            self.assertFalse(self.storage.exists(UploadSession.objects.get(id=session['uploadId']).staging_name))
+            progress = self.client.get(f"/api/resource/upload/{session['uploadId']}").json()['data']
+            self.assertEqual((progress['status'], progress['assetId']), ('completed', asset.id))
+
+    def test_chunked_upload_complete_with_known_hash(self):
+        """客户端提供的哈希与已有内容一致时直接引用，不读取对象"""
+        data = os.urandom(1000)
+        file_hash = hashlib.sha256(data).hexdigest()
+        self.storage.save('blobs/known', self.write_temp_file(data))
+        AssetBlob.objects.create(file_hash=file_hash, file_size=len(data), file_path='blobs/known', ref_count=1)
+
+        with mock.patch('assets.storage._storage', self.storage):
+            session = self.client.post('/api/resource/upload/init', {
+                'fileName': 'a.bin',
+                'fileSize': len(data),
+                'fileHash': file_hash,
+            }, content_type='application/json').json()['data']
+            self.client.put(
+                f"/api/resource/upload/{session['uploadId']}/part/0?checksum={hashlib.md5(data).hexdigest()}",
+                data, content_type='application/octet-stream'
+            )
+            with mock.patch.object(self.storage, 'open', side_effect=AssertionError('不应读取对象')):
+                result = self.client.post(f"/api/resource/upload/{session['uploadId']}/complete").json()
+
+        self.assertTrue(result['data']['duplicate'])
+        self.assertEqual(Asset.objects.get(id=result['data']['id']).blob_id, file_hash)
+        self.assertEqual(AssetBlob.objects.get(file_hash=file_hash).ref_count, 2)
+        self.assertFalse(self.storage.exists(UploadSession.objects.get(id=session['uploadId']).staging_name))
+
+
+class ChunkedUploadTests(MediaRootMixin, TestCase):
+    """本地存储的分片上传接口"""
+
+    chunk_size = 1000
+
+    def setUp(self):
+        super().setUp()
+        self.storage = LocalAssetStorage()
+        storage_patch = mock.patch('assets.storage._storage', self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        self.data = os.urandom(self.chunk_size * 3 + 500)
+
+    def init_session(self):
+        return self.client.post('/api/resource/upload/init', {
+            'fileName': 'a.bin',
+            'fileSize': len(self.data),
+            'chunkSize': self.chunk_size,
+        }, content_type='application/json').json()['data']
+
+    def chunk(self, part_number, data=None):
+        return (data or self.data)[part_number * self.chunk_size:(part_number + 1) * self.chunk_size]
+
+    def put_part(self, upload_id, part_number, body=None, checksum=None):
+        body = self.chunk(part_number) if body is None else body
+        return self.client.put(
+            f'/api/resource/upload/{upload_id}/part/{part_number}'
+            f'?checksum={checksum or hashlib.md5(body).hexdigest()}',
+            body, content_type='application/octet-stream'
+        ).json()
+
+    def complete(self, upload_id):
+        return self.client.post(f'/api/resource/upload/{upload_id}/complete').json()
+
+    def assert_completed(self, result):
+        self.assertEqual(result['code'], 200)
+        asset = Asset.objects.get(id=result['data']['id'])
+        self.assertEqual(asset.file_hash, hashlib.sha256(self.data).hexdigest())
+        with self.storage.open(asset.file_path) as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_checksum_mismatch(self):
+        """校验值不符的分片不记录，重传后可继续"""
+        upload_id = self.init_session()['uploadId']
+        result = self.put_part(upload_id, 0, checksum=hashlib.md5(b'other').hexdigest())
+        self.assertEqual(result['code'], ErrorCode.UPLOAD_CHUNK_CHECKSUM_MISMATCH.code)
+        self.assertFalse(UploadPart.objects.filter(session_id=upload_id).exists())
+
+        for part_number in range(4):
+            self.assertEqual(self.put_part(upload_id, part_number)['code'], 200)
+        self.assert_completed(self.complete(upload_id))
+
+    def test_size_mismatch(self):
+        """分片长度与会话不一致时拒绝"""
+        upload_id = self.init_session()['uploadId']
+        result = self.put_part(upload_id, 0, body=self.chunk(0)[:-1])
+        self.assertEqual(result['code'], ErrorCode.UPLOAD_CHUNK_SIZE_MISMATCH.code)
+        result = self.put_part(upload_id, 3, body=self.chunk(0))
+        self.assertEqual(result['code'], ErrorCode.UPLOAD_CHUNK_SIZE_MISMATCH.code)
+        self.assertFalse(UploadPart.objects.filter(session_id=upload_id).exists())
+
+    def test_resume(self):
+        """查询进度列出已上传分片，补传缺失分片后完成"""
+        upload_id = self.init_session()['uploadId']
+        self.put_part(upload_id, 0)
+        self.put_part(upload_id, 2)
+
+        progress = self.client.get(f'/api/resource/upload/{upload_id}').json()['data']
+        self.assertEqual(progress['uploadedParts'], [0, 2])
+        result = self.complete(upload_id)
+        self.assertEqual(result['code'], ErrorCode.UPLOAD_INCOMPLETE.code)
+        self.assertEqual(result['data']['missingParts'], [1, 3])
+
+        self.put_part(upload_id, 1)
+        self.put_part(upload_id, 3)
+        with mock.patch('assets.chunked_upload.hash_stream', side_effect=AssertionError('不应重新读取文件')):
+            self.assert_completed(self.complete(upload_id))
+
+    def test_out_of_order_parts(self):
+        """乱序上传的分片按序累计哈希，完成时不重新读取整个文件"""
+        upload_id = self.init_session()['uploadId']
+        for part_number in (3, 1, 0, 2):
+            self.assertEqual(self.put_part(upload_id, part_number)['code'], 200)
+        with mock.patch('assets.chunked_upload.hash_stream', side_effect=AssertionError('不应重新读取文件')):
+            self.assert_completed(self.complete(upload_id))
+
+    def test_retransmitted_part_with_new_content(self):
+        """已计入哈希的分片以不同内容重传时，完成时按合并后的文件重新计算哈希"""
+        upload_id = self.init_session()['uploadId']
+        self.put_part(upload_id, 0, body=bytes(self.chunk_size))
+        for part_number in range(4):
+            self.put_part(upload_id, part_number)
+        self.assert_completed(self.complete(upload_id))
+
+    def test_running_hash_missing(self):
+        """累计哈希不在当前进程（如分片落在其他进程）时读取暂存文件计算"""
+        upload_id = self.init_session()['uploadId']
+        for part_number in range(4):
+            self.put_part(upload_id, part_number)
+        discard_running_hash(upload_id)
+        self.assert_completed(self.complete(upload_id))
+
+
+class BlobCollectRaceTests(MediaRootMixin, TransactionTestCase):
+    """垃圾回收与上传相同内容并发"""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = LocalAssetStorage()
+        # 后台提取任务与本测试无关，不提交
+        for target, value in (('assets.storage._storage', self.storage),
+                              ('assets.upload_utils.schedule_text_extraction', mock.DEFAULT),
+                              ('assets.upload_utils.schedule_metadata_extraction', mock.DEFAULT)):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_upload_between_claim_and_delete(self):
+        """上传在回收认领之后、删除之前引用同一存储块：等待回收完成后重新写入，文件保留且引用计数正确"""
+        data = b'same content'
+        file_hash = hashlib.sha256(data).hexdigest()
+        self.storage.save(blob_rel_path(file_hash), self.write_temp_file(data))
+        AssetBlob.objects.create(
+            file_hash=file_hash, file_size=len(data), file_path=blob_rel_path(file_hash),
+            ref_count=0, unreferenced_at=timezone.now() - timedelta(hours=1)
+        )
+
+        claimed = threading.Event()
+        upload_waiting = threading.Event()
+
+        def delete_after_upload_waits(blob):
+            # 回收已认领：等上传一方发现存储块回收中并开始等待后再删除
+            claimed.set()
+            upload_waiting.wait(5)
+            delete_blob_file(blob)
+
+        def mark_waiting(queryset):
+            if queryset.exists():
+                upload_waiting.set()
+            wait_until_collected(queryset)
+
+        def collect():
+            try:
+                call_command('gc_asset_blobs', grace_hours=0, max_per_second=0, stdout=io.StringIO())
+            finally:
+                connection.close()
+
+        with mock.patch('assets.management.commands.gc_asset_blobs.delete_blob_file',
+                        side_effect=delete_after_upload_waits), \
+                mock.patch('assets.models.wait_until_collected', side_effect=mark_waiting):
+            collector = threading.Thread(target=collect)
+            collector.start()
+            self.assertTrue(claimed.wait(5))
+            result = self.client.post('/api/resource/upload', {
+                'file': SimpleUploadedFile('a.txt', data, content_type='text/plain')
+            }).json()
+            collector.join(5)
+
+        self.assertTrue(upload_waiting.is_set())
+        self.assertEqual(result['code'], 200)
+        blob = AssetBlob.objects.get(file_hash=file_hash)
+        self.assertEqual((blob.ref_count, blob.is_deleting, blob.unreferenced_at), (1, False, None))
+        self.assertEqual(Asset.objects.get(id=result['data']['id']).blob_id, file_hash)
+        with self.storage.open(blob.file_path) as f:
+            self.assertEqual(f.read(), data)
+
+
+class UsageCounterTests(MediaRootMixin, TestCase):
+    """空间占用增量计数与按资源表重新统计的结果一致"""
+
+    def setUp(self):
+        super().setUp()
+        storage_patch = mock.patch('assets.storage._storage', LocalAssetStorage())
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+    def upload(self, name, data):
+        return self.client.post('/api/resource/upload', {
+            'file': SimpleUploadedFile(name, data)
+        }).json()['data']['id']
+
+    @staticmethod
+    def counters():
+        return {
+            row.file_type: (row.file_count, row.total_size)
+            for row in AssetUsage.objects.filter(uploader='admin') if row.file_count or row.total_size
+        }
+
+    def test_counters_match_recount(self):
+        """上传、软删除、恢复、修改类型与大小、批量上传后，增量计数等于重新统计"""
+        document_id = self.upload('a.pdf', b'pdf content')
+        image_id = self.upload('b.png', b'png content!')
+        self.upload('c.pdf', b'pdf content')
+        deleted_id = self.upload('d.txt', b'text')
+
+        self.client.delete(f'/api/resource/delete/{document_id}')
+        self.client.delete(f'/api/resource/delete/{deleted_id}')
+        self.assertEqual(self.client.put(f'/api/resource/restore/{document_id}').json()['code'], 200)
+        result = self.client.put(f'/api/resource/update/{image_id}', {
+            'fileType': 'document', 'fileSize': 2048
+        }, content_type='application/json').json()
+        self.assertEqual(result['code'], 200)
+        result = self.client.post('/api/resource/upload/batch', {'files': [
+            SimpleUploadedFile('e.pdf', b'pdf content'),
+            SimpleUploadedFile('f.png', b'another png'),
+            SimpleUploadedFile('g.png', b'another png'),
+        ]}).json()
+        self.assertEqual(result['code'], 200)
+
+        counters = self.counters()
+        self.assertEqual(counters, {
+            'document': (4, 3 * len(b'pdf content') + 2048),
+            'image': (2, 2 * len(b'another png')),
+        })
+        AssetUsage.objects.all().delete()
+        AssetUsage.initialize('admin', [file_type for file_type, _ in Asset.FILE_TYPE_CHOICES])
+        self.assertEqual(self.counters(), counters)
+
+
+class UploadPrecheckTests(TestCase):
+    """秒传预检"""
+
+    file_hash = hashlib.sha256(b'known').hexdigest()
+
+    def setUp(self):
+        AssetBlob.objects.create(file_hash=self.file_hash, file_size=5, file_path='blobs/known', ref_count=1)
+
+    def precheck(self, file_hash=None, file_size=5):
+        return self.client.post('/api/resource/upload/precheck', {
+            'fileName': 'known.txt', 'fileHash': file_hash or self.file_hash, 'fileSize': file_size
+        }, content_type='application/json').json()
+
+    def test_hit(self):
+        """哈希与大小一致：直接创建引用已有内容的资源"""
+        result = self.precheck()
+        self.assertEqual(result['code'], 200)
+        self.assertTrue(result['data']['hit'])
+        self.assertTrue(result['data']['duplicate'])
+        asset = Asset.objects.get(id=result['data']['id'])
+        self.assertEqual((asset.blob_id, asset.file_size, asset.original_name), (self.file_hash, 5, 'known.txt'))
+        self.assertEqual(AssetBlob.objects.get(file_hash=self.file_hash).ref_count, 2)
+        self.assertEqual(AssetUsage.objects.get(uploader='admin', file_type=asset.file_type).file_count, 1)
+
+    def test_miss(self):
+        """内容不存在：返回 hit=false，不创建资源"""
+        result = self.precheck(file_hash=hashlib.sha256(b'unknown').hexdigest())
+        self.assertEqual(result['data'], {'hit': False})
+        self.assertFalse(Asset.objects.exists())
+
+    def test_size_mismatch(self):
+        """哈希相同但大小不同不视为同一内容，不增加引用"""
+        result = self.precheck(file_size=6)
+        self.assertEqual(result['data'], {'hit': False})
+        self.assertFalse(Asset.objects.exists())
+        self.assertEqual(AssetBlob.objects.get(file_hash=self.file_hash).ref_count, 1)
+
+    def test_blob_being_collected(self):
+        """回收中的内容不能再被引用"""
+        AssetBlob.objects.filter(file_hash=self.file_hash).update(ref_count=0, is_deleting=True)
+        self.assertEqual(self.precheck()['data'], {'hit': False})
+        self.assertEqual(AssetBlob.objects.get(file_hash=self.file_hash).ref_count, 0)
+
+    def test_invalid_hash(self):
+        self.assertEqual(self.precheck(file_hash='xyz')['code'], ErrorCode.PARAM_INVALID.code)
+
+
+@override_settings(ASSET_UPLOAD_MAX_SIZE=100)
+class BatchUploadTests(MediaRootMixin, TestCase):
+    """批量上传"""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = LocalAssetStorage()
+        storage_patch = mock.patch('assets.storage._storage', self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+    def test_batch_upload(self):
+        """批内重复只写一次，已有内容只加引用，空文件与超限文件单独报告，不影响其他文件入库"""
+        existing = b'existing content'
+        self.client.post('/api/resource/upload', {'file': SimpleUploadedFile('old.txt', existing)})
+
+        result = self.client.post('/api/resource/upload/batch', {'files': [
+            SimpleUploadedFile('a.txt', b'new content'),
+            SimpleUploadedFile('b.txt', existing),
+            SimpleUploadedFile('empty.txt', b''),
+            SimpleUploadedFile('c.txt', b'new content'),
+            SimpleUploadedFile('big.txt', b'x' * 101),
+        ]}).json()
+
+        self.assertEqual(result['code'], 200)
+        data = result['data']
+        self.assertEqual((data['total'], data['succeeded']), (5, 3))
+        self.assertEqual(
+            [(item['name'], item['success'], item.get('duplicate')) for item in data['results']],
+            [('a.txt', True, False), ('b.txt', True, True), ('c.txt', True, True),
+             ('empty.txt', False, None), ('big.txt', False, None)]
+        )
+        self.assertEqual(data['results'][-1]['error'], ErrorCode.UPLOAD_RESOURCE_MORE_THAN_MAX_SIZE.message)
+
+        new_hash = hashlib.sha256(b'new content').hexdigest()
+        existing_hash = hashlib.sha256(existing).hexdigest()
+        self.assertEqual(AssetBlob.objects.get(file_hash=new_hash).ref_count, 2)
+        self.assertEqual(AssetBlob.objects.get(file_hash=existing_hash).ref_count, 2)
+        self.assertEqual(Asset.objects.filter(blob_id=new_hash).count(), 2)
+        with self.storage.open(AssetBlob.objects.get(file_hash=new_hash).file_path) as f:
+            self.assertEqual(f.read(), b'new content')
+
+        usage = AssetUsage.objects.get(uploader='admin', file_type='document')
+        self.assertEqual((usage.file_count, usage.total_size), (4, 2 * len(b'new content') + 2 * len(existing)))
+
+    def test_write_failure_releases_refs(self):
+        """新内容写入失败时释放已有内容的引用，不创建资源"""
+        existing = b'existing content'
+        self.client.post('/api/resource/upload', {'file': SimpleUploadedFile('old.txt', existing)})
+
+        with mock.patch.object(self.storage, 'save', side_effect=OSError('disk full')):
+            result = self.client.post('/api/resource/upload/batch', {'files': [
+                SimpleUploadedFile('a.txt', existing),
+                SimpleUploadedFile('b.txt', b'new content'),
+            ]}).json()
+
+        self.assertEqual(result['code'], ErrorCode.SYSTEM_ERROR.code)
+        self.assertEqual(AssetBlob.objects.get(file_hash=hashlib.sha256(existing).hexdigest()).ref_count, 1)
+        self.assertEqual(Asset.objects.count(), 1)
+
+
+def create_asset(asset_id, file_hash, **fields):
+    """创建测试用资源记录"""
+    fields = {
+        'name': f'{asset_id}.txt', 'original_name': f'{asset_id}.txt', 'file_type': 'document', 'file_size': 1,
+        'file_path': f'blobs/{asset_id}', 'file_extension': 'txt', 'mime_type': 'text/plain', **fields
+    }
+    return Asset.objects.create(id=asset_id, file_hash=file_hash, **fields)
+
+
+class AsgiFileResponseTests(MediaRootMixin, TestCase):
+    """ASGI 模式下资源文件以异步迭代器逐块输出，不会被整体读入内存"""
+
+    def setUp(self):
+        super().setUp()
+        storage_patch = mock.patch('assets.storage._storage', LocalAssetStorage())
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        self.data = os.urandom(300_000)
+        os.makedirs(os.path.join(self.media_root, 'blobs'))
+        with open(os.path.join(self.media_root, 'blobs', 'video'), 'wb') as blob_file:
+            blob_file.write(self.data)
+        create_asset('video', hashlib.sha256(self.data).hexdigest(), file_type='video', file_size=len(self.data),
+                     file_path='blobs/video', file_extension='mp4', mime_type='video/mp4')
+
+    async def read(self, response):
+        self.assertTrue(response.is_async)
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_full_file(self):
+        response = await self.async_client.get('/api/resource/download/video')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(await self.read(response), self.data)
+
+    async def test_range(self):
+        response = await self.async_client.get('/api/resource/download/video', headers={'Range': 'bytes=100000-'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100000-{len(self.data) - 1}/{len(self.data)}')
+        self.assertEqual(await self.read(response), self.data[100000:])
+
+
+class RangeDownloadTests(MediaRootMixin, TestCase):
+    """资源下载的 Range 请求"""
+
+    def setUp(self):
+        super().setUp()
+        storage_patch = mock.patch('assets.storage._storage', LocalAssetStorage())
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        self.data = os.urandom(1000)
+        self.asset_id = self.client.post('/api/resource/upload', {
+            'file': SimpleUploadedFile('a.bin', self.data)
+        }).json()['data']['id']
+
+    def download(self, range_header, **headers):
+        return self.client.get(f'/api/resource/download/{self.asset_id}', HTTP_RANGE=range_header, **headers)
+
+    def assert_partial(self, response, start, end):
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/1000')
+        self.assertEqual(int(response['Content-Length']), end - start + 1)
+        self.assertEqual(b''.join(response.streaming_content), self.data[start:end + 1])
+
+    def assert_full(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Range'))
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+
+    def test_single_range(self):
+        self.assert_partial(self.download('bytes=100-199'), 100, 199)
+        # 结束位置超出文件时截断到文件末尾
+        self.assert_partial(self.download('bytes=900-5000'), 900, 999)
+        etag = f'"{hashlib.sha256(self.data).hexdigest()}"'
+        self.assert_partial(self.download('bytes=0-0', HTTP_IF_RANGE=etag), 0, 0)
+
+    def test_suffix_range(self):
+        self.assert_partial(self.download('bytes=-100'), 900, 999)
+        self.assert_partial(self.download('bytes=-5000'), 0, 999)
+
+    def test_open_ended_range(self):
+        self.assert_partial(self.download('bytes=990-'), 990, 999)
+
+    def test_unsatisfiable_range(self):
+        for range_header in ('bytes=1000-', 'bytes=-0'):
+            response = self.download(range_header)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response['Content-Range'], 'bytes */1000')
+
+    def test_unsupported_range_falls_back_to_full_file(self):
+        """多区间、格式无法识别或 If-Range 不匹配时返回整文件"""
+        self.assert_full(self.download('bytes=0-9,20-29'))
+        self.assert_full(self.download('bytes=20-10'))
+        self.assert_full(self.download('items=0-9'))
+        self.assert_full(self.download('bytes=0-9', HTTP_IF_RANGE='"stale"'))
+
+
+class HotAssetCacheTests(SimpleTestCase):
+    """热点缓存：LRU 淘汰、字节上限与过期"""
+
+    def test_evicts_least_recently_used_by_count(self):
+        cache = HotAssetCache(max_bytes=1000, max_entries=2, ttl=60)
+        cache.put('a', b'1', {})
+        cache.put('b', b'2', {})
+        cache.get('a')
+        cache.put('c', b'3', {})
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_byte_budget(self):
+        cache = HotAssetCache(max_bytes=10, max_entries=100, ttl=60)
+        cache.put('a', b'x' * 4, {})
+        cache.put('b', b'x' * 4, {})
+        cache.put('c', b'x' * 4, {})
+        self.assertEqual((cache.total_bytes, cache.get('a')), (8, None))
+        self.assertIsNone(cache.put('big', b'x' * 11, {}))
+        self.assertEqual(cache.total_bytes, 8)
+
+        # 覆盖写入同一个键时按新内容计数
+        cache.put('b', b'x' * 2, {})
+        self.assertEqual(cache.total_bytes, 6)
+
+    def test_expired_entries(self):
+        cache = HotAssetCache(max_bytes=100, max_entries=10, ttl=60)
+        with mock.patch('assets.hot_cache.time.monotonic', return_value=1000):
+            cache.put('a', b'123', {})
+        with mock.patch('assets.hot_cache.time.monotonic', return_value=1060):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.total_bytes, 0)
+
+
+class HotCacheDownloadTests(MediaRootMixin, TestCase):
+    """下载接口的热点缓存：按内容哈希缓存，每次请求确认资源仍然有效"""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = LocalAssetStorage()
+        for name, value in (('assets.storage._storage', self.storage),
+                            ('assets.hot_cache._hot_cache', HotAssetCache(1024 * 1024, 100, 60))):
+            patcher = mock.patch(name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.data = b'%PDF small file'
+        self.file_hash = hashlib.sha256(self.data).hexdigest()
+        os.makedirs(os.path.join(self.media_root, 'blobs'))
+        with open(os.path.join(self.media_root, 'blobs', 'doc'), 'wb') as blob_file:
+            blob_file.write(self.data)
+        for asset_id, name in (('doc1', 'a.pdf'), ('doc2', 'b.pdf')):
+            create_asset(asset_id, self.file_hash, original_name=name, file_size=len(self.data),
+                         file_path='blobs/doc', file_extension='pdf', mime_type='application/pdf')
+
+    def download(self, asset_id, **headers):
+        return self.client.get(f'/api/resource/download/{asset_id}', headers=headers)
+
+    def test_served_from_cache(self):
+        first = self.download('doc1')
+        self.assertEqual(first.content, self.data)
+
+        with mock.patch.object(self.storage, 'open', side_effect=AssertionError('不应读取文件')):
+            cached = self.download('doc1')
+            # 相同内容的其他资源共用条目，文件名按各自的资源记录生成
+            other = self.download('doc2')
+            not_modified = self.download('doc1', **{'If-None-Match': f'"{self.file_hash}"'})
+
+        self.assertEqual(cached.content, self.data)
+        self.assertIn('a.pdf', cached['Content-Disposition'])
+        self.assertEqual(other.content, self.data)
+        self.assertIn('b.pdf', other['Content-Disposition'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_deleted_asset_is_not_served_from_cache(self):
+        self.download('doc1')
+        # 其他进程删除了资源
+        Asset.objects.filter(id='doc1').update(is_valid=False)
+        self.assertEqual(self.download('doc1').json()['code'], ErrorCode.RESOURCE_NOT_FOUND.code)
+
+
+class ResourceListPaginationTests(TestCase):
+    """资源列表游标分页"""
+
+    def setUp(self):
+        # 每 4 条共用一个上传时间，翻页游标落在相同时间的记录之间
+        base_time = timezone.now() - timedelta(days=1)
+        for index in range(22):
+            asset = create_asset(f'asset{index:02d}', '')
+            Asset.objects.filter(id=asset.id).update(upload_time=base_time - timedelta(minutes=index // 4))
+        self.expected_ids = list(Asset.objects.order_by('-upload_time', '-id').values_list('id', flat=True))
+
+    def list_page(self, **params):
+        return self.client.get('/api/resource/list', {'pageSize': 5, **params}).json()
+
+    def test_cursor_pages_are_stable(self):
+        """相同上传时间的记录不重复、不遗漏，翻页期间新上传的资源不影响后续页"""
+        seen_ids = []
+        result = self.list_page()
+        while True:
+            seen_ids += [item['id'] for item in result['data']['list']]
+            if not result['data']['hasMore']:
+                break
+            create_asset(f'new{len(seen_ids):02d}', '')
+            result = self.list_page(cursor=result['data']['nextCursor'])
+        self.assertEqual(seen_ids, self.expected_ids)
+
+    def test_total_only_when_requested(self):
+        """统计默认只在首页计算，翻页请求显式要求时才计算"""
+        with mock.patch('assets.views.get_usage_summary', wraps=get_usage_summary) as usage_summary:
+            first_page = self.list_page()
+            self.assertEqual(first_page['data']['total'], 22)
+            self.assertEqual(usage_summary.call_count, 1)
+
+            cursor = first_page['data']['nextCursor']
+            self.assertIsNone(self.list_page(cursor=cursor)['data']['total'])
+            self.assertIsNone(self.list_page(withTotal='false')['data']['total'])
+            self.assertEqual(usage_summary.call_count, 1)
+
+            self.assertEqual(self.list_page(cursor=cursor, withTotal='true')['data']['total'], 22)
+            self.assertEqual(usage_summary.call_count, 2)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.list_page(cursor='not-a-cursor')['code'], ErrorCode.PARAM_INVALID.code)
+
+
+class ScrubCandidateTests(TestCase):
+    """完整性巡检的候选资源"""
+
+    def test_skips_soft_deleted_assets(self):
+        from .scrubber import get_scrub_candidates
+
+        kept = create_asset('a', 'a' * 64)
+        create_asset('b', 'b' * 64, is_valid=False)
+        self.assertEqual(list(get_scrub_candidates(24)), [kept])
+
+
+@override_settings(ASSET_CHUNK_DEDUP_MIN_SIZE=1024 * 1024)
+class ChunkedAssetStorageTests(MediaRootMixin, TestCase):
+    """分块去重存储（本地存储后端）"""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = ChunkedAssetStorage(LocalAssetStorage())
+        storage_patch = mock.patch('assets.storage._storage', self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+    @staticmethod
+    def make_data(size, seed=0):
+        return random.Random(seed).randbytes(size)
+
+    def save(self, name, data):
+        self.storage.save(name, self.write_temp_file(data))
+
+    def read(self, name):
+        with self.storage.open(name) as file_obj:
+            return file_obj.read()
+
+    def chunk_refs(self):
+        return dict(AssetChunk.objects.values_list('chunk_hash', 'ref_count'))
+
+    def gc(self):
+        call_command('gc_asset_blobs', grace_hours=0, max_per_second=0, stdout=io.StringIO())
+
+    def test_cut_points_do_not_depend_on_read_size(self):
+        data = self.make_data(6 * 1024 * 1024)
+
+        class SmallReads(io.BytesIO):
+            def read(self, size=-1):
+                return super().read(min(size, 100_000))
+
+        chunks = list(iter_chunks(io.BytesIO(data)))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(chunks), data)
+        self.assertEqual(list(iter_chunks(SmallReads(data))), chunks)
+
+    def test_round_trip(self):
+        data = self.make_data(5 * 1024 * 1024)
+        self.save('blobs/a', data)
+
+        manifest = AssetManifest.objects.get(name='blobs/a')
+        self.assertEqual((manifest.file_size, manifest.chunk_count), (len(data), manifest.entries.count()))
+        self.assertIsNone(self.storage.path('blobs/a'))
+        self.assertEqual(self.storage.size('blobs/a'), len(data))
+        self.assertEqual(self.read('blobs/a'), data)
+        self.assertTrue(all(count == 1 for count in self.chunk_refs().values()))
+
+        self.storage.delete('blobs/a')
+        self.assertFalse(self.storage.exists('blobs/a'))
+        self.assertTrue(all(count == 0 for count in self.chunk_refs().values()))
+        self.gc()
+        self.assertFalse(AssetChunk.objects.exists())
+        self.assertEqual([files for _, _, files in os.walk(os.path.join(self.media_root, 'chunks')) if files], [])
+
+    def test_edited_file_shares_chunks(self):
+        """局部修改后的新版本只保存改动附近的分块"""
+        data = self.make_data(8 * 1024 * 1024)
+        edited = data[:4 * 1024 * 1024] + b'edited' + data[4 * 1024 * 1024 + 6:]
+        self.save('blobs/v1', data)
+        v1_chunks = set(self.chunk_refs())
+        self.save('blobs/v2', edited)
+
+        shared = v1_chunks & set(self.chunk_refs())
+        self.assertGreaterEqual(len(shared), len(v1_chunks) - 2)
+        self.assertLessEqual(AssetChunk.objects.count() - len(v1_chunks), 2)
+        self.assertEqual(self.read('blobs/v1'), data)
+        self.assertEqual(self.read('blobs/v2'), edited)
+
+        # 删除旧版本后共享分块仍被新版本引用，不会被回收
+        self.storage.delete('blobs/v1')
+        self.gc()
+        self.assertEqual(self.read('blobs/v2'), edited)
+        self.assertTrue(all(count > 0 for count in self.chunk_refs().values()))
+
+    def test_reused_chunks_are_not_collected(self):
+        """引用归零后重新写入相同内容：分块被重新引用，回收时跳过"""
+        data = self.make_data(3 * 1024 * 1024)
+        self.save('blobs/a', data)
+        self.storage.delete('blobs/a')
+        self.save('blobs/b', data)
+
+        self.gc()
+        self.assertEqual(self.read('blobs/b'), data)
+        self.assertTrue(all(count == 1 for count in self.chunk_refs().values()))
+
+    def test_upload_waits_for_chunk_being_collected(self):
+        """分块已被回收认领时，写入方等待回收删除文件与记录后重新写入，新文件不会被删除"""
+        data = self.make_data(3 * 1024 * 1024)
+        self.save('blobs/a', data)
+        self.storage.delete('blobs/a')
+        claimed = AssetChunk.objects.order_by('chunk_hash').first()
+        self.assertTrue(AssetChunk.claim(claimed.chunk_hash, 0))
+
+        def finish_gc(seconds):
+            # 回收进程随后删除文件和记录
+            self.storage.delete(claimed.file_path)
+            AssetChunk.objects.filter(chunk_hash=claimed.chunk_hash, is_deleting=True).delete()
+
+        with mock.patch('assets.models.time.sleep', side_effect=finish_gc) as sleep:
+            self.save('blobs/b', data)
+
+        sleep.assert_called()
+        self.assertEqual(self.read('blobs/b'), data)
+        chunk = AssetChunk.objects.get(chunk_hash=claimed.chunk_hash)
+        self.assertEqual((chunk.ref_count, chunk.is_deleting), (1, False))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, chunk.file_path)))
+
+    def test_failed_write_releases_chunks(self):
+        """清单创建失败时释放已累加的引用，新分块在保留期后可被回收"""
+        data = self.make_data(3 * 1024 * 1024)
+        with mock.patch.object(AssetManifestChunk.objects, 'bulk_create', side_effect=RuntimeError('db error')), \
+                self.assertRaises(RuntimeError):
+            self.save('blobs/a', data)
+
+        self.assertFalse(AssetManifest.objects.exists())
+        self.assertTrue(all(count == 0 for count in self.chunk_refs().values()))
+        self.gc()
+        self.assertFalse(AssetChunk.objects.exists())
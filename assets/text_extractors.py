@@ -0,0 +1,163 @@
+"""
+文档纯文本提取（在子进程中执行，不依赖 Django）
+各格式按页 / 段落 / 行流式产出文本片段，内存占用与文档大小无关：
+- PDF：逐页提取
+- DOCX：流式解析 word/document.xml，逐段落产出
+- TXT / MD：按块增量解码（UTF-8，失败时按 GB18030）
+- CSV：逐行读取，单元格以空格连接
+提取结果按固定长度切块，以 JSON Lines 写入结果文件，由主进程分批入库。
+"""
+import codecs
+import csv
+import io
+import json
+import re
+import zipfile
+from xml.etree import ElementTree
+
+# 支持提取文本的扩展名
+TEXT_EXTRACT_EXTENSIONS = ('.pdf', '.docx', '.txt', '.md', '.csv')
+
+# 读取纯文本的块大小
+TEXT_READ_BLOCK_SIZE = 64 * 1024
+
+# DOCX 正文命名空间
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# 连续空白压缩为一个空格（换行保留一个）
+_SPACES = re.compile(r'[ \t\r\f\v　\xa0]+')
+_NEWLINES = re.compile(r'\n\s*\n+')
+
+
+def iter_pdf_text(file_path):
+    """逐页产出 PDF 文本"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    for page in reader.pages:
+        yield page.extract_text() or ''
+        yield '\n'
+
+
+def iter_docx_text(file_path):
+    """流式解析 DOCX 正文，逐段落产出文本（不加载整个 XML 树）"""
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open('word/document.xml') as document:
+            parts = []
+            for event, element in ElementTree.iterparse(document, events=('end',)):
+                if element.tag == f'{WORD_NAMESPACE}t' and element.text:
+                    parts.append(element.text)
+                elif element.tag == f'{WORD_NAMESPACE}tab':
+                    parts.append('\t')
+                elif element.tag == f'{WORD_NAMESPACE}p':
+                    yield ''.join(parts) + '\n'
+                    parts = []
+                    # 段落处理完即释放，避免整棵树驻留内存
+                    element.clear()
+
+
+def _detect_encoding(file_path):
+    """根据文件开头判断编码：UTF-8（含 BOM）或 GB18030"""
+    with open(file_path, 'rb') as f:
+        head = f.read(TEXT_READ_BLOCK_SIZE)
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'gb18030'
+
+
+def iter_plain_text(file_path):
+    """按块增量解码纯文本"""
+    encoding = _detect_encoding(file_path)
+    with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+        for block in iter(lambda: f.read(TEXT_READ_BLOCK_SIZE), ''):
+            yield block
+
+
+def iter_csv_text(file_path):
+    """逐行产出 CSV 内容"""
+    encoding = _detect_encoding(file_path)
+    with open(file_path, 'r', encoding=encoding, errors='replace', newline='') as f:
+        for row in csv.reader(f):
+            yield ' '.join(cell for cell in row if cell) + '\n'
+
+
+TEXT_ITERATORS = {
+    '.pdf': iter_pdf_text,
+    '.docx': iter_docx_text,
+    '.txt': iter_plain_text,
+    '.md': iter_plain_text,
+    '.csv': iter_csv_text,
+}
+
+
+def normalize_text(text):
+    """压缩连续空白与空行，减少存储"""
+    text = _SPACES.sub(' ', text)
+    return _NEWLINES.sub('\n', text)
+
+
+def iter_text_chunks(file_path, file_extension, chunk_chars, max_chars):
+    """
+    将文档文本切分为不超过 chunk_chars 的块
+    :param max_chars: 总字符数上限，超出部分丢弃
+    :return: 文本块迭代器；生成器返回值为是否被截断
+    """
+    buffer = io.StringIO()
+    buffered = 0
+    total = 0
+
+    for piece in TEXT_ITERATORS[file_extension](file_path):
+        piece = normalize_text(piece)
+        if not piece.strip() and buffered == 0:
+            continue
+        if total + len(piece) > max_chars:
+            piece = piece[:max_chars - total]
+        buffer.write(piece)
+        buffered += len(piece)
+        total += len(piece)
+
+        while buffered >= chunk_chars:
+            text = buffer.getvalue()
+            # 尽量在换行处切分，保持段落完整
+            cut = text.rfind('\n', 0, chunk_chars)
+            cut = cut + 1 if cut > chunk_chars // 2 else chunk_chars
+            yield text[:cut].strip()
+            buffer = io.StringIO(text[cut:])
+            buffer.seek(0, io.SEEK_END)
+            buffered = len(text) - cut
+
+        if total >= max_chars:
+            break
+
+    rest = buffer.getvalue().strip()
+    if rest:
+        yield rest
+    return total >= max_chars
+
+
+def extract_text_to_file(file_path, file_extension, result_path, chunk_chars, max_chars):
+    """
+    提取文档文本，逐块写入 JSON Lines 结果文件（在子进程中执行）
+    :return: (块数, 字符数, 是否被截断)
+    """
+    chunk_count = 0
+    char_count = 0
+    chunks = iter_text_chunks(file_path, file_extension, chunk_chars, max_chars)
+    truncated = False
+    with open(result_path, 'w', encoding='utf-8') as result_file:
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration as stop:
+                truncated = bool(stop.value)
+                break
+            if not chunk:
+                continue
+            result_file.write(json.dumps(chunk, ensure_ascii=False) + '\n')
+            chunk_count += 1
+            char_count += len(chunk)
+    return chunk_count, char_count, truncated
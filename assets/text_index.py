@@ -0,0 +1,195 @@
+"""
+文档文本索引
+上传完成（事务提交）后由后台线程调度：原文件交给进程池提取文本（见 text_extractors），
+主进程逐行读取结果文件并分批写入 AssetTextChunk，整个过程不会把文档全文读入内存。
+提取结果按内容哈希保存，相同内容只提取一次；正文块可与文章一起检索，也供 AI 助手检索使用。
+"""
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from article.models import Article
+from .models import Asset, AssetText, AssetTextChunk
+from .storage import get_asset_storage
+from .text_extractors import TEXT_EXTRACT_EXTENSIONS, extract_text_to_file
+
+# 文本块分批写入数据库的数量
+CHUNK_INSERT_BATCH_SIZE = 100
+
+# 检索结果摘要中关键词前后保留的字符数
+SNIPPET_CONTEXT_CHARS = 60
+
+_process_pool = None
+_dispatcher = None
+_pool_lock = threading.Lock()
+
+
+def _get_pools():
+    """懒加载提取进程池与调度线程池（每个 worker 进程各自持有），调度线程数与进程数一致"""
+    global _process_pool, _dispatcher
+    with _pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=settings.ASSET_TEXT_WORKERS)
+            _dispatcher = ThreadPoolExecutor(max_workers=settings.ASSET_TEXT_WORKERS)
+        return _process_pool, _dispatcher
+
+
+def is_text_extractable(asset):
+    """资源是否支持提取文本"""
+    return asset.file_type == 'document' and asset.file_extension in TEXT_EXTRACT_EXTENSIONS
+
+
+def _save_chunks(text, result_path):
+    """逐行读取提取结果，分批写入文本块"""
+    batch = []
+    with open(result_path, 'r', encoding='utf-8') as result_file:
+        for seq, line in enumerate(result_file):
+            batch.append(AssetTextChunk(text=text, seq=seq, content=json.loads(line)))
+            if len(batch) >= CHUNK_INSERT_BATCH_SIZE:
+                AssetTextChunk.objects.bulk_create(batch)
+                batch = []
+    if batch:
+        AssetTextChunk.objects.bulk_create(batch)
+
+
+def index_asset_text(asset):
+    """
+    提取资源文本并入库；相同内容已提取过时直接跳过
+    :return: AssetText 对象；不支持的类型返回 None
+    """
+    if not is_text_extractable(asset) or not asset.file_hash:
+        return None
+
+    existing = AssetText.objects.filter(file_hash=asset.file_hash).first()
+    if existing is not None:
+        return existing
+
+    process_pool, _ = _get_pools()
+    fd, result_path = tempfile.mkstemp(suffix='.jsonl')
+    os.close(fd)
+    try:
+        try:
+            with get_asset_storage().local_copy(asset.file_path) as file_path:
+                chunk_count, char_count, truncated = process_pool.submit(
+                    extract_text_to_file,
+                    file_path,
+                    asset.file_extension,
+                    result_path,
+                    settings.ASSET_TEXT_CHUNK_CHARS,
+                    settings.ASSET_TEXT_MAX_CHARS
+                ).result(timeout=settings.ASSET_TEXT_TIMEOUT)
+        except Exception as e:
+            # 文件损坏、加密或超时：记录失败，避免反复重试
+            print(f"提取文档文本失败: {asset.id}: {str(e)}")
+            text, _ = AssetText.objects.update_or_create(
+                file_hash=asset.file_hash,
+                defaults={'status': 'failed', 'chunk_count': 0, 'char_count': 0, 'truncated': False}
+            )
+            return text
+
+        with transaction.atomic():
+            text, _ = AssetText.objects.update_or_create(
+                file_hash=asset.file_hash,
+                defaults={
+                    'status': 'done',
+                    'chunk_count': chunk_count,
+                    'char_count': char_count,
+                    'truncated': truncated
+                }
+            )
+            text.chunks.all().delete()
+            _save_chunks(text, result_path)
+        return text
+    finally:
+        os.remove(result_path)
+
+
+def _index_in_worker(asset_id):
+    """调度线程任务：线程中的数据库连接不会被请求结束信号关闭，用完即关"""
+    try:
+        asset = Asset.objects.filter(id=asset_id).first()
+        if asset is not None:
+            index_asset_text(asset)
+    except Exception as e:
+        print(f"文档文本入库失败: {asset_id}: {str(e)}")
+    finally:
+        connection.close()
+
+
+def schedule_text_extraction(assets):
+    """在当前事务提交后为支持的文档提交后台提取任务（未完成的任务可由 extract_asset_text 命令补齐）"""
+    asset_ids = [asset.id for asset in assets if is_text_extractable(asset)]
+    if not asset_ids:
+        return
+
+    def submit():
+        _, dispatcher = _get_pools()
+        for asset_id in asset_ids:
+            dispatcher.submit(_index_in_worker, asset_id)
+
+    transaction.on_commit(submit)
+
+
+def get_unindexed_assets():
+    """支持提取文本但尚无提取结果的有效资源"""
+    return Asset.objects.filter(
+        is_valid=True,
+        file_type='document',
+        file_extension__in=TEXT_EXTRACT_EXTENSIONS
+    ).exclude(file_hash__in=AssetText.objects.values('file_hash'))
+
+
+def build_snippet(content, keyword):
+    """截取关键词附近的文本作为摘要"""
+    position = content.lower().find(keyword.lower())
+    if position < 0:
+        return content[:SNIPPET_CONTEXT_CHARS * 2]
+    start = max(position - SNIPPET_CONTEXT_CHARS, 0)
+    end = position + len(keyword) + SNIPPET_CONTEXT_CHARS
+    return ('…' if start > 0 else '') + content[start:end] + ('…' if end < len(content) else '')
+
+
+def search_documents(keyword, uploader, limit):
+    """
+    在文档正文中检索关键词
+    :return: [(Asset 对象, 摘要), ...]，每个文档只取首个命中的文本块
+    """
+    valid_hashes = Asset.objects.filter(is_valid=True, uploader=uploader).values('file_hash')
+    chunks = (
+        AssetTextChunk.objects.filter(content__icontains=keyword, text_id__in=valid_hashes)
+        .order_by('text_id', 'seq')
+        .values_list('text_id', 'content')
+    )
+
+    snippets = {}
+    for file_hash, content in chunks.iterator():
+        if file_hash not in snippets:
+            snippets[file_hash] = build_snippet(content, keyword)
+            if len(snippets) >= limit:
+                break
+
+    assets = (
+        Asset.objects.filter(is_valid=True, uploader=uploader, file_hash__in=snippets)
+        .select_related('linked_article')
+        .order_by('-upload_time')
+    )
+    return [(asset, snippets[asset.file_hash]) for asset in assets][:limit]
+
+
+def search_articles(keyword, limit):
+    """
+    按标题与正文检索文章
+    :return: [(Article 对象, 摘要), ...]
+    """
+    articles = (
+        Article.objects.filter(is_valid=True)
+        .filter(Q(title__icontains=keyword) | Q(content__icontains=keyword))
+        .order_by('-updated_at')[:limit]
+    )
+    return [(article, build_snippet(article.content or '', keyword)) for article in articles]
@@ -0,0 +1,168 @@
+"""
+图片缩略图 / 尺寸变体
+- /api/resource/view/<id>?w=&h=&fmt= 首次请求时在进程池中生成，之后直接读取磁盘缓存
+- 变体按内容存储块的哈希缓存在 MEDIA_ROOT/derivatives 下，内容不变则缓存永久有效
+- 请求尺寸向上取整到固定档位，避免任意尺寸导致缓存膨胀
+"""
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.http import FileResponse
+from PIL import Image, ImageOps
+
+from .blob_store import derivative_dir
+from .storage import get_asset_storage
+
+# 尺寸档位（像素）
+THUMBNAIL_SIZES = (64, 128, 256, 512, 1024, 2048)
+
+# 支持输出的格式 -> (Pillow 格式, MIME 类型)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'jpg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+# 原图扩展名 -> 默认输出格式（未指定 fmt 时）
+DEFAULT_FORMATS = {'.jpg': 'jpeg', '.jpeg': 'jpeg', '.png': 'png'}
+
+# 不生成变体的扩展名（矢量图直接返回原图）
+UNSUPPORTED_EXTENSIONS = ('.svg',)
+
+_executor = None
+_executor_lock = threading.Lock()
+# 正在生成中的变体，相同变体的并发请求共用一个任务
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def _get_executor():
+    """懒加载进程池（每个 worker 进程各自持有）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=settings.ASSET_THUMBNAIL_WORKERS)
+        return _executor
+
+
+def _snap_size(value):
+    """将请求尺寸向上取整到档位，超出最大档位时取最大档位"""
+    for size in THUMBNAIL_SIZES:
+        if value <= size:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+
+def has_variant_params(params):
+    """请求是否带有缩略图参数"""
+    return any(params.get(key) for key in ('w', 'h', 'fmt'))
+
+
+def parse_variant_params(params, file_extension):
+    """
+    解析缩略图参数
+    :param params: 查询参数
+    :param file_extension: 原图扩展名
+    :return: (宽, 高, 格式)，宽高为 0 表示该方向不限制；参数无效时返回 None
+    """
+    try:
+        width = int(params.get('w') or 0)
+        height = int(params.get('h') or 0)
+    except ValueError:
+        return None
+    if width < 0 or height < 0:
+        return None
+
+    fmt = (params.get('fmt') or DEFAULT_FORMATS.get(file_extension, 'webp')).lower()
+    if fmt not in THUMBNAIL_FORMATS:
+        return None
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+
+    width = _snap_size(width) if width else 0
+    height = _snap_size(height) if height else 0
+    return width, height, fmt
+
+
+def render_variant(src_path, dest_path, width, height, fmt):
+    """
+    生成缩略图（在子进程中执行）
+    保持宽高比缩放到不超过 宽x高，不放大原图；写入临时文件后原子替换，避免读到半成品
+    """
+    pil_format = THUMBNAIL_FORMATS[fmt][0]
+    with Image.open(src_path) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width or image.width, height or image.height))
+        if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        elif image.mode == 'P':
+            image = image.convert('RGBA')
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        temp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+        image.save(temp_path, pil_format, quality=82)
+    os.replace(temp_path, dest_path)
+
+
+def get_variant_path(asset, width, height, fmt):
+    """
+    获取缩略图文件路径，缓存不存在时在进程池中生成
+    原图在对象存储中时先下载到本地临时文件，仅在缓存未命中时发生
+    :return: 缩略图绝对路径；原图无法解码时返回 None
+    """
+    if asset.file_extension in UNSUPPORTED_EXTENSIONS or not asset.file_hash:
+        return None
+
+    variant_path = os.path.join(derivative_dir(asset.file_hash), f"{width}x{height}.{fmt}")
+    if os.path.exists(variant_path):
+        return variant_path
+
+    with _pending_lock:
+        future = _pending.get(variant_path)
+        owner = future is None
+        if owner:
+            future = Future()
+            _pending[variant_path] = future
+
+    try:
+        if owner:
+            # 由首个请求负责准备原图并提交生成任务，其余并发请求等待同一结果
+            try:
+                with get_asset_storage().local_copy(asset.file_path) as src_path:
+                    _get_executor().submit(
+                        render_variant, src_path, variant_path, width, height, fmt
+                    ).result(timeout=settings.ASSET_THUMBNAIL_TIMEOUT)
+                future.set_result(variant_path)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with _pending_lock:
+                    _pending.pop(variant_path, None)
+        future.result(timeout=settings.ASSET_THUMBNAIL_TIMEOUT)
+    except Exception as e:
+        print(f"生成缩略图失败: {asset.id} {width}x{height}.{fmt}: {str(e)}")
+        return None
+
+    return variant_path
+
+
+def variant_headers(asset, variant_path, fmt):
+    """缩略图响应头：内容只随存储块哈希变化，可长期缓存"""
+    return {
+        'Content-Type': THUMBNAIL_FORMATS[fmt][1],
+        'ETag': f'"{asset.file_hash}-{os.path.basename(variant_path)}"',
+        'Cache-Control': 'public, max-age=31536000, immutable'
+    }
+
+
+def build_variant_response(asset, variant_path, fmt):
+    """缩略图响应"""
+    headers = variant_headers(asset, variant_path, fmt)
+    response = FileResponse(open(variant_path, 'rb'), content_type=headers.pop('Content-Type'))
+    for header, value in headers.items():
+        response[header] = value
+    return response
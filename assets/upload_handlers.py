@@ -0,0 +1,107 @@
+"""
+资源上传处理器
+边接收上传数据边写入暂存文件并计算哈希，整个上传只经过一次磁盘写入：
+- 暂存目录与 MEDIA_ROOT 同盘，本地存储入库时直接重命名为内容存储块，不再重新读取
+- 与已有内容重复时直接删除暂存文件，存储后端中不会写入任何字节
+"""
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+from .models import UPLOAD_TEMP_DIR
+from .upload_utils import IO_BLOCK_SIZE, new_file_hash
+
+
+class HashedUploadedFile(UploadedFile):
+    """已写入暂存文件并附带哈希值的上传文件"""
+
+    def __init__(self, file, name, content_type, size, charset, content_type_extra=None, file_hash=None):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.file_hash = file_hash
+
+    def temporary_file_path(self):
+        """暂存文件的绝对路径"""
+        return self.file.name
+
+    def discard(self):
+        """删除未被使用的暂存文件（已移动时无操作）"""
+        self.file.close()
+        if os.path.exists(self.temporary_file_path()):
+            os.remove(self.temporary_file_path())
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    单次写入的上传处理器
+    :param request: Django 请求对象
+    :param max_size: 单个文件大小上限，超过时停止接收该文件并标记 size_exceeded
+    同一请求中的多个文件依次写入各自的暂存文件，超限被跳过的文件名记录在 skipped_files
+    """
+    chunk_size = IO_BLOCK_SIZE
+
+    def __init__(self, request=None, max_size=None):
+        super().__init__(request)
+        self.max_size = max_size
+        self.size_exceeded = False
+        self.skipped_files = []
+        self.temp_paths = []
+        self.file_hash = None
+        self.received = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        temp_dir = os.path.join(settings.MEDIA_ROOT, UPLOAD_TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+        self.file = open(os.path.join(temp_dir, f"{uuid.uuid4().hex}.upload"), 'w+b')
+        self.temp_paths.append(self.file.name)
+        self.file_hash = new_file_hash()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.max_size is not None and self.received > self.max_size:
+            self.size_exceeded = True
+            self.skipped_files.append(self.file_name)
+            self._remove_temp_file()
+            raise SkipFile()
+
+        self.file_hash.update(raw_data)
+        self.file.write(raw_data)
+        # 返回 None，数据不再传给后续处理器
+        return None
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        uploaded_file = HashedUploadedFile(
+            file=self.file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            file_hash=self.file_hash.hexdigest()
+        )
+        # 文件已交给 HashedUploadedFile 管理，解析器清理时不再关闭它
+        del self.file
+        return uploaded_file
+
+    def upload_interrupted(self):
+        self._remove_temp_file()
+
+    def _remove_temp_file(self):
+        """关闭并删除当前暂存文件"""
+        if hasattr(self, 'file'):
+            self.file.close()
+            if os.path.exists(self.file.name):
+                os.remove(self.file.name)
+            del self.file
+
+    def discard_all(self):
+        """删除本次请求产生的、仍未被移动的所有暂存文件（用于请求中途失败时清理）"""
+        for temp_path in self.temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
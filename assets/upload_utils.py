@@ -0,0 +1,132 @@
+"""
+资源上传公共逻辑
+- 根据扩展名判断文件类型
+- 计算文件哈希
+- 创建资源记录并组装上传接口的返回数据
+"""
+import hashlib
+import mimetypes
+import os
+import uuid
+
+from .metadata import schedule_metadata_extraction
+from .models import Asset
+from .serializers import AssetSerializer
+from .text_index import schedule_text_extraction
+
+# 扩展名 -> 文件类型
+FILE_TYPE_EXTENSIONS = {
+    'document': ['.pdf', '.doc', '.docx', '.txt', '.md', '.xls', '.xlsx', '.csv', '.ppt', '.pptx'],
+    'image': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg'],
+    'audio': ['.mp3', '.wav', '.flac', '.aac'],
+    'video': ['.mp4', '.avi', '.mov', '.wmv', '.flv'],
+    'archive': ['.zip', '.rar', '.7z', '.tar', '.gz'],
+    'code': ['.py', '.js', '.html', '.css', '.java', '.cpp'],
+}
+
+# 分片读写的块大小
+IO_BLOCK_SIZE = 64 * 1024
+
+# 资源去重使用的哈希算法
+FILE_HASH_ALGORITHM = 'sha256'
+
+
+def detect_file_type(file_extension):
+    """根据扩展名确定文件类型"""
+    for file_type, extensions in FILE_TYPE_EXTENSIONS.items():
+        if file_extension in extensions:
+            return file_type
+    return 'other'
+
+
+def generate_asset_id():
+    """生成资源ID"""
+    return str(uuid.uuid4()).replace('-', '')[:16]
+
+
+def normalize_source_type(source_type):
+    """校验资源来源类型，不合法时归为 other"""
+    valid_source_types = [choice[0] for choice in Asset.SOURCE_TYPE_CHOICES]
+    return source_type if source_type in valid_source_types else 'other'
+
+
+def new_file_hash():
+    """创建资源去重用的哈希对象"""
+    return hashlib.new(FILE_HASH_ALGORITHM)
+
+
+def is_valid_file_hash(value):
+    """校验客户端提交的文件哈希（小写十六进制，长度与哈希算法一致）"""
+    return (
+        isinstance(value, str)
+        and len(value) == new_file_hash().digest_size * 2
+        and all(c in '0123456789abcdef' for c in value)
+    )
+
+
+def hash_stream(file_obj):
+    """顺序分块计算文件对象的哈希，内存占用与文件大小无关"""
+    file_hash = new_file_hash()
+    for block in iter(lambda: file_obj.read(IO_BLOCK_SIZE), b''):
+        file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def hash_file(abs_file_path):
+    """顺序分块计算本地文件哈希"""
+    with open(abs_file_path, 'rb') as f:
+        return hash_stream(f)
+
+
+def save_asset_record(blob, original_name, source_type='other', linked_article_id=None):
+    """
+    创建引用内容存储块的资源记录，计入空间统计，并在提交后后台提取元数据与文档文本
+    :param blob: AssetBlob 内容存储块
+    :param original_name: 原始文件名
+    :param source_type: 资源来源类型
+    :param linked_article_id: 关联文章ID
+    :return: Asset 对象
+    """
+    file_extension = os.path.splitext(original_name)[1].lower()
+    asset_data = {
+        'id': generate_asset_id(),
+        'name': original_name,
+        'original_name': original_name,
+        'file_type': detect_file_type(file_extension),
+        'file_size': blob.file_size,
+        'file_path': blob.file_path,  # 存储相对路径
+        'file_extension': file_extension,
+        'mime_type': mimetypes.guess_type(original_name)[0] or 'application/octet-stream',
+        'file_hash': blob.file_hash,
+        'uploader': 'admin',  # 直接写死admin用户
+        'source_type': normalize_source_type(source_type)
+    }
+
+    # 处理关联文章
+    if linked_article_id:
+        asset_data['linked_article'] = linked_article_id
+        asset_data['is_linked'] = True
+
+    # 使用序列化器创建资源记录
+    serializer = AssetSerializer(data=asset_data)
+    serializer.is_valid(raise_exception=True)
+    asset = serializer.save(blob=blob)
+    asset.record_usage()
+    schedule_metadata_extraction([asset.id])
+    schedule_text_extraction([asset])
+    return asset
+
+
+def build_upload_result(asset, duplicate=False):
+    """组装上传接口的返回数据"""
+    return {
+        'id': asset.id,
+        'name': asset.name,
+        'type': asset.file_type,
+        'size': asset.file_size,
+        'date': asset.upload_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'linked': asset.is_linked,
+        'sourceType': asset.source_type,
+        'sourceArticle': asset.get_source_info(),
+        'duplicate': duplicate
+    }
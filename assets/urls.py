@@ -10,6 +10,19 @@ urlpatterns = [
     # 资源上传
     path('upload', views.ResourceUploadView.as_view(), name='resource_upload'),
     
+    # 批量上传：一个请求携带多个文件
+    path('upload/batch', views.BatchUploadView.as_view(), name='resource_upload_batch'),
+
+    # 秒传：按哈希引用已有内容，无需上传文件
+    path('upload/precheck', views.UploadPrecheckView.as_view(), name='resource_upload_precheck'),
+
+    # 分片上传：初始化 / 查询进度与取消 / 上传分片 / 完成
+    path('upload/init', views.ChunkedUploadInitView.as_view(), name='resource_upload_init'),
+    path('upload/<str:upload_id>', views.ChunkedUploadSessionView.as_view(), name='resource_upload_session'),
+    path('upload/<str:upload_id>/part/<int:part_number>', views.ChunkedUploadPartView.as_view(),
+         name='resource_upload_part'),
+    path('upload/<str:upload_id>/complete', views.ChunkedUploadCompleteView.as_view(), name='resource_upload_complete'),
+
     # 资源创建（用于手动创建资源记录）
     path('create', views.ResourceCreateView.as_view(), name='resource_create'),
     
@@ -19,6 +32,12 @@ urlpatterns = [
     # 资源删除
     path('delete/<str:resource_id>', views.ResourceDeleteView.as_view(), name='resource_delete'),
     
+    # 资源恢复
+    path('restore/<str:resource_id>', views.ResourceRestoreView.as_view(), name='resource_restore'),
+    
+    # 全文检索：文章与文档资源正文
+    path('search', views.ResourceSearchView.as_view(), name='resource_search'),
+
     # 资源下载
     path('download/<str:resource_id>', views.ResourceDownloadView.as_view(), name='resource_download'),
     
@@ -0,0 +1,53 @@
+"""
+资源空间占用统计
+- 无筛选条件时直接读取 AssetUsage 增量计数，不扫描资源表；
+  某类型尚无计数（增量统计上线前的数据）时按资源表补建一次，无需先执行 rebuild_asset_usage
+- 有筛选条件时一次分组聚合得到数量与各类型大小，并按筛选条件缓存；
+  缓存键包含计数的最后更新时间，上传、删除、恢复或修改资源后自动失效
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from .models import Asset, AssetUsage
+
+
+def _summarize(type_rows):
+    """将 (文件类型, 数量, 大小) 列表汇总为统计结果"""
+    type_sizes = {file_type: size for file_type, count, size in type_rows if count > 0}
+    return {
+        'total': sum(count for _, count, _ in type_rows),
+        'total_size': sum(type_sizes.values()),
+        'type_sizes': type_sizes
+    }
+
+
+def get_usage_summary(uploader, queryset, filters):
+    """
+    获取资源数量与空间占用
+    :param uploader: 上传者
+    :param queryset: 已应用筛选条件的资源查询集
+    :param filters: 筛选条件字典，值全部为空表示无筛选
+    :return: {'total': 资源数量, 'total_size': 总大小(字节), 'type_sizes': {文件类型: 大小(字节)}}
+    """
+    usage_rows = list(AssetUsage.objects.filter(uploader=uploader))
+    missing_types = {file_type for file_type, _ in Asset.FILE_TYPE_CHOICES} - {row.file_type for row in usage_rows}
+    if missing_types:
+        AssetUsage.initialize(uploader, sorted(missing_types))
+        usage_rows = list(AssetUsage.objects.filter(uploader=uploader))
+    if not any(filters.values()):
+        return _summarize([(row.file_type, row.file_count, row.total_size) for row in usage_rows])
+
+    version = max((row.updated_at for row in usage_rows), default=None)
+    raw_key = json.dumps([uploader, filters, str(version)], sort_keys=True)
+    cache_key = f"asset_usage:{hashlib.md5(raw_key.encode('utf-8')).hexdigest()}"
+
+    summary = cache.get(cache_key)
+    if summary is None:
+        type_rows = queryset.order_by().values('file_type').annotate(count=Count('id'), size=Sum('file_size'))
+        summary = _summarize([(row['file_type'], row['count'], row['size'] or 0) for row in type_rows])
+        cache.set(cache_key, summary, settings.ASSET_USAGE_CACHE_TTL)
+    return summary
@@ -1,18 +1,43 @@
+import hashlib
 import json
-import mimetypes
 import os
 
 from django.conf import settings
-from django.core.paginator import Paginator
-from django.db.models import Q, Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Q
+from django.core.exceptions import TooManyFilesSent
+from django.http import HttpResponseRedirect
+from django.utils import timezone
 from rest_framework.views import APIView
 
 from article.models import Article
 from utils.error_codes import ErrorCode
 from utils.response_utils import success_result, error_result
-from .models import Asset
+from .models import Asset, AssetBlob, AssetUsage, ContentBusyError, UploadSession, UploadPart
 from .serializers import AssetSerializer
+from .batch_upload import store_batch
+from .blob_store import stored_blob
+from .chunked_upload import (
+    begin_part_hash, discard_running_hash, record_part_hash, reuse_known_content, schedule_session_store,
+    store_session_file, take_running_hash
+)
+from .storage import get_asset_storage
+from .streaming import INLINE_FILE_TYPES, asset_file_headers, build_file_response
+from .thumbnails import has_variant_params, parse_variant_params, get_variant_path, build_variant_response, variant_headers
+from .hot_cache import build_cached_response, cache_file, get_hot_cache, hot_cache_key, is_hot_cacheable
+from .upload_handlers import HashingUploadHandler
+from .text_index import search_articles, search_documents
+from .pagination import InvalidCursor, after_cursor, encode_cursor
+from .usage import get_usage_summary
+from .upload_utils import (
+    IO_BLOCK_SIZE, normalize_source_type, is_valid_file_hash, save_asset_record, build_upload_result
+)
+
+
+# 资源列表中图片缩略图的宽度
+LIST_THUMBNAIL_SIZE = 256
+# 资源列表每页最大数量
+LIST_MAX_PAGE_SIZE = 100
 
 
 class ResourceListView(APIView):
@@ -21,13 +46,20 @@ class ResourceListView(APIView):
     def get(self, request):
         """获取资源列表"""
         try:
-            # 获取查询参数
+            # 获取查询参数（CamelCaseMiddleWare 已将查询参数名转为下划线形式）
             file_type = request.GET.get('type')
-            search_query = request.GET.get('searchQuery')
+            search_query = request.GET.get('search_query')
             linked = request.GET.get('linked')
-            source_type = request.GET.get('sourceType')
-            page = int(request.GET.get('page', 1))
-            page_size = int(request.GET.get('pageSize', 20))
+            source_type = request.GET.get('source_type')
+            cursor = request.GET.get('cursor')
+            try:
+                page = max(int(request.GET.get('page', 1)), 1)
+                page_size = min(max(int(request.GET.get('page_size', 20)), 1), LIST_MAX_PAGE_SIZE)
+            except ValueError:
+                return error_result(ErrorCode.PARAM_INVALID)
+            # 统计默认只在首页返回，翻页时客户端沿用首页的统计，每页开销与深度无关
+            with_total = request.GET.get('with_total')
+            with_total = with_total.lower() == 'true' if with_total else not cursor and page == 1
 
             # 基础查询集 - 直接写死admin用户
             queryset = Asset.objects.filter(is_valid=True, uploader='admin')
@@ -49,12 +81,23 @@ class ResourceListView(APIView):
             if source_type:
                 queryset = queryset.filter(source_type=source_type)
 
-            # 分页
-            paginator = Paginator(queryset, page_size)
-            page_obj = paginator.get_page(page)
+            # 分页：按 (upload_time, id) 游标定位，多取一条判断是否还有下一页，不执行 COUNT 查询
+            page_queryset = queryset.order_by('-upload_time', '-id').select_related('linked_article')
+            if cursor:
+                try:
+                    page_queryset = after_cursor(page_queryset, cursor)
+                except InvalidCursor:
+                    return error_result(ErrorCode.PARAM_INVALID)
+            else:
+                # 兼容按页码请求（深页仍需 OFFSET 扫描，建议改用 nextCursor）
+                page_queryset = page_queryset[(page - 1) * page_size:]
+            page_assets = list(page_queryset[:page_size + 1])
+            has_more = len(page_assets) > page_size
+            page_assets = page_assets[:page_size]
+            next_cursor = encode_cursor(page_assets[-1]) if has_more else None
 
             # 序列化数据
-            serializer = AssetSerializer(page_obj, many=True)
+            serializer = AssetSerializer(page_assets, many=True)
             resources = []
             for asset in serializer.data:
                 resource_data = {
@@ -65,13 +108,34 @@ class ResourceListView(APIView):
                     'date': asset['upload_time'],
                     'linked': asset['is_linked'],
                     'sourceArticle': asset['sourceArticle'],
-                    'sourceType': asset['source_type']
+                    'sourceType': asset['source_type'],
+                    # 宽高 / 页数 / 时长等，上传后后台提取
+                    'metadata': asset['metadata'],
+                    # 图片列表使用缩略图，避免加载原图
+                    'thumbnailUrl': f"/api/resource/view/{asset['id']}?w={LIST_THUMBNAIL_SIZE}"
+                    if asset['file_type'] == 'image' else None
                 }
                 resources.append(resource_data)
 
-            # 计算总文件大小
-            total_size = queryset.aggregate(total=Sum('file_size'))['total'] or 0
-            
+            if not with_total:
+                return success_result({
+                    'list': resources,
+                    'total': None,
+                    'page': page,
+                    'pageSize': page_size,
+                    'hasMore': has_more,
+                    'nextCursor': next_cursor
+                })
+
+            # 数量与空间占用：无筛选时读取增量统计，有筛选时读取缓存
+            usage = get_usage_summary('admin', queryset, {
+                'file_type': file_type,
+                'search_query': search_query,
+                'linked': linked,
+                'source_type': source_type
+            })
+            total_size = usage['total_size']
+
             # 格式化总文件大小
             def format_size(size):
                 """格式化文件大小"""
@@ -84,15 +148,15 @@ class ResourceListView(APIView):
             formatted_total_size = format_size(total_size)
 
             # 按类型计算空间大小
-            type_sizes = queryset.values('file_type').annotate(size=Sum('file_size'))
-            formatted_type_sizes = {item['file_type']: format_size(item['size']) for item in type_sizes}
+            formatted_type_sizes = {type_name: format_size(size) for type_name, size in usage['type_sizes'].items()}
             
             return success_result({
                 'list': resources,
-                'total': paginator.count,
+                'total': usage['total'],
                 'page': page,
                 'pageSize': page_size,
-                'hasMore': page_obj.has_next(),
+                'hasMore': has_more,
+                'nextCursor': next_cursor,  # 下一页游标，没有更多时为 null
                 'totalSize': total_size,  # 总文件大小（字节）
                 'formattedTotalSize': formatted_total_size,  # 格式化的总文件大小
                 'typeSizes': formatted_type_sizes  # 按类型统计的空间大小
@@ -118,7 +182,9 @@ class ResourceCreateView(APIView):
 
             serializer = AssetSerializer(data=data)
             serializer.is_valid(raise_exception=True)
-            asset = serializer.save()
+            with transaction.atomic():
+                asset = serializer.save()
+                asset.record_usage()
 
             return success_result({
                 'id': asset.id,
@@ -167,7 +233,16 @@ class ResourceUpdateView(APIView):
 
             serializer = AssetSerializer(asset, data=data, partial=True)
             serializer.is_valid(raise_exception=True)
-            updated_asset = serializer.save()
+            old_file_type, old_file_size = asset.file_type, asset.file_size
+            with transaction.atomic():
+                updated_asset = serializer.save()
+
+                # 同步空间统计：类型或大小变化时移出旧值再计入新值，否则只让筛选统计缓存失效
+                if (updated_asset.file_type, updated_asset.file_size) != (old_file_type, old_file_size):
+                    AssetUsage.apply(updated_asset.uploader, old_file_type, -old_file_size, -1)
+                    updated_asset.record_usage()
+                else:
+                    AssetUsage.touch(updated_asset.uploader)
 
             return success_result({
                 'id': updated_asset.id,
@@ -204,9 +279,83 @@ class ResourceDeleteView(APIView):
             return error_result(ErrorCode.SYSTEM_ERROR)
 
 
+class ResourceRestoreView(APIView):
+    """恢复资源视图"""
+
+    def put(self, request, resource_id):
+        """恢复已软删除的资源"""
+        try:
+            try:
+                asset = Asset.objects.get(id=resource_id, is_valid=False, uploader='admin')  # 直接写死admin用户
+            except Asset.DoesNotExist:
+                return error_result(ErrorCode.RESOURCE_NOT_FOUND)
+
+            # 存储块已被回收、且之后没有再上传相同内容的资源无法恢复；重新关联与恢复在同一事务中完成
+            with transaction.atomic():
+                if not asset.restore() or not get_asset_storage().exists(asset.file_path):
+                    transaction.set_rollback(True)
+                    return error_result(ErrorCode.RESOURCE_NOT_FOUND)
+
+            return success_result()
+
+        except Exception as e:
+            return error_result(ErrorCode.SYSTEM_ERROR)
+
+
+class ResourceSearchView(APIView):
+    """全文检索视图"""
+
+    def get(self, request):
+        """按关键词同时检索文章（标题、正文）与文档资源的提取文本"""
+        try:
+            keyword = (request.GET.get('keyword') or '').strip()
+            if not keyword:
+                return error_result(ErrorCode.PARAM_REQUIRED)
+            try:
+                limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+            except ValueError:
+                return error_result(ErrorCode.PARAM_INVALID)
+
+            articles = [
+                {
+                    'id': article.article_id,
+                    'title': article.title,
+                    'snippet': snippet
+                }
+                for article, snippet in search_articles(keyword, limit)
+            ]
+            resources = [
+                {
+                    'id': asset.id,
+                    'name': asset.name,
+                    'type': asset.file_type,
+                    'size': asset.file_size,
+                    'sourceArticle': asset.get_source_info(),
+                    'snippet': snippet
+                }
+                for asset, snippet in search_documents(keyword, 'admin', limit)  # 直接写死admin用户
+            ]
+
+            return success_result({'articles': articles, 'resources': resources})
+
+        except Exception as e:
+            return error_result(ErrorCode.SYSTEM_ERROR)
+
+
 class ResourceDownloadView(APIView):
     """下载资源视图"""
 
+    @staticmethod
+    def _cached_response(request, asset, variant):
+        """
+        由热点缓存返回，未命中时返回 None
+        缩略图的响应头只取决于内容，与条目一起缓存；原文件的文件名、类型按当前资源记录生成
+        """
+        entry = get_hot_cache().get(hot_cache_key(asset.file_hash, variant))
+        if entry is None:
+            return None
+        return build_cached_response(request, entry, None if variant else asset_file_headers(asset))
+
     def get(self, request, resource_id):
         """下载资源文件"""
         try:
@@ -215,22 +364,61 @@ class ResourceDownloadView(APIView):
             except Asset.DoesNotExist:
                 return error_result(ErrorCode.RESOURCE_NOT_FOUND)
 
-            # 检查文件是否存在并读取文件
-            abs_file_path = os.path.join(settings.MEDIA_ROOT, asset.file_path)
-            if not os.path.exists(abs_file_path):
+            # 图片缩略图 / 尺寸变体：?w=&h=&fmt=
+            variant = None
+            if asset.file_type == 'image' and has_variant_params(request.GET):
+                variant = parse_variant_params(request.GET, asset.file_extension)
+                if variant is None:
+                    return error_result(ErrorCode.PARAM_INVALID)
+
+            # 热点小文件按内容哈希由内存缓存返回，不读取磁盘；资源已删除 / 替换时上面的查询即可发现
+            cacheable = is_hot_cacheable(request) and bool(asset.file_hash)
+            if cacheable:
+                response = self._cached_response(request, asset, variant)
+                if response is not None:
+                    return response
+
+            # 检查文件是否存在（对象存储不做额外的 HEAD 请求，缺失时由对象存储返回 404）
+            storage = get_asset_storage()
+            abs_file_path = storage.path(asset.file_path)
+            if abs_file_path is not None and not os.path.exists(abs_file_path):
+                # 记录缺失状态，无需等待下次完整性巡检
+                Asset.objects.filter(id=asset.id).update(integrity_status='missing', integrity_checked_at=timezone.now())
                 return error_result(ErrorCode.ARTICLE_NOT_EXIST)
 
-            with open(abs_file_path, 'rb') as f:
-                file_content = f.read()
+            if variant is not None:
+                variant_path = get_variant_path(asset, *variant)
+                # 无法生成变体（如 SVG）时返回原图
+                if variant_path:
+                    if cacheable and os.path.getsize(variant_path) <= settings.ASSET_HOT_CACHE_MAX_ITEM_SIZE:
+                        entry = cache_file(hot_cache_key(asset.file_hash, variant), open(variant_path, 'rb'),
+                                           variant_headers(asset, variant_path, variant[2]))
+                        return build_cached_response(request, entry)
+                    return build_variant_response(asset, variant_path, variant[2])
+                if cacheable:
+                    response = self._cached_response(request, asset, None)
+                    if response is not None:
+                        return response
+
+            # 小文件读入内存缓存（对象存储时也由本服务直接返回，省去一次重定向）
+            if cacheable and asset.file_size <= settings.ASSET_HOT_CACHE_MAX_ITEM_SIZE:
+                headers = asset_file_headers(asset)
+                entry = cache_file(hot_cache_key(asset.file_hash), storage.open(asset.file_path), headers)
+                return build_cached_response(request, entry, headers)
+
+            # 对象存储：重定向到预签名地址，文件由对象存储直接发送（分块保存的文件没有直链，由本服务拼接输出）
+            if abs_file_path is None:
+                download_url = storage.download_url(
+                    asset.file_path,
+                    asset.original_name,
+                    as_attachment=asset.file_type not in INLINE_FILE_TYPES,
+                    content_type=asset.mime_type or 'application/octet-stream'
+                )
+                if download_url:
+                    return HttpResponseRedirect(download_url)
 
-            # 设置响应
-            response = HttpResponse(file_content, content_type=asset.mime_type or 'application/octet-stream')
-            # 根据文件类型设置不同的Content-Disposition
-            if asset.file_type == 'image':
-                response['Content-Disposition'] = f'inline; filename="{asset.original_name}"'
-            else:
-                response['Content-Disposition'] = f'attachment; filename="{asset.original_name}"'
-            response['Content-Length'] = asset.file_size
+            # 流式输出文件，支持 Range 断点与拖动播放
+            response = build_file_response(request, asset, abs_file_path)
 
             return response
 
@@ -241,122 +429,34 @@ class ResourceDownloadView(APIView):
 class ResourceUploadView(APIView):
     """资源上传视图"""
 
+    def initialize_request(self, request, *args, **kwargs):
+        # 在解析请求体之前替换上传处理器：边接收边写入暂存文件并计算哈希
+        self.upload_handler = HashingUploadHandler(request, max_size=settings.ASSET_UPLOAD_MAX_SIZE)
+        request.upload_handlers = [self.upload_handler]
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request):
         """上传资源文件"""
         try:
-            if 'file' not in request.FILES:
-                return error_result(ErrorCode.UPLOAD_RESOURCE_NOT_FOUND)
+            uploaded_file = request.FILES.get('file')
 
-            uploaded_file = request.FILES['file']
-
-            # 文件大小限制 (50MB)
-            max_size = 50 * 1024 * 1024
-            if uploaded_file.size > max_size:
+            # 文件大小限制（接收过程中超限即停止写入）
+            if self.upload_handler.size_exceeded:
                 return error_result(ErrorCode.UPLOAD_RESOURCE_MORE_THAN_MAX_SIZE)
 
-            # 生成唯一文件名
-            import uuid
-            import hashlib
-
-            # 计算文件哈希
-            file_hash = hashlib.md5()
-            for chunk in uploaded_file.chunks():
-                file_hash.update(chunk)
-            file_hash_hex = file_hash.hexdigest()
-
-            # 检查是否已存在相同文件
-            existing_asset = Asset.get_by_hash(file_hash_hex)
-            if existing_asset:
-                try:
-                    # 获取关联文章信息（处理可能的异常）
-                    source_article = None
-                    if existing_asset.linked_article:
-                        source_article = existing_asset.get_source_info()
-                    
-                    return success_result({
-                        'id': existing_asset.id,
-                        'name': existing_asset.name,
-                        'type': existing_asset.file_type,
-                        'size': existing_asset.file_size,
-                        'date': existing_asset.upload_time.strftime('%Y-%m-%d %H:%M:%S'),
-                        'linked': existing_asset.is_linked,
-                        'sourceType': existing_asset.source_type,
-                        'sourceArticle': source_article,
-                        'duplicate': True  # 标记为重复文件
-                    })
-                except Exception as e:
-                    # 记录异常并返回新上传的文件
-                    print(f"处理重复文件时发生异常: {str(e)}")
-                    # 继续执行上传逻辑，不使用重复文件
-
-            # 确定文件类型
-            file_extension = os.path.splitext(uploaded_file.name)[1].lower()
-            mime_type = mimetypes.guess_type(uploaded_file.name)[0] or 'application/octet-stream'
-
-            # 根据扩展名确定文件类型
-            if file_extension in ['.pdf', '.doc', '.docx', '.txt', '.md', '.xls', '.xlsx', '.csv', '.ppt', '.pptx']:
-                file_type = 'document'
-            elif file_extension in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg']:
-                file_type = 'image'
-            elif file_extension in ['.mp3', '.wav', '.flac', '.aac']:
-                file_type = 'audio'
-            elif file_extension in ['.mp4', '.avi', '.mov', '.wmv', '.flv']:
-                file_type = 'video'
-            elif file_extension in ['.zip', '.rar', '.7z', '.tar', '.gz']:
-                file_type = 'archive'
-            elif file_extension in ['.py', '.js', '.html', '.css', '.java', '.cpp']:
-                file_type = 'code'
-            else:
-                file_type = 'other'
-
-            # 创建存储目录
-            upload_dir = os.path.join(settings.MEDIA_ROOT, file_type)
-            os.makedirs(upload_dir, exist_ok=True)
-
-            # 生成文件名
-            file_id = str(uuid.uuid4()).replace('-', '')[:16]
-            file_name = f"{file_id}{file_extension}"
-            abs_file_path = os.path.join(upload_dir, file_name)
-            # 存储相对路径（相对于MEDIA_ROOT）
-            rel_file_path = os.path.join(file_type, file_name)
-
-            # 保存文件
-            with open(abs_file_path, 'wb+') as destination:
-                for chunk in uploaded_file.chunks():
-                    destination.write(chunk)
-
-            # 获取请求参数
-            source_type = request.data.get('source_type', 'other')
-            linked_article_id = request.data.get('linked_article_id')
-            # 验证source_type是否合法
-            valid_source_types = [choice[0] for choice in Asset.SOURCE_TYPE_CHOICES]
-            if source_type not in valid_source_types:
-                source_type = 'other'
-
-            # 创建资源数据
-            asset_data = {
-                'id': file_id,
-                'name': uploaded_file.name,
-                'original_name': uploaded_file.name,
-                'file_type': file_type,
-                'file_size': uploaded_file.size,
-                'file_path': rel_file_path,  # 存储相对路径
-                'file_extension': file_extension,
-                'mime_type': mime_type,
-                'file_hash': file_hash_hex,
-                'uploader': 'admin',  # 直接写死admin用户
-                'source_type': source_type
-            }
-            
-            # 处理关联文章
-            if linked_article_id:
-                asset_data['linked_article'] = linked_article_id
-                asset_data['is_linked'] = True
+            if uploaded_file is None:
+                return error_result(ErrorCode.UPLOAD_RESOURCE_NOT_FOUND)
 
-            # 使用序列化器创建资源记录
-            serializer = AssetSerializer(data=asset_data)
-            serializer.is_valid(raise_exception=True)
-            asset = serializer.save()
+            # 文件哈希已在接收时计算，存入内容寻址存储：相同内容只增加引用，资源记录创建失败时释放
+            uploaded_file.close()
+            with stored_blob(uploaded_file.file_hash, uploaded_file.size,
+                             uploaded_file.temporary_file_path()) as (blob, created), transaction.atomic():
+                asset = save_asset_record(
+                    blob,
+                    uploaded_file.name,
+                    source_type=request.data.get('source_type', 'other'),
+                    linked_article_id=request.data.get('linked_article_id')
+                )
 
             return success_result({
                 'id': asset.id,
@@ -367,8 +467,390 @@ class ResourceUploadView(APIView):
                 'linked': asset.is_linked,
                 'sourceType': asset.source_type,
                 'sourceArticle': asset.get_source_info(),
-                'duplicate': False
+                'duplicate': not created  # 标记为重复文件
+            })
+
+        except ContentBusyError:
+            return error_result(ErrorCode.UPLOAD_CONTENT_BUSY)
+        except Exception as e:
+            return error_result(ErrorCode.SYSTEM_ERROR)
+        finally:
+            # 内容重复、入库失败或解析中途失败时，本次请求的所有暂存文件（含其他字段的文件）统一删除，
+            # 存储目录不写入任何字节
+            self.upload_handler.discard_all()
+
+
+class BatchUploadView(APIView):
+    """批量上传视图"""
+
+    def initialize_request(self, request, *args, **kwargs):
+        # 与单文件上传相同：每个文件边接收边写入暂存文件并计算哈希
+        self.upload_handler = HashingUploadHandler(request, max_size=settings.ASSET_UPLOAD_MAX_SIZE)
+        request.upload_handlers = [self.upload_handler]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def post(self, request):
+        """
+        一次上传多个文件（multipart 字段名均为 files）
+        逐个返回结果，超过大小限制或为空的文件不影响其他文件入库
+        """
+        try:
+            try:
+                uploaded_files = request.FILES.getlist('files')
+            except TooManyFilesSent:
+                return error_result(ErrorCode.UPLOAD_TOO_MANY_FILES)
+
+            skipped_files = self.upload_handler.skipped_files
+            if not uploaded_files and not skipped_files:
+                return error_result(ErrorCode.UPLOAD_RESOURCE_NOT_FOUND)
+            if len(uploaded_files) + len(skipped_files) > settings.ASSET_BATCH_UPLOAD_MAX_FILES:
+                return error_result(ErrorCode.UPLOAD_TOO_MANY_FILES)
+
+            linked_article_id = request.data.get('linked_article_id') or None
+            if linked_article_id and not Article.objects.filter(article_id=linked_article_id).exists():
+                return error_result(ErrorCode.ARTICLE_NOT_EXIST)
+
+            for uploaded_file in uploaded_files:
+                uploaded_file.close()
+            accepted_files = [uploaded_file for uploaded_file in uploaded_files if uploaded_file.size > 0]
+            stored = store_batch(
+                accepted_files,
+                source_type=request.data.get('source_type', 'other'),
+                linked_article_id=linked_article_id
+            ) if accepted_files else []
+
+            results = [
+                {'success': True, **build_upload_result(asset, duplicate=duplicate)}
+                for asset, duplicate in stored
+            ]
+            results += [
+                {'success': False, 'name': uploaded_file.name, 'error': '文件为空'}
+                for uploaded_file in uploaded_files if uploaded_file.size == 0
+            ]
+            results += [
+                {'success': False, 'name': file_name, 'error': ErrorCode.UPLOAD_RESOURCE_MORE_THAN_MAX_SIZE.message}
+                for file_name in skipped_files
+            ]
+
+            return success_result({
+                'total': len(results),
+                'succeeded': len(stored),
+                'results': results
+            })
+
+        except ContentBusyError:
+            return error_result(ErrorCode.UPLOAD_CONTENT_BUSY)
+        except Exception as e:
+            return error_result(ErrorCode.SYSTEM_ERROR)
+        finally:
+            # 内容重复或入库失败的暂存文件统一删除
+            self.upload_handler.discard_all()
+
+
+class UploadPrecheckView(APIView):
+    """秒传预检视图"""
+
+    def post(self, request):
+        """
+        按文件哈希和大小检查内容是否已存在
+        - 已存在：直接创建引用该内容的资源记录并返回，客户端无需上传文件
+        - 不存在：返回 hit=false，客户端再走普通上传或分片上传
+        """
+        try:
+            data = request.data
+            file_name = data.get('file_name')
+            file_hash = (data.get('file_hash') or '').lower()
+            if not file_name or not file_hash or data.get('file_size') in (None, ''):
+                return error_result(ErrorCode.PARAM_REQUIRED)
+
+            try:
+                file_size = int(data.get('file_size'))
+            except (TypeError, ValueError):
+                return error_result(ErrorCode.PARAM_INVALID)
+            if file_size < 0 or not is_valid_file_hash(file_hash):
+                return error_result(ErrorCode.PARAM_INVALID)
+
+            with transaction.atomic():
+                # 哈希与大小都一致才视为同一内容；引用成功后存储块不会再被回收
+                if not AssetBlob.add_ref(file_hash, file_size=file_size):
+                    return success_result({'hit': False})
+
+                blob = AssetBlob.objects.get(file_hash=file_hash)
+                asset = save_asset_record(
+                    blob,
+                    file_name,
+                    source_type=data.get('source_type', 'other'),
+                    linked_article_id=data.get('linked_article_id') or None
+                )
+
+            result = build_upload_result(asset, duplicate=True)
+            result['hit'] = True
+            return success_result(result)
+
+        except Exception as e:
+            return error_result(ErrorCode.SYSTEM_ERROR)
+
+
+def _build_session_result(session):
+    """组装分片上传会话的返回数据"""
+    return {
+        'upload_id': session.id,
+        'file_name': session.file_name,
+        'file_size': session.file_size,
+        'chunk_size': session.chunk_size,
+        'total_parts': session.total_parts,
+        'uploaded_parts': session.uploaded_part_numbers(),
+        'status': session.status,
+        'asset_id': session.asset_id
+    }
+
+
+def _discard_upload_session(session):
+    """删除上传会话及其临时文件"""
+    get_asset_storage().abort_multipart(session.staging_name, session.storage_upload_id)
+    discard_running_hash(session.id)
+    session.delete()
+
+
+class ChunkedUploadInitView(APIView):
+    """分片上传初始化视图"""
+
+    def post(self, request):
+        """创建分片上传会话，并预分配临时文件"""
+        try:
+            data = request.data
+            file_name = data.get('file_name')
+            if not file_name or data.get('file_size') in (None, ''):
+                return error_result(ErrorCode.PARAM_REQUIRED)
+
+            try:
+                file_size = int(data.get('file_size'))
+                chunk_size = int(data.get('chunk_size') or settings.ASSET_UPLOAD_CHUNK_SIZE)
+            except (TypeError, ValueError):
+                return error_result(ErrorCode.PARAM_INVALID)
+
+            # 可选的整文件哈希：与已有内容一致时完成上传无需读取文件
+            file_hash = (data.get('file_hash') or '').lower()
+            if file_hash and not is_valid_file_hash(file_hash):
+                return error_result(ErrorCode.PARAM_INVALID)
+
+            storage = get_asset_storage()
+            if file_size <= 0 or not 0 < chunk_size <= settings.ASSET_UPLOAD_MAX_CHUNK_SIZE:
+                return error_result(ErrorCode.PARAM_INVALID)
+            # 对象存储要求除最后一片外的分片不小于其最小分片大小
+            if chunk_size < storage.min_part_size and chunk_size < file_size:
+                return error_result(ErrorCode.PARAM_INVALID)
+            if file_size > settings.ASSET_CHUNKED_UPLOAD_MAX_SIZE:
+                return error_result(ErrorCode.UPLOAD_RESOURCE_MORE_THAN_CHUNKED_MAX_SIZE)
+
+            # 顺便清理过期未完成的会话
+            for expired_session in UploadSession.get_expired_sessions():
+                _discard_upload_session(expired_session)
+
+            session = UploadSession.objects.create(
+                file_name=file_name,
+                file_size=file_size,
+                chunk_size=chunk_size,
+                total_parts=(file_size + chunk_size - 1) // chunk_size,
+                file_hash=file_hash,
+                source_type=normalize_source_type(data.get('source_type', 'other')),
+                linked_article_id=data.get('linked_article_id') or None
+            )
+
+            # 在存储后端开始分片上传（本地预分配稀疏文件 / 对象存储创建 multipart upload）
+            session.storage_upload_id = storage.create_multipart(session.staging_name, file_size)
+            session.save(update_fields=['storage_upload_id'])
+
+            return success_result(_build_session_result(session))
+
+        except Exception as e:
+            return error_result(ErrorCode.SYSTEM_ERROR)
+
+
+class ChunkedUploadSessionView(APIView):
+    """分片上传会话视图"""
+
+    def get(self, request, upload_id):
+        """查询上传进度，用于断点续传"""
+        try:
+            try:
+                session = UploadSession.objects.get(id=upload_id)
+            except UploadSession.DoesNotExist:
+                return error_result(ErrorCode.UPLOAD_SESSION_NOT_FOUND)
+
+            return success_result(_build_session_result(session))
+
+        except Exception as e:
+            return error_result(ErrorCode.SYSTEM_ERROR)
+
+    def delete(self, request, upload_id):
+        """取消上传，删除会话与临时文件"""
+        try:
+            try:
+                session = UploadSession.objects.get(id=upload_id, status='uploading')
+            except UploadSession.DoesNotExist:
+                return error_result(ErrorCode.UPLOAD_SESSION_NOT_FOUND)
+
+            _discard_upload_session(session)
+            return success_result()
+
+        except Exception as e:
+            return error_result(ErrorCode.SYSTEM_ERROR)
+
+
+class _PartMismatch(Exception):
+    """分片长度或校验值与预期不符"""
+
+    def __init__(self, error_code):
+        super().__init__(error_code)
+        self.error_code = error_code
+
+
+def _read_verified_part(stream, expected_size, checksum, file_hash=None):
+    """
+    分块读取分片数据并计算 MD5，提供 file_hash 时同时计入整文件哈希
+    数据不足或校验失败时在迭代末尾抛出 _PartMismatch，存储后端据此放弃该分片
+    """
+    part_hash = hashlib.md5()
+    received = 0
+    while received < expected_size:
+        block = stream.read(min(IO_BLOCK_SIZE, expected_size - received))
+        if not block:
+            break
+        part_hash.update(block)
+        if file_hash is not None:
+            file_hash.update(block)
+        received += len(block)
+        yield block
+
+    if received != expected_size:
+        raise _PartMismatch(ErrorCode.UPLOAD_CHUNK_SIZE_MISMATCH)
+    if part_hash.hexdigest() != checksum:
+        raise _PartMismatch(ErrorCode.UPLOAD_CHUNK_CHECKSUM_MISMATCH)
+
+
+class ChunkedUploadPartView(APIView):
+    """分片上传视图"""
+
+    def put(self, request, upload_id, part_number):
+        """
+        上传单个分片
+        - 请求体为分片原始字节（application/octet-stream），边读边写入存储后端的临时文件
+        - checksum 查询参数为分片 MD5，校验失败的分片不会被记录，可直接重传
+        - 不同分片可并发上传，按顺序到达的分片在接收时顺带累计整文件哈希
+        """
+        try:
+            try:
+                session = UploadSession.objects.get(id=upload_id, status='uploading')
+            except UploadSession.DoesNotExist:
+                return error_result(ErrorCode.UPLOAD_SESSION_NOT_FOUND)
+
+            if not 0 <= part_number < session.total_parts:
+                return error_result(ErrorCode.PARAM_INVALID)
+
+            checksum = request.GET.get('checksum', '').lower()
+            if not checksum:
+                return error_result(ErrorCode.PARAM_REQUIRED)
+
+            offset = session.part_offset(part_number)
+            expected_size = session.part_length(part_number)
+            if int(request.META.get('CONTENT_LENGTH') or 0) != expected_size:
+                return error_result(ErrorCode.UPLOAD_CHUNK_SIZE_MISMATCH)
+
+            # 边读请求体边写入并计算校验值，内存只占一个块
+            file_hash = begin_part_hash(session, part_number)
+            try:
+                etag = get_asset_storage().write_part(
+                    session.staging_name,
+                    session.storage_upload_id,
+                    part_number,
+                    offset,
+                    _read_verified_part(request.stream, expected_size, checksum, file_hash)
+                )
+            except _PartMismatch as e:
+                return error_result(e.error_code)
+
+            UploadPart.objects.update_or_create(
+                session=session,
+                part_number=part_number,
+                defaults={'size': expected_size, 'checksum': checksum, 'etag': etag}
+            )
+            record_part_hash(session, part_number, checksum, file_hash)
+            # 刷新会话活跃时间，避免上传中的会话被当作过期清理
+            UploadSession.objects.filter(id=session.id).update(updated_at=timezone.now())
+
+            return success_result({
+                'part_number': part_number,
+                'offset': offset,
+                'size': expected_size,
+                'checksum': checksum
             })
 
         except Exception as e:
             return error_result(ErrorCode.SYSTEM_ERROR)
+
+
+class ChunkedUploadCompleteView(APIView):
+    """分片上传完成视图"""
+
+    def post(self, request, upload_id):
+        """
+        校验分片完整性，合并分片并移动到正式存储位置，创建资源记录
+        对象存储上既不能按客户端哈希直接复用、又没有完整的累计哈希时在后台入库，返回合并中的会话，客户端轮询上传进度
+        """
+        try:
+            try:
+                session = UploadSession.objects.get(id=upload_id)
+            except UploadSession.DoesNotExist:
+                return error_result(ErrorCode.UPLOAD_SESSION_NOT_FOUND)
+
+            # 重复调用直接返回已生成的资源，合并中返回会话进度
+            if session.status == 'completed':
+                asset = Asset.objects.get(id=session.asset_id)
+                return success_result(build_upload_result(asset))
+            if session.status == 'completing':
+                return success_result(_build_session_result(session))
+
+            uploaded_parts = set(session.uploaded_part_numbers())
+            missing_parts = [i for i in range(session.total_parts) if i not in uploaded_parts]
+            if missing_parts:
+                return error_result(ErrorCode.UPLOAD_INCOMPLETE, data={'missing_parts': missing_parts})
+
+            # 条件 UPDATE 认领会话：并发的重复调用只有一个继续合并，合并期间不再接收分片
+            # 合并与存入内容寻址存储在事务之外进行（相同内容正在回收时需等待其删除完成）
+            if not UploadSession.objects.filter(id=session.id, status='uploading').update(
+                    status='completing', updated_at=timezone.now()):
+                session.refresh_from_db()
+                return success_result(_build_session_result(session))
+            session.status = 'completing'
+
+            try:
+                storage = get_asset_storage()
+                storage.complete_multipart(
+                    session.staging_name,
+                    session.storage_upload_id,
+                    list(session.parts.order_by('part_number').values_list('part_number', 'etag'))
+                )
+
+                file_hash_hex = take_running_hash(session)
+                asset = reuse_known_content(session)
+                if asset is not None:
+                    return success_result(build_upload_result(asset, duplicate=True))
+
+                # 没有完整的累计哈希时需读取文件计算：对象存储需完整下载对象，不占用请求，改为后台入库
+                if file_hash_hex is None and storage.path(session.staging_name) is None:
+                    schedule_session_store(session.id)
+                    return success_result(_build_session_result(session))
+
+                asset, created = store_session_file(session, file_hash_hex)
+            except BaseException:
+                # 恢复为上传中，客户端可重新调用完成接口
+                UploadSession.objects.filter(id=session.id, status='completing').update(status='uploading')
+                raise
+
+            return success_result(build_upload_result(asset, duplicate=not created))
+
+        except ContentBusyError:
+            return error_result(ErrorCode.UPLOAD_CONTENT_BUSY)
+        except Exception as e:
+            return error_result(ErrorCode.SYSTEM_ERROR)
@@ -17,6 +17,8 @@ export interface ResourceItem {
     sourceArticle: ArticleSource | null;
     duplicate?: boolean; // 标记是否为重复文件
     sourceType?: string; // 资源来源类型：attachment(附件)、content(内容)
+    thumbnailUrl?: string | null; // 图片缩略图地址，非图片为 null
+    metadata?: Record<string, any>; // 宽高 / 页数 / 时长等元数据，上传后后台提取
 }
 
 // 定义获取资源列表参数类型
@@ -26,6 +28,8 @@ export interface GetResourcesParams {
     linked?: boolean;
     page?: number;
     pageSize?: number;
+    cursor?: string; // 上一页返回的 nextCursor，传入时忽略 page
+    withTotal?: boolean; // 是否返回统计，默认只在首页返回
 }
 
 // 定义资源上传响应类型
@@ -48,13 +52,14 @@ export interface FormattedSize {
 
 export interface ResourceListResponse {
     list: ResourceItem[];
-    total: number;
+    total: number | null; // 未返回统计时为 null
     page: number;
     pageSize: number;
     hasMore: boolean;
-    totalSize: number; // 总文件大小（字节）
-    formattedTotalSize: FormattedSize; // 格式化的总文件大小
-    typeSizes: Record<string, FormattedSize>; // 按类型统计的空间大小
+    nextCursor: string | null; // 下一页游标
+    totalSize?: number; // 总文件大小（字节）
+    formattedTotalSize?: FormattedSize; // 格式化的总文件大小
+    typeSizes?: Record<string, FormattedSize>; // 按类型统计的空间大小
 }
 
 // 获取资源列表接口
@@ -20,6 +20,8 @@ export const AIChatWindow = ({isOpen, onClose}: AIChatWindowProps) => {
     const [messages, setMessages] = useState<Message[]>([]);
     const [isLoading, setIsLoading] = useState(false);
     const [useKb, setUseKb] = useState(false);
+    // 服务端会话ID：历史保存在服务端，后续消息只提交该ID与新消息
+    const conversationIdRef = useRef<string | null>(null);
 
     // --- 平滑输出相关的 Refs ---
     const messagesEndRef = useRef<HTMLDivElement>(null);
@@ -58,6 +60,11 @@ export const AIChatWindow = ({isOpen, onClose}: AIChatWindowProps) => {
         tokenQueueRef.current = [];
         if (messages.length > 0 && confirm('确定要清空当前对话记录吗？')) {
             setMessages([]);
+            // 删除服务端会话，下一条消息开始新会话
+            if (conversationIdRef.current) {
+                fetch(`/api/ai/conversations/${conversationIdRef.current}/`, {method: 'DELETE'}).catch(console.error);
+                conversationIdRef.current = null;
+            }
         }
     };
 
@@ -80,11 +87,23 @@ export const AIChatWindow = ({isOpen, onClose}: AIChatWindowProps) => {
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({
                     message: userMsg,
-                    history: messages.map(m => ({role: m.role, content: m.content})),
+                    // 不传会话ID时服务端创建新会话，通过 X-Conversation-Id 响应头返回
+                    ...(conversationIdRef.current ? {conversationId: conversationIdRef.current} : {}),
                     use_knowledge_base: useKb
                 })
             });
 
+            if (!response.ok) {
+                const data = await response.json().catch(() => ({}));
+                setMessages(prev => {
+                    const newMsgs = [...prev];
+                    newMsgs[newMsgs.length - 1].content = data.error || `请求失败（${response.status}）`;
+                    return newMsgs;
+                });
+                return;
+            }
+            conversationIdRef.current = response.headers.get('X-Conversation-Id') || conversationIdRef.current;
+
             if (!response.body) throw new Error("No response body");
 
             const reader = response.body.getReader();
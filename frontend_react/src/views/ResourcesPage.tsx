@@ -51,6 +51,7 @@ export default function ResourcesPage() {
     const [page, setPage] = useState(1);
     const [isLoading, setIsLoading] = useState(false);
     const [hasMore, setHasMore] = useState(true);
+    const nextCursorRef = useRef<string | null>(null);
     const [selectedIds, setSelectedIds] = useState<Set<string>>(new Set());
     const [totalCount, setTotalCount] = useState(0); // 添加总数状态
     const [formattedTotalSize, setFormattedTotalSize] = useState<FormattedSize>({size: 0, unit: 'B'}); // 格式化的总文件大小
@@ -77,6 +78,7 @@ export default function ResourcesPage() {
         setIsLoading(true);
         setPage(1);
         setHasMore(true);
+        nextCursorRef.current = null;
         setSelectedIds(new Set());
         setVisibleData([]);
         fetchResources(1);
@@ -89,6 +91,8 @@ export default function ResourcesPage() {
             const params: GetResourcesParams = {
                 page: pageNum,
                 pageSize: PAGE_SIZE,
+                // 翻页使用游标，避免深页偏移扫描
+                cursor: pageNum > 1 ? nextCursorRef.current || undefined : undefined,
                 type: activeTab === 'all' ? undefined : activeTab,
                 linked: showUnlinkedOnly ? false : undefined,
                 searchQuery: searchQuery || undefined
@@ -98,20 +102,22 @@ export default function ResourcesPage() {
 
             // --- 核心修复：解构响应对象 ---
             // 后端返回结构: { list: [], total: 100, hasMore: true, ... }
-            const {list, total, hasMore: backendHasMore, formattedTotalSize: backendFormattedTotalSize} = response;
+            const {list, total, hasMore: backendHasMore, nextCursor, formattedTotalSize: backendFormattedTotalSize} = response;
 
             if (filterVersion.current !== currentVersion) return;
 
             if (pageNum === 1) {
                 setVisibleData(list);
-                setTotalCount(total);
+                setTotalCount(total ?? 0);
                 setFormattedTotalSize(backendFormattedTotalSize || {size: 0, unit: 'B'});
             } else {
                 setVisibleData(prev => [...prev, ...list]);
-                setTotalCount(total); // 更新总数以防变化
+                // 翻页时后端默认不返回统计，沿用首页的总数
+                if (total !== null) setTotalCount(total);
             }
 
             setPage(pageNum);
+            nextCursorRef.current = nextCursor;
             // 使用后端返回的 hasMore 字段
             setHasMore(backendHasMore);
 
@@ -270,7 +276,7 @@ export default function ResourcesPage() {
 
             if (filterVersion.current === currentVersion) {
                 setVisibleData(list);
-                setTotalCount(total);
+                setTotalCount(total ?? 0);
                 setHasMore(backendHasMore);
                 setPage(1);
             }
@@ -486,12 +492,19 @@ export default function ResourcesPage() {
                                         )}
                                     </div>
                                     <div
-                                        className="aspect-[16/10] bg-slate-50/50 border-b border-slate-100/50 flex items-center justify-center relative">
-                                        {/* 修复关键点：使用 cloneElement 动态注入 className */}
-                                        <div
-                                            className={`w-10 h-10 rounded-lg flex items-center justify-center transition-transform group-hover:scale-105 duration-300 ${getFileStyle(file.type)}`}>
-                                            {React.cloneElement(getFileIcon(file.type), {className: "w-5 h-5"})}
-                                        </div>
+                                        className="aspect-[16/10] bg-slate-50/50 border-b border-slate-100/50 flex items-center justify-center relative overflow-hidden rounded-t-xl">
+                                        {/* 图片使用后端生成的缩略图，避免网格加载原图 */}
+                                        {file.thumbnailUrl ? (
+                                            <img src={file.thumbnailUrl} alt={file.name} loading="lazy"
+                                                 decoding="async" draggable={false}
+                                                 className="w-full h-full object-cover transition-transform group-hover:scale-105 duration-300"/>
+                                        ) : (
+                                            /* 修复关键点：使用 cloneElement 动态注入 className */
+                                            <div
+                                                className={`w-10 h-10 rounded-lg flex items-center justify-center transition-transform group-hover:scale-105 duration-300 ${getFileStyle(file.type)}`}>
+                                                {React.cloneElement(getFileIcon(file.type), {className: "w-5 h-5"})}
+                                            </div>
+                                        )}
                                     </div>
                                     <div className="p-2.5 flex-1 flex flex-col">
                                         <h3 className="text-xs font-medium text-slate-700 truncate mb-1"
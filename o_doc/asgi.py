@@ -3,6 +3,8 @@ ASGI config for o_doc project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+启动方式（示例）：uvicorn o_doc.asgi:application --host 0.0.0.0 --port 11800 --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -12,5 +14,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'o_doc.settings')
+# ASGI 模式下 AI 对话使用异步视图，对话流运行在事件循环上，不占用线程
+os.environ.setdefault('AI_CHAT_ASYNC', '1')
 
 application = get_asgi_application()
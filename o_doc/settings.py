@@ -71,7 +71,7 @@ REST_FRAMEWORK = {
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'djangorestframework_camel_case.middleware.CamelCaseMiddleWare',
+    'utils.middleware.CamelCaseMiddleware',  # 支持异步调用，ASGI 模式下不会让请求串行
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -150,6 +150,109 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'  # 生产环境静态文件收集目录
 MEDIA_ROOT = BASE_DIR / 'media'  # 媒体文件存储目录
 MEDIA_URL = '/media/'  # 媒体文件访问 URL
 
+# 资源下载卸载模式：为空时由 Django 流式输出文件
+# 'x-accel-redirect'：交给 Nginx 发送，需配置 internal location 指向 MEDIA_ROOT
+# 'x-sendfile'：交给 Apache(mod_xsendfile) / lighttpd 发送
+ASSET_SENDFILE_MODE = os.environ.get('ASSET_SENDFILE_MODE') or None
+ASSET_ACCEL_REDIRECT_PREFIX = '/protected-media/'  # X-Accel-Redirect 模式下的 internal location 前缀
+
+# 资源文件存储后端：'local' 本地磁盘（MEDIA_ROOT） / 's3' S3 兼容对象存储（AWS S3、MinIO 等）
+# 使用对象存储时应用节点无需共享磁盘，下载通过预签名地址直连对象存储，需安装 boto3
+ASSET_STORAGE_BACKEND = os.environ.get('ASSET_STORAGE_BACKEND', 'local')
+ASSET_S3_ENDPOINT_URL = os.environ.get('ASSET_S3_ENDPOINT_URL') or None  # 为空时使用 AWS 官方地址，MinIO 填写如 http://minio:9000
+ASSET_S3_BUCKET = os.environ.get('ASSET_S3_BUCKET', 'o-doc-assets')
+ASSET_S3_KEY_PREFIX = os.environ.get('ASSET_S3_KEY_PREFIX', '')  # 对象键前缀，多个环境共用一个桶时区分
+ASSET_S3_REGION = os.environ.get('ASSET_S3_REGION') or None
+ASSET_S3_ACCESS_KEY = os.environ.get('ASSET_S3_ACCESS_KEY') or None
+ASSET_S3_SECRET_KEY = os.environ.get('ASSET_S3_SECRET_KEY') or None
+ASSET_S3_ADDRESSING_STYLE = os.environ.get('ASSET_S3_ADDRESSING_STYLE', 'path')  # MinIO 等通常使用 path 风格
+ASSET_S3_MAX_POOL_CONNECTIONS = 32  # 每个进程与对象存储之间的连接池大小
+ASSET_S3_PRESIGNED_URL_EXPIRE = 5 * 60  # 预签名下载地址有效期（秒）
+
+# 资源上传配置
+ASSET_UPLOAD_MAX_SIZE = 50 * 1024 * 1024  # 普通上传的文件大小上限
+ASSET_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # 分片上传默认分片大小
+ASSET_UPLOAD_MAX_CHUNK_SIZE = 32 * 1024 * 1024  # 单个分片大小上限
+ASSET_CHUNKED_UPLOAD_MAX_SIZE = 4 * 1024 * 1024 * 1024  # 分片上传的文件大小上限
+ASSET_UPLOAD_SESSION_TTL = 24 * 60 * 60  # 未完成的上传会话保留时间（秒）
+ASSET_UPLOAD_COMPLETE_WORKERS = 2  # 对象存储时后台计算分片上传文件哈希并入库的线程数
+# 分块去重存储：大文件按内容定义切块保存，相近版本只保存变化的分块（开启后请勿关闭，已分块的文件需经由分块存储读取）
+ASSET_CHUNK_DEDUP_ENABLED = os.environ.get('ASSET_CHUNK_DEDUP_ENABLED', '').lower() in ('1', 'true', 'yes')
+ASSET_CHUNK_DEDUP_MIN_SIZE = 16 * 1024 * 1024  # 不小于该大小的文件才分块保存
+ASSET_BATCH_UPLOAD_MAX_FILES = 100  # 批量上传单次最多文件数（不能超过 DATA_UPLOAD_MAX_NUMBER_FILES）
+ASSET_BATCH_UPLOAD_WORKERS = 4  # 批量上传并发写入存储后端的线程数
+ASSET_BLOB_GC_GRACE_HOURS = 72  # 存储块引用归零后的保留时间，超过后由 gc_asset_blobs 命令回收
+ASSET_BLOB_GC_WAIT_TIMEOUT = 30  # 写入内容时等待回收中的相同内容删除完成的最长时间（秒）
+ASSET_SCRUB_MAX_IOPS = 50  # 完整性巡检（scrub_assets 命令）每秒最多 IO 次数
+ASSET_SCRUB_MAX_BYTES_PER_SECOND = 8 * 1024 * 1024  # 完整性巡检每秒最多读取字节数
+ASSET_SCRUB_RECHECK_HOURS = 7 * 24  # 同一资源两次完整性检查的最短间隔（小时）
+ASSET_USAGE_CACHE_TTL = 10 * 60  # 资源列表筛选统计的缓存时间（秒）
+ASSET_HOT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 热点小文件内存缓存总大小（每个 worker 进程）
+ASSET_HOT_CACHE_MAX_ENTRIES = 2000  # 热点小文件内存缓存条目数上限
+ASSET_HOT_CACHE_MAX_ITEM_SIZE = 256 * 1024  # 不超过该大小的文件（含缩略图）才进入内存缓存
+ASSET_HOT_CACHE_TTL = 60  # 缓存条目有效期（秒），不常访问的内容及时释放内存
+
+# 图片缩略图配置
+ASSET_THUMBNAIL_WORKERS = 2  # 生成缩略图的进程数
+ASSET_THUMBNAIL_TIMEOUT = 30  # 单张缩略图生成超时（秒）
+
+# 资源元数据提取配置
+ASSET_METADATA_WORKERS = 2  # 上传后后台提取图片尺寸 / PDF 页数 / 音视频时长的线程数
+
+# 文档文本提取配置（PDF / DOCX / TXT / MD / CSV）
+ASSET_TEXT_WORKERS = 2  # 提取文本的进程数
+ASSET_TEXT_CHUNK_CHARS = 2000  # 文本切块长度（字符）
+ASSET_TEXT_MAX_CHARS = 2 * 1000 * 1000  # 单个文档保存的文本上限（字符），超出部分丢弃
+ASSET_TEXT_TIMEOUT = 10 * 60  # 单个文档提取超时（秒）
+
+# AI 知识库检索配置
+AI_KNOWLEDGE_INDEX_DIR = BASE_DIR / 'knowledge_index'  # 向量索引文件目录（不对外提供访问）
+AI_KB_CHUNK_CHARS = 800  # 文章切块长度（字符）
+AI_KB_CHUNK_OVERLAP = 100  # 相邻文本块的重叠长度（字符）
+AI_KB_TOP_K = 5  # 每次对话检索的文本块数量
+AI_KB_MIN_SCORE = 0.2  # 余弦相似度低于该值的结果不作为参考资料
+AI_KB_HYBRID_CANDIDATES = 20  # 向量检索与关键词检索各取的候选数量，融合后交给重排模型
+AI_KB_BM25_MAX_POSTINGS = 50000  # 关键词检索每次最多读取的倒排记录数，超出时舍弃高频词
+AI_KB_INDEX_BATCH_ARTICLES = 20  # 增量同步每批处理的文章数量（每批提交一次，中断后从未完成的批次继续）
+AI_KB_COMPACT_RATIO = 0.2  # 索引中已删除的行（或近似索引建立后追加的行）占比超过该值时重写索引
+# IVF 近似检索：文本块较多时只计算最接近的若干个簇，以少量召回率换取检索速度（可用 benchmark_knowledge_index 命令评估）
+AI_KB_ANN_ENABLED = True  # 是否启用近似检索，关闭时始终精确检索
+AI_KB_IVF_MIN_ROWS = 50000  # 文本块数达到该值时才建立近似索引
+AI_KB_IVF_NLIST = 0  # 簇数量，0 表示按 4 * sqrt(文本块数) 自动计算；修改后重建索引生效
+AI_KB_IVF_NPROBE = 32  # 每次检索计算的簇数量，越大召回率越高、越慢；修改后立即生效
+AI_KB_IVF_TRAIN_SAMPLE = 100000  # 训练簇中心的采样向量数
+AI_KB_IVF_TRAIN_ITERATIONS = 10  # k-means 迭代次数
+AI_EMBEDDING_BATCH_SIZE = 32  # 每次请求向量化接口的最多文本数量
+AI_EMBEDDING_TIMEOUT = 30  # 向量化接口超时（秒）
+AI_EMBEDDING_BATCH_WINDOW_MS = 10  # 向量化请求的合批等待窗口（毫秒），窗口内各调用方的请求合并为一次上游请求
+AI_EMBEDDING_MAX_CONCURRENCY = 4  # 每个提供商同时进行的向量化请求数上限（每个进程）
+AI_RERANK_TIMEOUT = 15  # 重排接口超时（秒）
+AI_CONFIG_CACHE_TTL = 30  # AI 配置与模型在进程内的缓存时间（秒），限定其他进程修改配置后的最长滞后时间
+
+# AI 提供商连接配置（每个 worker 进程按提供商各持有一个连接池）
+AI_PROVIDER_POOL_SIZE = 10  # 每个提供商保持的连接数上限（异步模式下为空闲长连接数上限）
+AI_PROVIDER_ASYNC_MAX_CONNECTIONS = 500  # 异步模式下每个提供商的并发连接数上限
+AI_PROVIDER_CONNECT_TIMEOUT = 5  # 建立连接超时（秒）
+AI_CHAT_READ_TIMEOUT = 60  # 对话接口读取超时（秒），流式输出时为两段数据之间的最长等待
+AI_PROVIDER_MAX_RETRIES = 2  # 连接失败、超时及 429 / 5xx 响应的最多重试次数
+AI_PROVIDER_RETRY_BACKOFF = 0.5  # 首次重试前的最长等待（秒），之后每次翻倍，实际等待时间随机
+AI_PROVIDER_RETRY_MAX_BACKOFF = 4  # 单次重试前的最长等待（秒）
+AI_PROVIDER_BREAKER_FAILURES = 5  # 连续失败多少次后熔断
+AI_PROVIDER_BREAKER_RESET = 30  # 熔断持续时间（秒），之后放行一次试探请求
+# AI 对话使用异步视图：由 o_doc/asgi.py 启动时自动开启（需 uvicorn + httpx），WSGI（gunicorn）模式下保持关闭
+AI_CHAT_ASYNC = os.environ.get('AI_CHAT_ASYNC', '').lower() in ('1', 'true', 'yes')
+
+# AI 对话历史（token 数按字符估算：中文约每字 1 个，其余约每 4 个字符 1 个）
+AI_CHAT_HISTORY_TOKEN_BUDGET = 4000  # 每次对话发送的历史消息 token 上限；服务端会话中未压缩的历史超出该值时后台生成摘要
+AI_CHAT_RECENT_TOKENS = 1500  # 生成摘要时保留原文的最近消息 token 数
+AI_CHAT_SUMMARY_INPUT_TOKENS = 6000  # 每次摘要请求最多带入的历史消息 token 数，更早的消息分段逐次合并
+AI_CHAT_SUMMARY_MAX_TOKENS = 800  # 摘要的最大输出 token 数
+AI_CHAT_COMPACT_WORKERS = 1  # 每个进程生成摘要的后台线程数
+
+# AI 调用指标（连接耗时、首字耗时、输出速度、失败原因，按提供商 / 模型统计）
+AI_METRICS_FLUSH_INTERVAL = 60  # 各进程把内存中已结束的分钟汇总写入数据库的间隔（秒），进程退出时另写入全部汇总
+AI_METRICS_RETENTION_HOURS = 7 * 24  # 数据库中保留的统计时长（小时）
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
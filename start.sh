@@ -17,5 +17,10 @@ python init_admin.py
 # 这样做是 Docker 推荐的最佳实践，可以正确地处理信号
 # --bind 0.0.0.0:11800 表示监听所有网络接口的11800端口
 # o_doc.wsgi 是你的项目的 WSGI 应用程序入口
+# SERVER_MODE=asgi 时改用 Uvicorn 启动 ASGI 应用（o_doc.asgi），AI 对话流运行在事件循环上，
+# 少量进程即可同时维持大量对话，不会因长时间对话占满 worker；WEB_WORKERS 为进程数
 echo "开始启动服务..."
+if [ "$SERVER_MODE" = "asgi" ]; then
+    exec uvicorn o_doc.asgi:application --host 0.0.0.0 --port 11800 --workers "${WEB_WORKERS:-2}"
+fi
 exec gunicorn --bind 0.0.0.0:11800 o_doc.wsgi:application
\ No newline at end of file
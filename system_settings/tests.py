@@ -1,3 +1,71 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from ai_assistant.ai_config import AIConfigError, get_default_model, invalidate_ai_config_cache
+from ai_assistant.provider_client import get_provider_client
+from .models import AIModel, AIProvider
+
+
+@override_settings(AI_CONFIG_CACHE_TTL=3600)
+class AIConfigInvalidationTests(TestCase):
+    """通过接口修改配置、模型与提供商后，当前进程立即读到新配置，无需等待缓存过期"""
+
+    def setUp(self):
+        invalidate_ai_config_cache()
+        self.addCleanup(invalidate_ai_config_cache)
+        self.provider = AIProvider.objects.create(name='mock', type='OpenAi', base_url='http://old.test/v1')
+        self.chat_model = AIModel.objects.create(provider=self.provider, name='chat-a', type='chat')
+        self.other_model = AIModel.objects.create(provider=self.provider, name='chat-b', type='chat')
+        self.save_config(self.chat_model.id)
+
+    def save_config(self, chat_model_id):
+        response = self.client.post('/api/settings/config/save_ai_config/', {
+            'defaultChatModelId': chat_model_id, 'defaultEmbeddingModelId': '', 'defaultRerankModelId': ''
+        }, content_type='application/json')
+        self.assertEqual(response.json()['code'], 200)
+
+    def default_chat_model(self):
+        return get_default_model('default_chat_model_id', '对话')
+
+    def test_change_default_model(self):
+        self.assertEqual(self.default_chat_model().name, 'chat-a')
+        self.save_config(self.other_model.id)
+        self.assertEqual(self.default_chat_model().name, 'chat-b')
+
+    def test_update_and_delete_model(self):
+        self.assertEqual(self.default_chat_model().name, 'chat-a')
+        response = self.client.put(f'/api/settings/models/{self.chat_model.id}/', {
+            'name': 'chat-a2', 'type': 'chat', 'provider': self.provider.id
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.default_chat_model().name, 'chat-a2')
+
+        self.client.delete(f'/api/settings/models/{self.chat_model.id}/')
+        with self.assertRaises(AIConfigError):
+            self.default_chat_model()
+
+    def test_create_model(self):
+        """新建的模型设为默认后立即可用"""
+        self.assertEqual(self.default_chat_model().name, 'chat-a')
+        response = self.client.post('/api/settings/models/', {
+            'name': 'chat-c', 'type': 'chat', 'provider': self.provider.id
+        }, content_type='application/json')
+        self.save_config(response.json()['data']['id'])
+        self.assertEqual(self.default_chat_model().name, 'chat-c')
+
+    def test_update_and_delete_provider(self):
+        """修改提供商后默认模型带上新的地址，已创建的客户端被关闭并按新配置重建"""
+        provider = self.default_chat_model().provider
+        client = get_provider_client(provider)
+        self.assertIs(get_provider_client(provider), client)
+
+        response = self.client.put(f'/api/settings/providers/{self.provider.id}/', {
+            'name': 'mock', 'type': 'OpenAi', 'base_url': 'http://new.test/v1', 'api_key': 'key'
+        }, content_type='application/json')
+        self.assertEqual(response.json()['code'], 200)
+        provider = self.default_chat_model().provider
+        self.assertEqual((provider.base_url, provider.api_key), ('http://new.test/v1', 'key'))
+        self.assertIsNot(get_provider_client(provider), client)
+
+        self.client.delete(f'/api/settings/providers/{self.provider.id}/')
+        with self.assertRaises(AIConfigError):
+            self.default_chat_model()
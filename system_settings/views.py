@@ -1,7 +1,12 @@
+from django.conf import settings
 from rest_framework import viewsets
 from rest_framework.decorators import action
 
-from utils.response_utils import success_result
+from ai_assistant.ai_config import invalidate_ai_config_cache
+from ai_assistant.metrics import summarize_call_metrics
+from ai_assistant.provider_client import invalidate_provider_client
+from utils.error_codes import ErrorCode
+from utils.response_utils import error_result, success_result
 from .models import AIProvider, AIModel, SystemSetting
 from .serializers import AIProviderSerializer, AIModelSerializer
 
@@ -44,6 +49,22 @@ class AIProviderViewSet(viewsets.ModelViewSet):
         self.perform_destroy(instance)
         return success_result()
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_ai_config_cache()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # 地址 / 密钥可能已修改，重建当前进程的连接（其他进程在下次使用时按配置变化自动重建）
+        invalidate_provider_client(serializer.instance.id)
+        invalidate_ai_config_cache()
+
+    def perform_destroy(self, instance):
+        provider_id = instance.id
+        super().perform_destroy(instance)
+        invalidate_provider_client(provider_id)
+        invalidate_ai_config_cache()
+
 
 class AIModelViewSet(viewsets.ModelViewSet):
     queryset = AIModel.objects.all()
@@ -60,6 +81,19 @@ class AIModelViewSet(viewsets.ModelViewSet):
         self.perform_destroy(instance)
         return success_result()
 
+    # 模型变更后清空当前进程的 AI 配置缓存（其他进程最多 AI_CONFIG_CACHE_TTL 秒后过期）
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_ai_config_cache()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_ai_config_cache()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        invalidate_ai_config_cache()
+
 
 class SystemConfigViewSet(viewsets.ViewSet):
     """
@@ -87,4 +121,15 @@ class SystemConfigViewSet(viewsets.ViewSet):
             key='system_ai_config',
             defaults={'value': data}
         )
+        invalidate_ai_config_cache()
         return success_result()
+
+    @action(detail=False, methods=['get'])
+    def ai_metrics(self, request):
+        # AI 调用指标（设置页对比各提供商 / 模型），minutes 为统计最近多少分钟，不超过保留期
+        try:
+            minutes = int(request.query_params.get('minutes', 60))
+        except ValueError:
+            return error_result(error=ErrorCode.PARAM_INVALID)
+        minutes = min(max(minutes, 1), settings.AI_METRICS_RETENTION_HOURS * 60)
+        return success_result({'minutes': minutes, 'items': summarize_call_metrics(minutes)})
@@ -0,0 +1,11 @@
+"""
+测试配置：python manage.py test --settings=test.settings assets ai_assistant
+仓库未提交各应用的迁移文件，测试数据库按当前模型直接建表
+"""
+from o_doc.settings import *  # noqa: F401,F403
+
+MIGRATION_MODULES = {
+    app: None
+    for app in ('article', 'anthology', 'tags', 'categories', 'user', 'stats', 'assets', 'system_settings',
+                'ai_assistant')
+}
@@ -22,6 +22,13 @@ class ErrorCode(Enum):
     RESOURCE_EXISTED = (409, '资源已存在')
     UPLOAD_RESOURCE_NOT_FOUND = (410, '上传文件不存在')
     UPLOAD_RESOURCE_MORE_THAN_MAX_SIZE = (411, '文件大小超过50MB限制')
+    UPLOAD_RESOURCE_MORE_THAN_CHUNKED_MAX_SIZE = (412, '文件大小超过分片上传限制')
+    UPLOAD_SESSION_NOT_FOUND = (413, '上传会话不存在或已结束')
+    UPLOAD_CHUNK_SIZE_MISMATCH = (414, '分片大小与会话不一致')
+    UPLOAD_CHUNK_CHECKSUM_MISMATCH = (415, '分片校验失败，请重新上传该分片')
+    UPLOAD_INCOMPLETE = (416, '仍有分片未上传')
+    UPLOAD_TOO_MANY_FILES = (417, '单次上传的文件数量超过限制')
+    UPLOAD_CONTENT_BUSY = (418, '相同内容正在清理，请稍后重试')
 
     # 系统错误
     SYSTEM_ERROR = (500, '系统异常')
@@ -66,4 +66,22 @@ def generate_model_id() -> str:
     生成带 mod 前缀的模型ID
     :return: 带 mod 前缀的唯一ID字符串
     """
-    return generate_unique_id("mod")
\ No newline at end of file
+    return generate_unique_id("mod")
+
+
+# 为分片上传会话生成带 upl 前缀的 ID
+def generate_upload_id() -> str:
+    """
+    生成带 upl 前缀的上传会话ID
+    :return: 带 upl 前缀的唯一ID字符串
+    """
+    return generate_unique_id("upl")
+
+
+# 为 AI 对话会话生成带 conv 前缀的 ID
+def generate_conversation_id() -> str:
+    """
+    生成带 conv 前缀的会话ID
+    :return: 带 conv 前缀的唯一ID字符串
+    """
+    return generate_unique_id("conv")
@@ -0,0 +1,32 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from djangorestframework_camel_case.settings import api_settings
+from djangorestframework_camel_case.util import underscoreize
+
+
+class CamelCaseMiddleware:
+    """
+    查询参数驼峰转下划线（替代 djangorestframework_camel_case 的 CamelCaseMiddleWare）
+    原中间件只支持同步调用，ASGI 模式下 Django 会把它放进同一个线程执行，
+    一个进程内的全部请求（含异步对话视图）都排队经过该线程；这里同时支持同步与异步调用
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _underscoreize_query(request):
+        request.GET = underscoreize(request.GET, **api_settings.JSON_UNDERSCOREIZE)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self._underscoreize_query(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self._underscoreize_query(request)
+        return await self.get_response(request)